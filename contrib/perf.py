@@ -2711,11 +2711,12 @@ def perfrevlogindex(ui, repo, file_=None, **opts):
         (b'd', b'dist', 100, b'distance between the revisions'),
         (b's', b'startrev', 0, b'revision to start reading at'),
         (b'', b'reverse', False, b'read in reverse'),
+        (b'', b'batch', False, b'read all revisions with revlog.revisions()'),
     ],
     b'-c|-m|FILE',
 )
 def perfrevlogrevisions(
-    ui, repo, file_=None, startrev=0, reverse=False, **opts
+    ui, repo, file_=None, startrev=0, reverse=False, batch=False, **opts
 ):
     """Benchmark reading a series of revisions from a revlog.
 
@@ -2723,17 +2724,29 @@ def perfrevlogrevisions(
     the specified revlog.
 
     The start revision can be defined via ``-s/--startrev``.
+
+    With ``--batch``, the revisions are read with a single call to the batched
+    ``revlog.revisions()`` API instead of one ``revlog.revision()`` call each.
+
+    When the shared cache of decompressed chunks is enabled (see
+    ``storage.revlog.decompressed-cache.size``), its hits and misses during
+    the last run are reported.
     """
     opts = _byteskwargs(opts)
 
     rl = cmdutil.openrevlog(repo, b'perfrevlogrevisions', file_, opts)
     rllen = getlen(ui)(rl)
+    if batch and not safehasattr(rl, 'revisions'):
+        raise error.Abort(b'revlog does not support batched reads')
+    chunkcache = getattr(rl, '_decompressedcache', None)
 
     if startrev < 0:
         startrev = rllen + startrev
 
     def d():
         rl.clearcaches()
+        if chunkcache is not None:
+            chunkcache.hits = chunkcache.misses = 0
 
         beginrev = startrev
         endrev = rllen
@@ -2743,6 +2756,11 @@ def perfrevlogrevisions(
             beginrev, endrev = endrev - 1, beginrev - 1
             dist = -1 * dist
 
+        if batch:
+            for x in rl.revisions(_xrange(beginrev, endrev, dist)):
+                pass
+            return
+
         for x in _xrange(beginrev, endrev, dist):
             # Old revisions don't support passing int.
             n = rl.node(x)
@@ -2752,6 +2770,21 @@ def perfrevlogrevisions(
     timer(d)
     fm.end()
 
+    if chunkcache is not None:
+        stats = chunkcache.stats()
+        ui.statusnoi18n(
+            b'decompressed chunk cache: %d hits, %d misses (%d%%), '
+            b'%d entries, %d/%d bytes\n'
+            % (
+                stats[b'hits'],
+                stats[b'misses'],
+                stats[b'hit-ratio'] * 100,
+                stats[b'entries'],
+                stats[b'size'],
+                stats[b'max-size'],
+            )
+        )
+
 
 @command(
     b'perf--revlogwrite',
@@ -278,24 +278,26 @@ def fix(ui, repo, *pats, **opts):
 
         # There are no data dependencies between the workers fixing each file
         # revision, so we can use all available parallelism.
-        def getfixes(items):
-            for rev, path in items:
-                ctx = repo[rev]
-                olddata = ctx[path].data()
-                metadata, newdata = fixfile(
-                    ui, repo, opts, fixers, ctx, path, basepaths, basectxs[rev]
-                )
-                # Don't waste memory/time passing unchanged content back, but
-                # produce one result per item either way.
-                yield (
-                    rev,
-                    path,
-                    metadata,
-                    newdata if newdata != olddata else None,
-                )
+        def getfix(item):
+            rev, path = item
+            ctx = repo[rev]
+            olddata = ctx[path].data()
+            metadata, newdata = fixfile(
+                ui, repo, opts, fixers, ctx, path, basepaths, basectxs[rev]
+            )
+            # Don't waste memory/time passing unchanged content back, but
+            # produce one result per item either way.
+            return (
+                rev,
+                path,
+                metadata,
+                newdata if newdata != olddata else None,
+            )
 
-        results = worker.worker(
-            ui, 1.0, getfixes, tuple(), workqueue, threadsafe=False
+        # Fixer tools can take very different amounts of time on different
+        # files, results are consumed as soon as they are available.
+        results = worker.imap(
+            ui, getfix, workqueue, ordered=False, threadsafe=False
         )
 
         # We have to hold on to the data for each successor revision in memory
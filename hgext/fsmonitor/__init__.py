@@ -48,6 +48,25 @@ to return results. Defaults to `2.0`.
 
 A list of usernames for which fsmonitor will disable itself altogether.
 
+::
+
+    [fsmonitor]
+    backend = {watchman, inotify}
+
+Which file monitor to use. Defaults to `watchman`. On Linux, `inotify` runs a
+daemon per repository, started as needed, that watches the directories of the
+working copy with inotify instead. It only needs a watch per directory, see
+the `fs.inotify.max_user_watches` sysctl.
+
+::
+
+    [fsmonitor]
+    inotify-idle-timeout = (integer)
+
+The number of seconds after which the inotify daemon of a repository exits if
+no command used it. `0` keeps it running until the repository is removed.
+Defaults to `3600`.
+
 ::
 
     [fsmonitor]
@@ -139,6 +158,7 @@ from mercurial.utils import (
 )
 
 from . import (
+    inotify,
     pywatchman,
     state,
     watchmanclient,
@@ -150,6 +170,9 @@ from . import (
 # leave the attribute unspecified.
 testedwith = b'ships-with-hg-core'
 
+cmdtable = {}
+command = registrar.command(cmdtable)
+
 configtable = {}
 configitem = registrar.configitem(configtable)
 
@@ -158,6 +181,16 @@ configitem(
     b'mode',
     default=b'on',
 )
+configitem(
+    b'fsmonitor',
+    b'backend',
+    default=b'watchman',
+)
+configitem(
+    b'fsmonitor',
+    b'inotify-idle-timeout',
+    default=3600,
+)
 configitem(
     b'fsmonitor',
     b'walk_on_invalidate',
@@ -222,6 +255,36 @@ def debuginstall(ui, fm):
     return 1 if err else 0
 
 
+@command(
+    b'debuginotify',
+    [(b'', b'stop', None, _(b'stop the inotify daemon of the repository'))],
+    b'[--stop]',
+)
+def debuginotify(ui, repo, **opts):
+    """watch the working copy with inotify for fsmonitor
+
+    Runs the daemon watching the working copy when
+    ``fsmonitor.backend=inotify``, until it is idle for
+    ``fsmonitor.inotify-idle-timeout`` seconds. fsmonitor starts it in the
+    background as needed.
+
+    Returns 0 on success, 1 if a daemon is already running or, with --stop,
+    if none was running.
+    """
+    if not inotify.available():
+        raise error.Abort(_(b'inotify is not supported on this platform'))
+    if opts.get('stop'):
+        client = inotify.client(ui, repo.root)
+        if not client.stop():
+            ui.status(_(b'no inotify daemon is running\n'))
+            return 1
+        return 0
+    if not inotify.rundaemon(ui, repo.root):
+        ui.status(_(b'an inotify daemon is already running\n'))
+        return 1
+    return 0
+
+
 def _handleunavailable(ui, state, ex):
     """Exception handler for Watchman interaction exceptions"""
     if isinstance(ex, watchmanclient.Unavailable):
@@ -285,6 +348,46 @@ def _watchmantofsencoding(path):
     return encoded
 
 
+def _localname(fname):
+    """return the local path of a file name given by Watchman"""
+    # Watchman always give us a str. Normalize to bytes on Python 3
+    # using Watchman's encoding, if needed.
+    if not isinstance(fname, bytes):
+        fname = fname.encode(_watchmanencoding)
+
+    if _fixencoding:
+        fname = _watchmantofsencoding(fname)
+
+    if pycompat.ossep == b'\\':
+        fname = fname.replace(b'\\', b'/')
+    return fname
+
+
+def _querychanges(client, state, clock):
+    """query Watchman for the files changed since clock"""
+    # Use the user-configured timeout for the query.
+    # Add a little slack over the top of the user query to allow for
+    # overheads while transferring the data
+    client.settimeout(state.timeout + 0.1)
+    return client.command(
+        b'query',
+        {
+            b'fields': [b'mode', b'mtime', b'size', b'exists', b'name'],
+            b'since': clock,
+            b'expression': [
+                b'not',
+                [
+                    b'anyof',
+                    [b'dirname', b'.hg'],
+                    [b'name', b'.hg', b'wholename'],
+                ],
+            ],
+            b'sync_timeout': int(state.timeout * 1000),
+            b'empty_on_fresh_instance': state.walk_on_invalidate,
+        },
+    )
+
+
 def overridewalk(orig, self, match, subrepos, unknown, ignored, full=True):
     """Replacement for dirstate.walk, hooking into Watchman.
 
@@ -374,27 +477,7 @@ def overridewalk(orig, self, match, subrepos, unknown, ignored, full=True):
 
     # step 2: query Watchman
     try:
-        # Use the user-configured timeout for the query.
-        # Add a little slack over the top of the user query to allow for
-        # overheads while transferring the data
-        self._watchmanclient.settimeout(state.timeout + 0.1)
-        result = self._watchmanclient.command(
-            b'query',
-            {
-                b'fields': [b'mode', b'mtime', b'size', b'exists', b'name'],
-                b'since': clock,
-                b'expression': [
-                    b'not',
-                    [
-                        b'anyof',
-                        [b'dirname', b'.hg'],
-                        [b'name', b'.hg', b'wholename'],
-                    ],
-                ],
-                b'sync_timeout': int(state.timeout * 1000),
-                b'empty_on_fresh_instance': state.walk_on_invalidate,
-            },
-        )
+        result = _querychanges(self._watchmanclient, state, clock)
     except Exception as ex:
         _handleunavailable(self._ui, state, ex)
         self._watchmanclient.clearconnection()
@@ -416,7 +499,6 @@ def overridewalk(orig, self, match, subrepos, unknown, ignored, full=True):
     if normalize:
         foldmap = {normcase(k): k for k in results}
 
-    switch_slashes = pycompat.ossep == b'\\'
     # The order of the results is, strictly speaking, undefined.
     # For case changes on a case insensitive filesystem we may receive
     # two entries, one with exists=True and another with exists=False.
@@ -425,18 +507,7 @@ def overridewalk(orig, self, match, subrepos, unknown, ignored, full=True):
     # Watchman tracks files.  We use this property to reconcile deletes
     # for name case changes.
     for entry in result[b'files']:
-        fname = entry[b'name']
-
-        # Watchman always give us a str. Normalize to bytes on Python 3
-        # using Watchman's encoding, if needed.
-        if not isinstance(fname, bytes):
-            fname = fname.encode(_watchmanencoding)
-
-        if _fixencoding:
-            fname = _watchmantofsencoding(fname)
-
-        if switch_slashes:
-            fname = fname.replace(b'\\', b'/')
+        fname = _localname(entry[b'name'])
         if normalize:
             normed = normcase(fname)
             fname = normalize(fname, True, True)
@@ -630,13 +701,29 @@ def overridestatus(
     else:
         stateunknown = listunknown
 
-    if updatestate:
-        ps = poststatus(startclock)
-        self.addpostdsstatus(ps)
+    r = None
+    if (
+        updatestate
+        and not listignored
+        and not listclean
+        and match.traversedir is None
+    ):
+        r = _cachedstatus(orig, self, node1, node2, startclock)
 
-    r = orig(
-        node1, node2, match, listignored, listclean, stateunknown, listsubrepos
-    )
+    if r is None:
+        if updatestate:
+            ps = poststatus(startclock)
+            self.addpostdsstatus(ps)
+
+        r = orig(
+            node1,
+            node2,
+            match,
+            listignored,
+            listclean,
+            stateunknown,
+            listsubrepos,
+        )
     modified, added, removed, deleted, unknown, ignored, clean = r
 
     if not listunknown:
@@ -682,13 +769,109 @@ def overridestatus(
     )
 
 
+# status of the files recorded in the fsmonitor state, in the order of
+# scmutil.status
+_statuscodes = (b'M', b'A', b'R', b'!', b'?')
+
+
+def _dirstateidentity(identity):
+    """serialize the util.filestat identity of the dirstate file"""
+    st = identity.stat
+    if st is None:
+        return b''
+    return b'%d:%d:%d' % (st.st_size, st[stat.ST_CTIME], st[stat.ST_MTIME])
+
+
+def _mergestatus(cached, changed, status):
+    """return the status of the whole working copy
+
+    cached maps the files that were not clean to their status code, changed
+    lists the files changed since and status is their current status.
+    """
+    files = dict(cached)
+    for f in changed:
+        files.pop(f, None)
+    for code, fs in zip(_statuscodes, status):
+        for f in fs:
+            files[f] = code
+    lists = {code: [] for code in _statuscodes}
+    for f, code in sorted(pycompat.iteritems(files)):
+        lists[code].append(f)
+    return scmutil.status(*([lists[c] for c in _statuscodes] + [[], []]))
+
+
+def _cachedstatus(orig, repo, node1, node2, startclock):
+    """compute the status of the working copy from the one recorded by the
+    last status and the files Watchman reports as changed since
+
+    Only the changed files are looked at, instead of every file of the
+    dirstate. Returns None if the recorded status cannot be used.
+    """
+    state = repo._fsmonitorstate
+    dirstate = repo.dirstate
+    clock, ignorehash, identity, cached = state.getstatus()
+    if cached is None or dirstate._dirty or dirstate._checkcase:
+        return None
+    if any(code not in _statuscodes for code in pycompat.itervalues(cached)):
+        return None
+    if _dirstateidentity(dirstate.identity()) != identity:
+        return None
+    if _hashignore(dirstate._ignore) != ignorehash:
+        return None
+
+    try:
+        result = _querychanges(repo._watchmanclient, state, clock)
+    except Exception as ex:
+        _handleunavailable(repo.ui, state, ex)
+        repo._watchmanclient.clearconnection()
+        return None
+    if result[b'is_fresh_instance']:
+        return None
+    state.setlastclock(pycompat.sysbytes(result[b'clock']))
+
+    changed = set()
+    for entry in result[b'files']:
+        fname = _localname(entry[b'name'])
+        if b'/.hg/' in fname or fname.endswith(b'/.hg'):
+            return None
+        # the files of a directory are reported one by one, the directory
+        # itself only matters if it replaced a tracked file
+        if (
+            entry[b'exists']
+            and stat.S_IFMT(entry[b'mode']) == stat.S_IFDIR
+            and fname not in dirstate
+        ):
+            continue
+        changed.add(fname)
+    changed = sorted(changed)
+    repo.ui.debug(
+        b'fsmonitor: %d files changed since the last status\n' % len(changed)
+    )
+
+    repo.addpostdsstatus(poststatus(startclock, cached, changed))
+    match = matchmod.exact(changed, badfn=lambda f, msg: None)
+    r = orig(node1, node2, match, False, False, True, False)
+    return _mergestatus(cached, changed, r)
+
+
 class poststatus(object):
-    def __init__(self, startclock):
+    """record the state of the working copy after a status
+
+    With cached and changed, the status only covers the changed files and is
+    merged with the cached status of the other files, see _mergestatus().
+    """
+
+    def __init__(self, startclock, cached=None, changed=None):
         self._startclock = pycompat.sysbytes(startclock)
+        self._cached = cached
+        self._changed = changed
 
     def __call__(self, wctx, status):
-        clock = wctx.repo()._fsmonitorstate.getlastclock() or self._startclock
-        hashignore = _hashignore(wctx.repo().dirstate._ignore)
+        repo = wctx.repo()
+        clock = repo._fsmonitorstate.getlastclock() or self._startclock
+        hashignore = _hashignore(repo.dirstate._ignore)
+        if self._cached is not None:
+            status = _mergestatus(self._cached, self._changed, status)
         notefiles = (
             status.modified
             + status.added
@@ -696,7 +879,19 @@ class poststatus(object):
             + status.deleted
             + status.unknown
         )
-        wctx.repo()._fsmonitorstate.set(clock, hashignore, notefiles)
+        identity = files = None
+        # The status is only valid for the dirstate on disk if all changes
+        # to the dirstate were written out, which is done before calling
+        # this.
+        if not repo.dirstate._dirty and repo.currenttransaction() is None:
+            identity = _dirstateidentity(
+                util.filestat.frompath(repo.vfs.join(b'dirstate'))
+            )
+            files = {}
+            for code, fs in zip(_statuscodes, status):
+                for f in fs:
+                    files[f] = code
+        repo._fsmonitorstate.set(clock, hashignore, notefiles, identity, files)
 
 
 def makedirstate(repo, dirstate):
@@ -947,7 +1142,10 @@ def reposetup(ui, repo):
             return
 
         try:
-            client = watchmanclient.client(repo.ui, repo.root)
+            if ui.config(b'fsmonitor', b'backend') == b'inotify':
+                client = inotify.client(repo.ui, repo.root)
+            else:
+                client = watchmanclient.client(repo.ui, repo.root)
         except Exception as ex:
             _handleunavailable(ui, fsmonitorstate, ex)
             return
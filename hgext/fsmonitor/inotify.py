@@ -0,0 +1,611 @@
+# inotify.py - inotify based file monitor for the fsmonitor extension
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+"""watch the working copy with Linux inotify instead of Watchman
+
+A daemon process per repository watches every directory of the working copy
+and keeps a journal of the paths changed in them. Each path is recorded with
+the sequence number of the batch of events it was seen in, and clocks are
+`c:<instance>:<sequence number>`, so the files changed since a clock are the
+paths of the journal with a higher sequence number.
+
+The daemon is started by the first command needing it and listens on the
+`.hg/fsmonitor-inotify.sock` unix socket. It exits after being idle for
+`fsmonitor.inotify-idle-timeout` seconds, or when the working copy is removed.
+
+Before answering a query, the daemon creates a cookie file in `.hg` and waits
+for its event, so every change made before the query was issued is in the
+journal. The journal is reset, with a new instance, when the kernel queue of
+events overflows or when it grows over `_maxjournal` paths. The clocks given
+by another instance are answered as fresh instances, which make fsmonitor
+walk the whole working copy.
+
+The protocol is one request per connection. The client sends a line, the
+daemon answers with a line starting with `ok` or `error`:
+
+* `clock` is answered with `ok <clock>`
+* `query <clock> <sync timeout in ms>` is answered with `ok <clock> <fresh>`,
+  followed by the changed paths, each terminated by a NUL byte
+* `stop` is answered with `ok` before the daemon exits
+"""
+
+from __future__ import absolute_import
+
+import ctypes
+import errno
+import os
+import select
+import socket
+import stat
+import struct
+import time
+
+from mercurial.i18n import _
+from mercurial.node import hex
+from mercurial import (
+    encoding,
+    pycompat,
+    util,
+)
+from mercurial.utils import procutil
+
+from .watchmanclient import Unavailable
+
+SOCKNAME = b'fsmonitor-inotify.sock'
+LOCKNAME = b'fsmonitor-inotify.lock'
+PIDNAME = b'fsmonitor-inotify.pid'
+COOKIEPREFIX = b'fsmonitor-inotify-cookie-'
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = getattr(os, 'O_NONBLOCK', 0o4000)
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+_dirmask = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+# only the cookies are looked for in .hg
+_hgmask = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+# struct inotify_event, followed by the name
+_event = struct.Struct(b'iIII')
+
+# the journal is reset when it holds more paths
+_maxjournal = 1000000
+
+_libc = None
+
+
+def _inotify():
+    """return the libc handle giving access to inotify, or None"""
+    global _libc
+    if _libc is None:
+        _libc = False
+        if pycompat.sysplatform.startswith(b'linux'):
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [
+                    ctypes.c_int,
+                    ctypes.c_char_p,
+                    ctypes.c_uint32,
+                ]
+                libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+                _libc = libc
+            except (OSError, AttributeError):
+                pass
+    return _libc or None
+
+
+def available():
+    return _inotify() is not None
+
+
+def _sockname(path, fn):
+    """call fn with a name of the unix socket at path
+
+    Socket addresses are limited to about 100 bytes, so the directory of the
+    socket is reached through /proc/self/fd instead.
+    """
+    dirname, basename = os.path.split(path)
+    fd = os.open(dirname, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    try:
+        return fn(b'/proc/self/fd/%d/%s' % (fd, basename))
+    finally:
+        os.close(fd)
+
+
+class watcher(object):
+    """watch the directories of a working copy and journal the paths changing
+    in them"""
+
+    def __init__(self, root):
+        libc = _inotify()
+        self._libc = libc
+        self._root = root
+        self._hgdir = os.path.join(root, b'.hg')
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        # watch descriptor -> directory, relative to the root
+        self._wds = {}
+        self._dirwds = {}
+        # directory -> names of its entries
+        self._children = {}
+        self._hgwd = None
+        self._cookies = set()
+        self._cookieseq = 0
+        self.error = None
+        self.stopped = False
+        self._reset()
+
+    def _reset(self):
+        """forget everything and watch the working copy again"""
+        for wd in list(self._wds):
+            self._libc.inotify_rm_watch(self.fd, wd)
+        self._wds.clear()
+        self._dirwds.clear()
+        self._children.clear()
+        self.instance = hex(os.urandom(8))
+        self.seq = 1
+        self.journal = {}
+        self.error = None
+        self._hgwd = self._addwatch(self._hgdir, _hgmask)
+        self._crawl(b'', False)
+
+    @property
+    def clock(self):
+        return b'c:%s:%d' % (self.instance, self.seq)
+
+    def _addwatch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                self.error = _(
+                    b'too many directories to watch, '
+                    b'see fs.inotify.max_user_watches'
+                )
+            return None
+        return wd
+
+    def _changed(self, path):
+        self.journal[path] = self.seq
+
+    def _crawl(self, path, record):
+        """watch the directory at path and its subdirectories
+
+        With record, every path found is journaled as changed.
+        """
+        stack = [path]
+        while stack and self.error is None:
+            dirpath = stack.pop()
+            fullpath = os.path.join(self._root, dirpath)
+            wd = self._addwatch(fullpath, _dirmask)
+            if wd is None:
+                continue
+            self._wds[wd] = dirpath
+            self._dirwds[dirpath] = wd
+            try:
+                entries = util.listdir(fullpath)
+            except OSError:
+                continue
+            names = set()
+            for name, kind in entries:
+                if name == b'.hg' and not dirpath:
+                    continue
+                names.add(name)
+                child = dirpath + b'/' + name if dirpath else name
+                if record:
+                    self._changed(child)
+                # nested repositories are reported, not watched
+                if kind == stat.S_IFDIR and name != b'.hg':
+                    stack.append(child)
+            self._children[dirpath] = names
+
+    def _forget(self, path):
+        """stop watching the directory at path, which moved away, and journal
+        the paths it contained"""
+        stack = [path]
+        while stack:
+            dirpath = stack.pop()
+            wd = self._dirwds.pop(dirpath, None)
+            if wd is not None:
+                self._wds.pop(wd, None)
+                self._libc.inotify_rm_watch(self.fd, wd)
+            for name in self._children.pop(dirpath, ()):
+                child = dirpath + b'/' + name
+                self._changed(child)
+                if child in self._children:
+                    stack.append(child)
+
+    def read(self):
+        """read and process the pending events"""
+        while not self.stopped:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as inst:
+                if inst.errno == errno.EINTR:
+                    continue
+                if inst.errno != errno.EAGAIN:
+                    raise
+                break
+            if not data:
+                break
+            self._process(data)
+        if len(self.journal) > _maxjournal:
+            self._reset()
+
+    def _process(self, data):
+        self.seq += 1
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, size = _event.unpack_from(data, offset)
+            offset += _event.size
+            name = data[offset : offset + size].rstrip(b'\0')
+            offset += size
+            if mask & IN_Q_OVERFLOW:
+                self._reset()
+                return
+            if wd == self._hgwd:
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    self.stopped = True
+                elif name.startswith(COOKIEPREFIX):
+                    self._cookies.add(name)
+                continue
+            dirpath = self._wds.get(wd)
+            if dirpath is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._wds[wd]
+                if self._dirwds.get(dirpath) == wd:
+                    del self._dirwds[dirpath]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # the parent directory reports it, unless it is the root
+                if not dirpath:
+                    self.stopped = True
+                continue
+            if name == b'.hg' and not dirpath:
+                continue
+            path = dirpath + b'/' + name if dirpath else name
+            self._changed(path)
+            children = self._children.get(dirpath)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if children is not None:
+                    children.add(name)
+                if mask & IN_ISDIR and name != b'.hg':
+                    self._crawl(path, True)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                if children is not None:
+                    children.discard(name)
+                if mask & IN_ISDIR:
+                    self._forget(path)
+
+    def sync(self, timeout):
+        """wait until the events of the changes made so far are processed
+
+        Returns False if that took longer than timeout seconds.
+        """
+        self._cookieseq += 1
+        name = b'%s%d-%d' % (COOKIEPREFIX, os.getpid(), self._cookieseq)
+        path = os.path.join(self._hgdir, name)
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        deadline = util.timer() + timeout
+        try:
+            while name not in self._cookies and not self.stopped:
+                remaining = deadline - util.timer()
+                if remaining <= 0:
+                    return False
+                if select.select([self.fd], [], [], remaining)[0]:
+                    self.read()
+            return True
+        finally:
+            self._cookies.discard(name)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def changedsince(self, clock):
+        """return (fresh, paths changed since clock)"""
+        parts = clock.split(b':')
+        if len(parts) != 3 or parts[1] != self.instance:
+            return True, []
+        try:
+            seq = int(parts[2])
+        except ValueError:
+            return True, []
+        if seq > self.seq:
+            return True, []
+        return False, [
+            p for p, s in pycompat.iteritems(self.journal) if s > seq
+        ]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class server(object):
+    """answer the requests of the clients of a working copy"""
+
+    def __init__(self, ui, root, watcher):
+        self._ui = ui
+        self._watcher = watcher
+        self._sockpath = os.path.join(root, b'.hg', SOCKNAME)
+        self._idletimeout = ui.configint(b'fsmonitor', b'inotify-idle-timeout')
+        self._stopped = False
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        util.tryunlink(self._sockpath)
+        _sockname(self._sockpath, sock.bind)
+        sock.listen(socket.SOMAXCONN)
+        return sock
+
+    def serve(self):
+        watcher = self._watcher
+        sock = self._listen()
+        try:
+            lastrequest = util.timer()
+            while not (self._stopped or watcher.stopped):
+                timeout = None
+                if self._idletimeout > 0:
+                    timeout = lastrequest + self._idletimeout - util.timer()
+                    if timeout <= 0:
+                        break
+                try:
+                    ready = select.select([watcher.fd, sock], [], [], timeout)
+                except select.error as inst:
+                    if inst.args[0] == errno.EINTR:
+                        continue
+                    raise
+                ready = ready[0]
+                if watcher.fd in ready:
+                    watcher.read()
+                if sock in ready:
+                    conn = sock.accept()[0]
+                    try:
+                        self._handle(conn)
+                    except (IOError, OSError, socket.error):
+                        pass
+                    finally:
+                        conn.close()
+                    lastrequest = util.timer()
+        finally:
+            sock.close()
+            util.tryunlink(self._sockpath)
+
+    def _handle(self, conn):
+        conn.settimeout(10)
+        line = b''
+        while not line.endswith(b'\n'):
+            data = conn.recv(4096)
+            if not data:
+                return
+            line += data
+        args = line.split()
+        watcher = self._watcher
+        if not args:
+            reply = b'error empty request\n'
+        elif args[0] == b'stop':
+            self._stopped = True
+            reply = b'ok\n'
+        elif watcher.error is not None:
+            reply = b'error %s\n' % watcher.error
+        elif args[0] == b'clock':
+            reply = b'ok %s\n' % watcher.clock
+        elif args[0] == b'query' and len(args) == 3:
+            if not watcher.sync(int(args[2]) / 1000.0):
+                reply = b'error timed out waiting for response\n'
+            else:
+                clock = watcher.clock
+                fresh, paths = watcher.changedsince(args[1])
+                reply = b'ok %s %d\n' % (clock, fresh)
+                reply += b''.join(p + b'\0' for p in paths)
+        else:
+            reply = b'error unknown request\n'
+        conn.sendall(reply)
+
+
+def rundaemon(ui, root):
+    """watch the working copy at root until idle
+
+    Returns False if another daemon is already watching it.
+    """
+    import fcntl
+
+    hgdir = os.path.join(root, b'.hg')
+    lockfd = os.open(
+        os.path.join(hgdir, LOCKNAME), os.O_CREAT | os.O_RDWR, 0o600
+    )
+    try:
+        try:
+            fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as inst:
+            if inst.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        pidpath = os.path.join(hgdir, PIDNAME)
+        util.writefile(pidpath, b'%d\n' % os.getpid())
+        w = watcher(root)
+        try:
+            server(ui, root, w).serve()
+        finally:
+            w.close()
+            util.tryunlink(pidpath)
+        return True
+    finally:
+        os.close(lockfd)
+
+
+class _entry(object):
+    """a changed file, looking both like the entries of Watchman queries and
+    like the result of lstat"""
+
+    __slots__ = ('_name', '_st')
+
+    def __init__(self, name, st):
+        self._name = name
+        self._st = st
+
+    def __getitem__(self, key):
+        if key == b'name':
+            return self._name
+        elif key == b'exists':
+            return self._st is not None
+        elif key == b'mode':
+            return self._st.st_mode if self._st is not None else 0
+        return self._st[key]
+
+    def __getattr__(self, name):
+        return getattr(self._st, name)
+
+
+class client(object):
+    """talk to the inotify daemon of a working copy, starting it if needed
+
+    This mimics the interface of watchmanclient.client.
+    """
+
+    def __init__(self, ui, root, timeout=1.0):
+        if not available():
+            raise Unavailable(b'inotify is not supported on this platform')
+        self._ui = ui
+        self._root = root
+        self._timeout = timeout
+        self._sockpath = os.path.join(root, b'.hg', SOCKNAME)
+        self._started = False
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def clearconnection(self):
+        pass
+
+    def available(self):
+        return True
+
+    def _startdaemon(self):
+        self._started = True
+        cmd = procutil.hgcmd() + [b'-R', self._root, b'debuginotify']
+        self._ui.debug(b'fsmonitor: starting the inotify daemon\n')
+        try:
+            procutil.runbgcommand(cmd, encoding.environ)
+        except OSError as inst:
+            raise Unavailable(b'cannot start the inotify daemon: %s' % inst)
+
+    def _connect(self, start=True):
+        deadline = util.timer() + self._timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                _sockname(self._sockpath, sock.connect)
+                return sock
+            except (IOError, OSError, socket.error) as inst:
+                sock.close()
+                if inst.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                    raise Unavailable(encoding.strtolocal(str(inst)))
+                if not start:
+                    return None
+            if not self._started:
+                self._startdaemon()
+            if util.timer() >= deadline:
+                raise Unavailable(
+                    b'timed out waiting for the inotify daemon', warn=False
+                )
+            # the daemon is busy watching the working copy
+            time.sleep(0.05)
+
+    def _request(self, request, start=True):
+        sock = self._connect(start)
+        if sock is None:
+            return None
+        try:
+            sock.settimeout(self._timeout)
+            sock.sendall(request + b'\n')
+            chunks = []
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                chunks.append(data)
+        except socket.timeout:
+            raise Unavailable(b'timed out waiting for response')
+        except (IOError, OSError, socket.error) as inst:
+            raise Unavailable(encoding.strtolocal(str(inst)))
+        finally:
+            sock.close()
+        data = b''.join(chunks)
+        header, sep, data = data.partition(b'\n')
+        if not sep:
+            raise Unavailable(b'truncated response from the inotify daemon')
+        header = header.split(b' ', 1)
+        if header[0] != b'ok':
+            raise Unavailable(header[1] if len(header) > 1 else b'error')
+        return header[1:], data
+
+    def stop(self):
+        """stop the daemon, return False if it was not running"""
+        return self._request(b'stop', start=False) is not None
+
+    def getcurrentclock(self):
+        return self._request(b'clock')[0][0]
+
+    def command(self, *args):
+        if args[0] == b'query':
+            query = args[1]
+            header, data = self._request(
+                b'query %s %d' % (query[b'since'], query[b'sync_timeout'])
+            )
+            clock, fresh = header[0].split(b' ')
+            if fresh != b'0':
+                # the daemon cannot list the whole working copy
+                raise Unavailable(b'fresh instance', warn=False)
+            files = []
+            for name in data.split(b'\0')[:-1]:
+                try:
+                    st = os.lstat(os.path.join(self._root, name))
+                except OSError:
+                    st = None
+                files.append(_entry(name, st))
+            return {
+                b'clock': clock,
+                b'is_fresh_instance': False,
+                b'files': files,
+            }
+        elif args[0] == b'clock':
+            return {b'clock': self.getcurrentclock()}
+        elif args[0] in (b'watch', b'state-enter', b'state-leave'):
+            return {}
+        raise Unavailable(b'unsupported command: %s' % args[0])
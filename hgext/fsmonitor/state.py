@@ -19,7 +19,7 @@ from mercurial import (
     util,
 )
 
-_version = 4
+_version = 5
 _versionformat = b">I"
 
 
@@ -38,13 +38,30 @@ class state(object):
         self.timeout = float(self._ui.config(b'fsmonitor', b'timeout'))
 
     def get(self):
+        clock, ignorehash, notefiles, identity, status = self._read()
+        return clock, ignorehash, notefiles
+
+    def getstatus(self):
+        """return the status recorded by the last status of the whole working
+        copy
+
+        Returns (clock, ignorehash, dirstate identity, status) where status
+        maps every file that was not clean to its state, as shown by `hg
+        status`. Everything is None if no status was recorded.
+        """
+        clock, ignorehash, notefiles, identity, status = self._read()
+        if status is None:
+            return None, None, None, None
+        return clock, ignorehash, identity, status
+
+    def _read(self):
         try:
             file = self._vfs(b'fsmonitor.state', b'rb')
         except IOError as inst:
             self._identity = util.filestat(None)
             if inst.errno != errno.ENOENT:
                 raise
-            return None, None, None
+            return None, None, None, None, None
 
         self._identity = util.filestat.fromfp(file)
 
@@ -56,7 +73,7 @@ class state(object):
                 b'nuking state\n' % len(versionbytes),
             )
             self.invalidate()
-            return None, None, None
+            return None, None, None, None, None
         try:
             diskversion = struct.unpack(_versionformat, versionbytes)[0]
             if diskversion != _version:
@@ -67,20 +84,20 @@ class state(object):
                     b'%d, nuking state\n' % (diskversion, _version),
                 )
                 self.invalidate()
-                return None, None, None
+                return None, None, None, None, None
 
             state = file.read().split(b'\0')
-            # state = hostname\0clock\0ignorehash\0 + list of files, each
-            # followed by a \0
-            if len(state) < 3:
+            # state = hostname\0clock\0ignorehash\0identity\0 + list of
+            # files, each prefixed by its status and followed by a \0
+            if len(state) < 4:
                 self._ui.log(
                     b'fsmonitor',
                     b'fsmonitor: state file truncated (expected '
-                    b'3 chunks, found %d), nuking state\n',
+                    b'4 chunks, found %d), nuking state\n',
                     len(state),
                 )
                 self.invalidate()
-                return None, None, None
+                return None, None, None, None, None
             diskhostname = state[0]
             hostname = encoding.strtolocal(socket.gethostname())
             if diskhostname != hostname:
@@ -92,27 +109,40 @@ class state(object):
                     % (diskhostname, hostname),
                 )
                 self.invalidate()
-                return None, None, None
+                return None, None, None, None, None
 
             clock = state[1]
             ignorehash = state[2]
+            identity = state[3]
             # discard the value after the last \0
-            notefiles = state[3:-1]
+            entries = state[4:-1]
+            notefiles = [e[1:] for e in entries]
+            status = None
+            if identity:
+                status = {e[1:]: e[0:1] for e in entries}
 
         finally:
             file.close()
 
-        return clock, ignorehash, notefiles
+        return clock, ignorehash, notefiles, identity, status
+
+    def set(self, clock, ignorehash, notefiles, identity=None, status=None):
+        """record the state of the working copy
 
-    def set(self, clock, ignorehash, notefiles):
+        With a dirstate identity, status is the state of every file listed in
+        notefiles. It is only reused as long as the dirstate has that
+        identity.
+        """
         if clock is None:
             self.invalidate()
             return
 
         # Read the identity from the file on disk rather than from the open file
         # pointer below, because the latter is actually a brand new file.
-        identity = util.filestat.frompath(self._vfs.join(b'fsmonitor.state'))
-        if identity != self._identity:
+        fileidentity = util.filestat.frompath(
+            self._vfs.join(b'fsmonitor.state')
+        )
+        if fileidentity != self._identity:
             self._ui.debug(
                 b'skip updating fsmonitor.state: identity mismatch\n'
             )
@@ -126,13 +156,19 @@ class state(object):
             self._ui.warn(_(b"warning: unable to write out fsmonitor state\n"))
             return
 
+        if identity is None or status is None:
+            identity = b''
+            status = {}
         with file:
             file.write(struct.pack(_versionformat, _version))
             file.write(encoding.strtolocal(socket.gethostname()) + b'\0')
             file.write(clock + b'\0')
             file.write(ignorehash + b'\0')
+            file.write(identity + b'\0')
             if notefiles:
-                file.write(b'\0'.join(notefiles))
+                file.write(
+                    b'\0'.join(status.get(f, b' ') + f for f in notefiles)
+                )
                 file.write(b'\0')
 
     def invalidate(self):
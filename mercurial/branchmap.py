@@ -7,6 +7,7 @@
 
 from __future__ import absolute_import
 
+import os
 import struct
 
 from .node import (
@@ -60,6 +61,47 @@ calcsize = struct.calcsize
 pack_into = struct.pack_into
 unpack_from = struct.unpack_from
 
+### Binary branch cache
+#
+# With `experimental.branchmap.binary`, the branch cache is stored in
+# `branch3[-<filter>]` as a version number followed by a sequence of records.
+# The first record lists every branch, the next ones only the branches whose
+# heads changed since the previous record. A branch is described by its
+# heads in the last record mentioning it, the cache key is the one of the last
+# record.
+#
+# Every record starts with a header: its total size, flags, the tip rev and
+# node, the filtered hash and the number of branches. It is followed by a table
+# of the offsets of the branches in the record, sorted by label, so a branch
+# can be found without reading the others. Each branch is then its label size
+# and head count, the label and the head revs. The high bit of a head rev is
+# set when the head closes its branch.
+#
+# Records are appended while holding the lock, after checking the file did not
+# change since it was read or written, and the whole file is written again
+# once the appended records outgrow the first one or are too many. A record
+# truncated by an interrupted append is ignored.
+#
+# Reading the file only reads the headers and offset tables of the records.
+# A branch is looked up in the records, from the last one, the first time it
+# is accessed. Only iterating over the branches reads all the labels.
+_binaryversion = struct.Struct(b'>I')
+_binaryrecord = struct.Struct(b'>IBi20s20sI')
+_binarybranch = struct.Struct(b'>HI')
+_binaryhead = struct.Struct(b'>I')
+
+BINARY_VERSION = 2
+
+# the whole file is written again when it has more records
+_BINARY_MAXRECORDS = 64
+
+# the record lists every branch
+_BINARY_FULL = 1 << 0
+# the record has a filtered hash
+_BINARY_FILTEREDHASH = 1 << 1
+
+_BINARY_CLOSED = 1 << 31
+
 
 class BranchMapCache(object):
     """mapping of filtered views of repo with their branchcache"""
@@ -160,6 +202,94 @@ def _branchcachedesc(repo):
         return b'branch cache'
 
 
+class _binaryindex(object):
+    """the records of a binary branch cache, giving the heads of a branch
+    without decoding the other ones"""
+
+    def __init__(self, data, records):
+        self.data = data
+        # (offset, branch offsets) of each record, last one first
+        self._records = records
+
+    def find(self, label):
+        """return the (offset, count) of the heads of label, or None"""
+        try:
+            name = encoding.fromlocal(label)
+        except error.Abort:
+            return None
+        data = self.data
+        for start, offsets in self._records:
+            lo, hi = 0, len(offsets)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                pos = start + offsets[mid]
+                labelsize, headcount = _binarybranch.unpack_from(data, pos)
+                pos += _binarybranch.size
+                current = data[pos : pos + labelsize]
+                if current < name:
+                    lo = mid + 1
+                elif current > name:
+                    hi = mid
+                else:
+                    return pos + labelsize, headcount
+        return None
+
+    def entries(self):
+        """return a mapping of every label to the (offset, count) of its
+        heads"""
+        data = self.data
+        entries = {}
+        for start, offsets in reversed(self._records):
+            for offset in offsets:
+                pos = start + offset
+                labelsize, headcount = _binarybranch.unpack_from(data, pos)
+                pos += _binarybranch.size
+                label = encoding.tolocal(data[pos : pos + labelsize])
+                entries[label] = (pos + labelsize, headcount)
+        return entries
+
+
+def _readbinary(data):
+    """parse the headers of the records of a binary branch cache
+
+    Returns (key, index, size, fullsize, count): the (tiprev, tipnode,
+    filteredhash) of the last record, the _binaryindex of the records, the
+    size of the complete records, the size up to the end of the first one
+    and the number of records.
+    """
+    if _binaryversion.unpack_from(data)[0] != BINARY_VERSION:
+        raise ValueError('unknown version')
+    offset = _binaryversion.size
+    fullsize = key = None
+    records = []
+    while offset + _binaryrecord.size <= len(data):
+        header = _binaryrecord.unpack_from(data, offset)
+        size, flags, tiprev, tipnode, filteredhash, count = header
+        end = offset + size
+        if end > len(data):
+            # interrupted append
+            break
+        if fullsize is None and not flags & _BINARY_FULL:
+            raise ValueError('missing full record')
+        table = offset + _binaryrecord.size
+        if table + count * _binaryhead.size > end:
+            raise ValueError('invalid record size')
+        offsets = struct.unpack_from(b'>%dI' % count, data, table)
+        if offsets and max(offsets) + _binarybranch.size > size:
+            raise ValueError('invalid branch offset')
+        records.append((offset, offsets))
+        if not flags & _BINARY_FILTEREDHASH:
+            filteredhash = None
+        key = (tiprev, tipnode, filteredhash)
+        offset = end
+        if fullsize is None:
+            fullsize = end
+    if key is None:
+        raise ValueError('no record')
+    records.reverse()
+    return key, _binaryindex(data, records), offset, fullsize, len(records)
+
+
 class branchcache(object):
     """A dict like object that hold branches heads cache.
 
@@ -213,6 +343,46 @@ class branchcache(object):
         self._hasnode = hasnode
         if self._hasnode is None:
             self._hasnode = lambda x: True
+        # the _binaryindex of the binary cache this was read from, to decode
+        # the branches not in _entries yet, see _loadbranch()
+        self._lazyindex = None
+        self._revnode = None
+        # (filename, inode, size, size of the first record, record count) of
+        # the binary cache matching this object, and the branches changed since
+        self._ondisk = None
+        self._dirtybranches = set()
+
+    def _loadbranch(self, branch):
+        """decode the heads of a branch from the binary cache, if needed"""
+        if self._lazyindex is None or branch in self._entries:
+            return
+        found = self._lazyindex.find(branch)
+        if found is not None:
+            self._decodeheads(branch, *found)
+
+    def _decodeheads(self, branch, offset, count):
+        data = self._lazyindex.data
+        if offset + count * _binaryhead.size > len(data):
+            raise ValueError('invalid heads of branch %r' % branch)
+        revs = struct.unpack_from(b'>%dI' % count, data, offset)
+        heads = []
+        for rev in revs:
+            node = self._revnode(rev & ~_BINARY_CLOSED)
+            if rev & _BINARY_CLOSED:
+                self._closednodes.add(node)
+            heads.append(node)
+        self._entries[branch] = heads
+        # the revs of the heads are known to the changelog
+        self._verifiedbranches.add(branch)
+
+    def _loadall(self):
+        if self._lazyindex is None:
+            return
+        entries = self._lazyindex.entries()
+        for branch, (offset, count) in pycompat.iteritems(entries):
+            if branch not in self._entries:
+                self._decodeheads(branch, offset, count)
+        self._lazyindex = None
 
     def _verifyclosed(self):
         """ verify the closed nodes we have """
@@ -226,6 +396,7 @@ class branchcache(object):
 
     def _verifybranch(self, branch):
         """ verify head nodes for the given branch. """
+        self._loadbranch(branch)
         if branch not in self._entries or branch in self._verifiedbranches:
             return
         for n in self._entries[branch]:
@@ -236,15 +407,18 @@ class branchcache(object):
 
     def _verifyall(self):
         """ verifies nodes of all the branches """
+        self._loadall()
         needverification = set(self._entries.keys()) - self._verifiedbranches
         for b in needverification:
             self._verifybranch(b)
 
     def __iter__(self):
+        self._loadall()
         return iter(self._entries)
 
     def __setitem__(self, key, value):
         self._entries[key] = value
+        self._dirtybranches.add(key)
 
     def __getitem__(self, key):
         self._verifybranch(key)
@@ -255,6 +429,7 @@ class branchcache(object):
         return key in self._entries
 
     def iteritems(self):
+        self._loadall()
         for k, v in pycompat.iteritems(self._entries):
             self._verifybranch(k)
             yield k, v
@@ -268,6 +443,10 @@ class branchcache(object):
 
     @classmethod
     def fromfile(cls, repo):
+        if repo.ui.configbool(b'experimental', b'branchmap.binary'):
+            bcache = cls._frombinaryfile(repo)
+            if bcache is not None:
+                return bcache
         f = None
         try:
             f = repo.cachevfs(cls._filename(repo))
@@ -328,6 +507,41 @@ class branchcache(object):
             if state == b'c':
                 self._closednodes.add(node)
 
+    @classmethod
+    def _frombinaryfile(cls, repo):
+        """read the binary branch cache, or return None"""
+        filename = cls._binaryfilename(repo)
+        try:
+            with repo.cachevfs(filename, b'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                data = f.read()
+        except (IOError, OSError):
+            return None
+
+        try:
+            key, index, size, fullsize, count = _readbinary(data)
+            tiprev, tipnode, filteredhash = key
+            bcache = cls(
+                tipnode=tipnode,
+                tiprev=tiprev,
+                filteredhash=filteredhash,
+                hasnode=repo.changelog.hasnode,
+            )
+            if not bcache.validfor(repo):
+                raise ValueError('tip differs')
+        except (ValueError, struct.error) as inst:
+            if repo.ui.debugflag:
+                repo.ui.debug(
+                    b'invalid %s: %s\n'
+                    % (_branchcachedesc(repo), stringutil.forcebytestr(inst))
+                )
+            return None
+
+        bcache._lazyindex = index
+        bcache._revnode = repo.unfiltered().changelog.node
+        bcache._ondisk = (filename, inode, size, fullsize, count)
+        return bcache
+
     @staticmethod
     def _filename(repo):
         """name of a branchcache file for a given repo or repoview"""
@@ -336,6 +550,14 @@ class branchcache(object):
             filename = b'%s-%s' % (filename, repo.filtername)
         return filename
 
+    @staticmethod
+    def _binaryfilename(repo):
+        """name of a binary branchcache file for a given repo or repoview"""
+        filename = b"branch3"
+        if repo.filtername:
+            filename = b'%s-%s' % (filename, repo.filtername)
+        return filename
+
     def validfor(self, repo):
         """Is the cache content valid regarding a repo
 
@@ -387,15 +609,129 @@ class branchcache(object):
 
     def copy(self):
         """return an deep copy of the branchcache object"""
-        return type(self)(
+        other = type(self)(
             self._entries,
             self.tipnode,
             self.tiprev,
             self.filteredhash,
             self._closednodes,
         )
+        other._lazyindex = self._lazyindex
+        other._revnode = self._revnode
+        return other
+
+    def _binaryrecord(self, repo, branches, full):
+        """return a record of the binary cache describing branches"""
+        flags = 0
+        if full:
+            flags |= _BINARY_FULL
+        filteredhash = self.filteredhash
+        if filteredhash is not None:
+            flags |= _BINARY_FILTEREDHASH
+        else:
+            filteredhash = nullid
+        clrev = repo.changelog.rev
+        closednodes = self._closednodes
+        labels = sorted((encoding.fromlocal(b), b) for b in branches)
+        offset = _binaryrecord.size + len(labels) * _binaryhead.size
+        offsets = []
+        chunks = []
+        for label, branch in labels:
+            heads = self._entries[branch]
+            revs = [
+                clrev(node) | (_BINARY_CLOSED if node in closednodes else 0)
+                for node in heads
+            ]
+            chunk = b''.join(
+                [
+                    _binarybranch.pack(len(label), len(heads)),
+                    label,
+                    struct.pack(b'>%dI' % len(revs), *revs),
+                ]
+            )
+            offsets.append(offset)
+            offset += len(chunk)
+            chunks.append(chunk)
+        header = _binaryrecord.pack(
+            offset,
+            flags,
+            self.tiprev,
+            self.tipnode,
+            filteredhash,
+            len(labels),
+        )
+        table = struct.pack(b'>%dI' % len(offsets), *offsets)
+        return header + table + b''.join(chunks)
+
+    def _appendbinary(self, repo, filename):
+        """append the changed branches to the binary cache
+
+        Returns False if the file is not the one this object was read from
+        or last written to.
+        """
+        fname, inode, size, fullsize, count = self._ondisk
+        if fname != filename or size - fullsize > fullsize:
+            return False
+        if count >= _BINARY_MAXRECORDS:
+            return False
+        # concurrent appends are prevented by the lock, other writers
+        # replace the file with a new one
+        if repo._currentlock(repo._lockref) is None:
+            return False
+        dirty = sorted(b for b in self._dirtybranches if b in self._entries)
+        record = self._binaryrecord(repo, dirty, False)
+        with repo.cachevfs(filename, b'ab') as f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != inode or st.st_size != size:
+                return False
+            f.write(record)
+        self._ondisk = (
+            filename,
+            inode,
+            size + len(record),
+            fullsize,
+            count + 1,
+        )
+        repo.ui.log(
+            b'branchcache',
+            b'appended %d labels to %s\n',
+            len(dirty),
+            _branchcachedesc(repo),
+        )
+        return True
+
+    def _writebinary(self, repo):
+        filename = self._binaryfilename(repo)
+        try:
+            if self._ondisk is not None and self._appendbinary(repo, filename):
+                self._dirtybranches.clear()
+                return
+            self._loadall()
+            branches = sorted(self._entries)
+            data = _binaryversion.pack(BINARY_VERSION)
+            data += self._binaryrecord(repo, branches, True)
+            with repo.cachevfs(filename, b"w", atomictemp=True) as f:
+                inode = os.fstat(f.fileno()).st_ino
+                f.write(data)
+            self._ondisk = (filename, inode, len(data), len(data), 1)
+            self._dirtybranches.clear()
+            repo.ui.log(
+                b'branchcache',
+                b'wrote %s with %d labels\n',
+                _branchcachedesc(repo),
+                len(branches),
+            )
+        except (IOError, OSError, error.Abort) as inst:
+            self._ondisk = None
+            repo.ui.debug(
+                b"couldn't write branch cache: %s\n"
+                % stringutil.forcebytestr(inst)
+            )
 
     def write(self, repo):
+        if repo.ui.configbool(b'experimental', b'branchmap.binary'):
+            self._writebinary(repo)
+            return
         try:
             f = repo.cachevfs(self._filename(repo), b"w", atomictemp=True)
             cachekey = [hex(self.tipnode), b'%d' % self.tiprev]
@@ -403,6 +739,7 @@ class branchcache(object):
                 cachekey.append(hex(self.filteredhash))
             f.write(b" ".join(cachekey) + b'\n')
             nodecount = 0
+            self._loadall()
             for label, nodes in sorted(pycompat.iteritems(self._entries)):
                 label = encoding.fromlocal(label)
                 for node in nodes:
@@ -491,6 +828,7 @@ class branchcache(object):
             #   checks can be skipped. Otherwise, the ancestors of the
             #   "uncertain" set are removed from branchheads.
             #   This computation is heavy and avoided if at all possible.
+            self._loadbranch(branch)
             bheads = self._entries.setdefault(branch, [])
             bheadset = {cl.rev(node) for node in bheads}
             uncertain = set()
@@ -132,8 +132,8 @@ class bundlerevlog(revlog.revlog):
         iterrev = rev
         # reconstruct the revision if it is from a changegroup
         while iterrev > self.repotiprev:
-            if self._revisioncache and self._revisioncache[1] == iterrev:
-                rawtext = self._revisioncache[2]
+            if iterrev in self._revisioncache:
+                rawtext = self._revisioncache[iterrev]
                 break
             chain.append(iterrev)
             iterrev = self.index[iterrev][3]
@@ -21,6 +21,7 @@
 #include <windows.h>
 #else
 #include <dirent.h>
+#include <pthread.h>
 #include <signal.h>
 #include <sys/socket.h>
 #include <sys/stat.h>
@@ -634,12 +635,153 @@ static PyObject *_listdir(char *path, int pathlen, int keepstat, char *skip)
 	return _listdir_stat(path, pathlen, keepstat, skip);
 }
 
-static PyObject *statfiles(PyObject *self, PyObject *args)
+/* return the stat of a regular file or symlink, None for anything else */
+static PyObject *statresult(int ret, const struct stat *st)
+{
+	int kind;
+
+	if (ret != -1) {
+		kind = st->st_mode & S_IFMT;
+		if (kind == S_IFREG || kind == S_IFLNK)
+			return makestat(st);
+	}
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+/* number of files stat'ed concurrently between two checks for signals */
+#define STATFILES_BATCH 4096
+#define STATFILES_MAXTHREADS 64
+
+struct statbatch {
+	PyObject *pypaths[STATFILES_BATCH];
+	char *paths[STATFILES_BATCH];
+	struct stat stats[STATFILES_BATCH];
+	int rets[STATFILES_BATCH];
+};
+
+/* the entries start, start + step, ... of a batch, for one thread */
+struct statjob {
+	struct statbatch *batch;
+	Py_ssize_t count;
+	Py_ssize_t start;
+	int step;
+};
+
+static void *statjob_run(void *arg)
+{
+	struct statjob *job = arg;
+	struct statbatch *batch = job->batch;
+	Py_ssize_t i;
+
+	for (i = job->start; i < job->count; i += job->step)
+		batch->rets[i] = lstat(batch->paths[i], &batch->stats[i]);
+	return NULL;
+}
+
+/*
+ * lstat the first count entries of the batch from nthreads threads. Must be
+ * called without holding the GIL. The share of a thread that could not be
+ * started is also done by the calling thread.
+ */
+static void statbatch_run(struct statbatch *batch, Py_ssize_t count,
+			  int nthreads)
+{
+	pthread_t threads[STATFILES_MAXTHREADS];
+	struct statjob jobs[STATFILES_MAXTHREADS];
+	int started[STATFILES_MAXTHREADS];
+	int t;
+
+	for (t = 0; t < nthreads; t++) {
+		jobs[t].batch = batch;
+		jobs[t].count = count;
+		jobs[t].start = t;
+		jobs[t].step = nthreads;
+		/* the calling thread takes the last share */
+		started[t] = t + 1 < nthreads &&
+			     pthread_create(&threads[t], NULL, statjob_run,
+					    &jobs[t]) == 0;
+	}
+	for (t = 0; t < nthreads; t++) {
+		if (!started[t])
+			statjob_run(&jobs[t]);
+	}
+	for (t = 0; t < nthreads; t++) {
+		if (started[t])
+			pthread_join(threads[t], NULL);
+	}
+}
+
+/*
+ * Fill stats with the stat of every name, issuing the lstat calls from
+ * nthreads threads. On network filesystems, each lstat is a round trip to the
+ * server and doing them concurrently hides most of the latency.
+ */
+static int statfiles_threaded(PyObject *names, PyObject *stats,
+			      Py_ssize_t count, int nthreads)
+{
+	struct statbatch *batch;
+	PyObject *stat;
+	Py_ssize_t base, n, i, held = 0;
+	int ret = -1;
+
+	batch = PyMem_Malloc(sizeof(*batch));
+	if (batch == NULL) {
+		PyErr_NoMemory();
+		return -1;
+	}
+
+	for (base = 0; base < count; base += n) {
+		n = count - base;
+		if (n > STATFILES_BATCH)
+			n = STATFILES_BATCH;
+		if (PyErr_CheckSignals() == -1)
+			goto bail;
+		for (held = 0; held < n; held++) {
+			batch->pypaths[held] = PySequence_GetItem(names, base + held);
+			if (batch->pypaths[held] == NULL)
+				goto bail;
+			batch->paths[held] = PyBytes_AsString(batch->pypaths[held]);
+			if (batch->paths[held] == NULL) {
+				held++;
+				PyErr_SetString(PyExc_TypeError, "not a string");
+				goto bail;
+			}
+		}
+
+		Py_BEGIN_ALLOW_THREADS
+		statbatch_run(batch, n, nthreads);
+		Py_END_ALLOW_THREADS
+
+		for (i = 0; i < n; i++) {
+			stat = statresult(batch->rets[i], &batch->stats[i]);
+			if (stat == NULL)
+				goto bail;
+			PyList_SET_ITEM(stats, base + i, stat);
+		}
+		for (i = 0; i < held; i++)
+			Py_DECREF(batch->pypaths[i]);
+		held = 0;
+	}
+	ret = 0;
+
+bail:
+	for (i = 0; i < held; i++)
+		Py_DECREF(batch->pypaths[i]);
+	PyMem_Free(batch);
+	return ret;
+}
+
+static PyObject *statfiles(PyObject *self, PyObject *args, PyObject *kwargs)
 {
 	PyObject *names, *stats;
 	Py_ssize_t i, count;
+	int nthreads = 0;
+
+	static char *kwlist[] = {"names", "threads", NULL};
 
-	if (!PyArg_ParseTuple(args, "O:statfiles", &names))
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|i:statfiles", kwlist,
+					 &names, &nthreads))
 		return NULL;
 
 	count = PySequence_Length(names);
@@ -652,10 +794,18 @@ static PyObject *statfiles(PyObject *self, PyObject *args)
 	if (stats == NULL)
 		return NULL;
 
+	if (nthreads > 1 && count > 1) {
+		if (nthreads > STATFILES_MAXTHREADS)
+			nthreads = STATFILES_MAXTHREADS;
+		if (statfiles_threaded(names, stats, count, nthreads) == -1)
+			goto bail;
+		return stats;
+	}
+
 	for (i = 0; i < count; i++) {
 		PyObject *stat, *pypath;
 		struct stat st;
-		int ret, kind;
+		int ret;
 		char *path;
 
 		/* With a large file count or on a slow filesystem,
@@ -674,16 +824,10 @@ static PyObject *statfiles(PyObject *self, PyObject *args)
 		}
 		ret = lstat(path, &st);
 		Py_DECREF(pypath);
-		kind = st.st_mode & S_IFMT;
-		if (ret != -1 && (kind == S_IFREG || kind == S_IFLNK)) {
-			stat = makestat(&st);
-			if (stat == NULL)
-				goto bail;
-			PyList_SET_ITEM(stats, i, stat);
-		} else {
-			Py_INCREF(Py_None);
-			PyList_SET_ITEM(stats, i, Py_None);
-		}
+		stat = statresult(ret, &st);
+		if (stat == NULL)
+			goto bail;
+		PyList_SET_ITEM(stats, i, stat);
 	}
 
 	return stats;
@@ -1356,7 +1500,8 @@ static PyMethodDef methods[] = {
 #else
 	{"statfiles", (PyCFunction)statfiles, METH_VARARGS | METH_KEYWORDS,
 	 "stat a series of files or symlinks\n"
-"Returns None for non-existent entries and entries of other types.\n"},
+"Returns None for non-existent entries and entries of other types.\n"
+"With threads, the files are stat'ed from that many threads.\n"},
 #ifdef CMSG_LEN
 	{"recvfds", (PyCFunction)recvfds, METH_VARARGS,
 	 "receive list of file descriptors via socket\n"},
@@ -1385,7 +1530,7 @@ static PyMethodDef methods[] = {
 	{NULL, NULL}
 };
 
-static const int version = 4;
+static const int version = 5;
 
 #ifdef IS_PY3K
 static struct PyModuleDef osutil_module = {
@@ -7747,7 +7747,22 @@ def update(ui, repo, node=None, **opts):
 
 @command(
     b'verify',
-    [(b'', b'full', False, b'perform more checks (EXPERIMENTAL)')],
+    [
+        (b'', b'full', False, b'perform more checks (EXPERIMENTAL)'),
+        (
+            b'',
+            b'jobs',
+            0,
+            _(b'number of processes checking files in parallel'),
+            _(b'NUM'),
+        ),
+        (
+            b'',
+            b'incremental',
+            False,
+            _(b'only check data added since the last successful verify'),
+        ),
+    ],
     helpcategory=command.CATEGORY_MAINTENANCE,
 )
 def verify(ui, repo, **opts):
@@ -7764,6 +7779,14 @@ def verify(ui, repo, **opts):
     for more information about recovery from corruption of the
     repository.
 
+    With --jobs, files are checked by several processes in parallel. Issues
+    are reported in the same order as with a sequential check.
+
+    With --incremental, only the data added since the last successful
+    verify is checked. Everything is checked if no previous verify was
+    recorded or if the repository was rewritten since then (strip,
+    censor, upgrade, ...).
+
     Returns 0 on success, 1 if errors are encountered.
     """
     opts = pycompat.byteskwargs(opts)
@@ -7771,7 +7794,9 @@ def verify(ui, repo, **opts):
     level = None
     if opts[b'full']:
         level = verifymod.VERIFY_FULL
-    return hg.verify(repo, level)
+    return hg.verify(
+        repo, level, jobs=opts[b'jobs'], incremental=opts[b'incremental']
+    )
 
 
 @command(
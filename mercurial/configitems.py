@@ -792,6 +792,11 @@ coreconfigitem(
     b'bundle-phases',
     default=False,
 )
+coreconfigitem(
+    b'experimental',
+    b'branchmap.binary',
+    default=False,
+)
 coreconfigitem(
     b'experimental',
     b'bundle2-advertise',
@@ -892,6 +897,21 @@ coreconfigitem(
     b'directaccess.revnums',
     default=False,
 )
+coreconfigitem(
+    b'experimental',
+    b'dirstate.dircache',
+    default=False,
+)
+coreconfigitem(
+    b'experimental',
+    b'dirstate.ignorecache',
+    default=False,
+)
+coreconfigitem(
+    b'experimental',
+    b'dirstate.stat-threads',
+    default=None,
+)
 coreconfigitem(
     b'experimental',
     b'editortmpinhg',
@@ -980,6 +1000,11 @@ coreconfigitem(
     b'mergetempdirprefix',
     default=None,
 )
+coreconfigitem(
+    b'experimental',
+    b'mmapdatathreshold',
+    default=None,
+)
 coreconfigitem(
     b'experimental',
     b'mmapindexthreshold',
@@ -1058,6 +1083,11 @@ coreconfigitem(
     b'obsmarkers-exchange-debug',
     default=False,
 )
+coreconfigitem(
+    b'experimental',
+    b'obsstore.index',
+    default=False,
+)
 coreconfigitem(
     b'experimental',
     b'remotenames',
@@ -1183,6 +1213,11 @@ coreconfigitem(
     b'worker.repository-upgrade',
     default=False,
 )
+coreconfigitem(
+    b'experimental',
+    b'worker.wdir-writer-threads',
+    default=0,
+)
 coreconfigitem(
     b'experimental',
     b'xdiff',
@@ -1282,6 +1317,12 @@ coreconfigitem(
     default=False,
     experimental=True,
 )
+coreconfigitem(
+    b'format',
+    b'exp-use-dirstate-tree',
+    default=False,
+    experimental=True,
+)
 coreconfigitem(
     b'format',
     b'use-share-safe',
@@ -1755,12 +1796,32 @@ coreconfigitem(
     default=b'skip',
     experimental=True,
 )
+coreconfigitem(
+    b'storage',
+    b'manifest.fulltext-store.size',
+    default=0,
+)
 coreconfigitem(
     b'storage',
     b'new-repo-backend',
     default=b'revlogv1',
     experimental=True,
 )
+coreconfigitem(
+    b'storage',
+    b'revlog.decompress-threads',
+    default=0,
+)
+coreconfigitem(
+    b'storage',
+    b'revlog.decompressed-cache.size',
+    default=0,
+)
+coreconfigitem(
+    b'storage',
+    b'revlog.fulltext-cache.size',
+    default=0,
+)
 coreconfigitem(
     b'storage',
     b'revlog.optimize-delta-parent-choice',
@@ -46,6 +46,7 @@ from . import (
     subrepo,
     subrepoutil,
     util,
+    worker,
 )
 from .utils import (
     dateutil,
@@ -1521,6 +1522,10 @@ class committablectx(basectx):
         return False
 
 
+# number of files handed at once to a worker comparing them, see _checklookup
+_LOOKUPSPERTASK = 32
+
+
 class workingctx(committablectx):
     """A workingctx object makes access to data related to
     the current working directory convenient.
@@ -1807,30 +1812,65 @@ class workingctx(committablectx):
         deleted = []
         fixup = []
         pctx = self._parents[0]
+        files = sorted(files)
+        ui = self._repo.ui
         # do a full compare of any files that might have changed
-        for f in sorted(files):
-            try:
-                # This will return True for a file that got replaced by a
-                # directory in the interim, but fixing that is pretty hard.
-                if (
-                    f not in pctx
-                    or self.flags(f) != pctx.flags(f)
-                    or pctx[f].cmp(self[f])
-                ):
-                    modified.append(f)
-                else:
-                    fixup.append(f)
-            except (IOError, OSError):
-                # A file become inaccessible in between? Mark it as deleted,
-                # matching dirstate behavior (issue5584).
-                # The dirstate has more complex behavior around whether a
-                # missing file matches a directory, etc, but we don't need to
-                # bother with that: if f has made it to this point, we're sure
-                # it's in the dirstate.
+        if (
+            pycompat.isposix
+            and worker.ismainthread()
+            and worker.worthwhile(ui, 0.001, len(files), threadsafe=False)
+        ):
+            # Files are read and hashed by worker processes. Load what they
+            # all need first, so that they inherit it instead of each of them
+            # loading it again.
+            pctx.manifest()
+            self._flagfunc
+            self._repo._encodefilterpats
+            results = worker.imap(
+                ui,
+                self._comparelookup,
+                files,
+                staticargs=(pctx,),
+                threaded=False,
+                chunksize=_LOOKUPSPERTASK,
+            )
+        else:
+            results = (self._comparelookup(pctx, f) for f in files)
+        for f, state in zip(files, results):
+            if state == b'm':
+                modified.append(f)
+            elif state == b'r':
                 deleted.append(f)
+            else:
+                fixup.append(f)
 
         return modified, deleted, fixup
 
+    def _comparelookup(self, pctx, f):
+        """compare the content of f with its content in pctx
+
+        Returns b'm' if it changed, b'n' if it did not and b'r' if the file
+        is not accessible anymore.
+        """
+        try:
+            # This will return True for a file that got replaced by a
+            # directory in the interim, but fixing that is pretty hard.
+            if (
+                f not in pctx
+                or self.flags(f) != pctx.flags(f)
+                or pctx[f].cmp(self[f])
+            ):
+                return b'm'
+            return b'n'
+        except (IOError, OSError):
+            # A file become inaccessible in between? Mark it as deleted,
+            # matching dirstate behavior (issue5584).
+            # The dirstate has more complex behavior around whether a
+            # missing file matches a directory, etc, but we don't need to
+            # bother with that: if f has made it to this point, we're sure
+            # it's in the dirstate.
+            return b'r'
+
     def _poststatusfixup(self, status, fixup):
         """update dirstate for files that are actually clean"""
         poststatus = self._repo.postdsstatus()
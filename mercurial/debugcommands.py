@@ -2031,6 +2031,10 @@ def debugmanifestfulltextcache(ui, repo, add=(), **opts):
         with repo.wlock():
             cache = getcache()
             cache.clear(clear_persisted_data=True)
+            store = repo.manifestlog.getstorage(b'')
+            store = getattr(store, 'fulltextstore', None)
+            if store is not None:
+                store.clear(clear_persisted_data=True)
             return
 
     if add:
@@ -2070,6 +2074,13 @@ def debugmanifestfulltextcache(ui, repo, add=(), **opts):
             _(b'total cache data size %s, on-disk %s\n')
             % (util.bytecount(totalsize), util.bytecount(ondisk))
         )
+    store = getattr(repo.manifestlog.getstorage(b''), 'fulltextstore', None)
+    if store is not None:
+        entries, size = store.stats()
+        ui.write(
+            _(b'fulltext store contains %d manifest entries, %s of %s\n')
+            % (entries, util.bytecount(size), util.bytecount(store.maxsize))
+        )
 
 
 @command(b'debugmergestate', [] + cmdutil.templateopts, b'')
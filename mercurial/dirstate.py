@@ -32,6 +32,12 @@ from . import (
     util,
 )
 
+from .dirstateutils import (
+    dircache as dircachemod,
+    docket as docketmod,
+    ignorecache,
+    tree as treemod,
+)
 from .interfaces import (
     dirstate as intdirstate,
     util as interfaceutil,
@@ -44,6 +50,9 @@ propertycache = util.propertycache
 filecache = scmutil.filecache
 _rangemask = 0x7FFFFFFF
 
+# number of threads stat'ing files on network filesystems, see _statthreads
+_networkstatthreads = 16
+
 dirstatetuple = parsers.dirstatetuple
 
 
@@ -73,12 +82,14 @@ def _getfsnow(vfs):
 
 @interfaceutil.implementer(intdirstate.idirstate)
 class dirstate(object):
-    def __init__(self, opener, ui, root, validate, sparsematchfn):
+    def __init__(
+        self, opener, ui, root, validate, sparsematchfn, use_tree=False
+    ):
         """Create a new dirstate object.
 
         opener is an open()-like callable that can be used to open the
         dirstate file; root is the root of the directory tracked by
-        the dirstate.
+        the dirstate. use_tree selects the append-only tree format.
         """
         self._opener = opener
         self._validate = validate
@@ -97,7 +108,11 @@ class dirstate(object):
         self._plchangecallbacks = {}
         self._origpl = None
         self._updatedfiles = set()
-        self._mapcls = dirstatemap
+        self._use_tree = use_tree
+        if use_tree:
+            self._mapcls = dirstatetreemap
+        else:
+            self._mapcls = dirstatemap
         # Access and cache cwd early, so we don't access it for the first time
         # after a working-copy update caused it to not exist (accessing it then
         # raises an exception).
@@ -127,6 +142,30 @@ class dirstate(object):
         # normally, so we don't have a try/finally here on purpose.
         self._parentwriters -= 1
 
+    def setformat(self, use_tree):
+        """switch the dirstate to another on-disk format
+
+        The content of the dirstate is kept, and written in the new format by
+        the next write.
+        """
+        oldmap = self._map
+        oldmap.preload()
+        self._use_tree = use_tree
+        if use_tree:
+            self._mapcls = dirstatetreemap
+        else:
+            self._mapcls = dirstatemap
+        newmap = self._mapcls(self._ui, self._opener, self._root)
+        # do not read the on-disk dirstate, it uses the other format
+        newmap._map = newmap._emptymap()
+        newmap.copymap = dict(oldmap.copymap)
+        newmap.identity = oldmap.identity
+        newmap.setparents(*oldmap.parents())
+        for f, e in oldmap.items():
+            newmap._map[f] = e
+        self._map = newmap
+        self._dirty = True
+
     def pendingparentchange(self):
         """Returns true if the dirstate is in the middle of a set of changes
         that modify the dirstate parent.
@@ -174,6 +213,10 @@ class dirstate(object):
         if not files:
             return matchmod.never()
 
+        if self._ui.configbool(b'experimental', b'dirstate.ignorecache'):
+            return ignorecache.ignorematcher(
+                self._ui, self._opener, self._root, files
+            )
         pats = [b'include:%s' % f for f in files]
         return matchmod.match(self._root, b'', [], pats, warn=self._ui.warn)
 
@@ -193,6 +236,22 @@ class dirstate(object):
     def _checkcase(self):
         return not util.fscasesensitive(self._join(b'.hg'))
 
+    @propertycache
+    def _statthreads(self):
+        """number of threads stat'ing the files not seen while walking
+
+        Unless configured, threads are only used on network filesystems,
+        where every stat is a round trip to the server.
+        """
+        threads = self._ui.configint(b'experimental', b'dirstate.stat-threads')
+        if threads is None:
+            if not self._ui.configbool(b'worker', b'enabled'):
+                return 0
+            if not util.isnetworkfs(self._root):
+                return 0
+            threads = _networkstatthreads
+        return threads
+
     def _join(self, f):
         # much faster than os.path.join()
         # it's safe because f is always a relative path
@@ -966,6 +1025,61 @@ class dirstate(object):
         skipstep3 = skipstep3 and not (work or dirsnotfound)
         work = [d for d in work if not dirignore(d[0])]
 
+        dircache = None
+        if work and self._ui.configbool(b'experimental', b'dirstate.dircache'):
+            dircache = dircachemod.dircache(self._opener)
+            # directories modified after this are not cached, see dircache.py
+            cachenow = _getfsnow(self._opener)
+
+        def cachedlisting(nd):
+            """return the entries of nd from the directory cache, if valid
+
+            Files are returned without stat, as they are only needed for the
+            files which will end up in the results.
+            """
+            try:
+                mtime = lstat(join(nd))[stat.ST_MTIME]
+            except OSError:
+                dircache.discard(nd)
+                return None, None
+            cached = dircache.get(nd, mtime)
+            if cached is None:
+                return mtime, None
+            entries = []
+            for f, kind in cached:
+                if kind == dircachemod.DIR:
+                    entries.append((f, dirkind, None))
+                else:
+                    entries.append((f, regkind, None))
+            return mtime, entries
+
+        def updatecache(nd, mtime, entries):
+            """record the entries of nd if it only holds tracked files"""
+            if mtime is None or mtime >= cachenow:
+                dircache.discard(nd)
+                return
+            cached = []
+            for f, kind, st in entries:
+                if kind == dirkind:
+                    cached.append((f, dircachemod.DIR))
+                elif (kind == regkind or kind == lnkkind) and (
+                    nd and nd + b"/" + f or f
+                ) in dmap:
+                    cached.append((f, dircachemod.FILE))
+                else:
+                    dircache.discard(nd)
+                    return
+            dircache.set(nd, mtime, sorted(cached))
+
+        def filestat(nf, st):
+            """return st, or the stat of a file listed from the cache"""
+            if st is None:
+                try:
+                    st = lstat(join(nf))
+                except OSError:
+                    pass
+            return st
+
         # step 2: visit subdirectories
         def traverse(work, alreadynormed):
             wadd = work.append
@@ -980,16 +1094,25 @@ class dirstate(object):
                 skip = None
                 if nd != b'':
                     skip = b'.hg'
-                try:
-                    with tracing.log('dirstate.walk.traverse listdir %s', nd):
-                        entries = listdir(join(nd), stat=True, skip=skip)
-                except OSError as inst:
-                    if inst.errno in (errno.EACCES, errno.ENOENT):
-                        match.bad(
-                            self.pathto(nd), encoding.strtolocal(inst.strerror)
-                        )
-                        continue
-                    raise
+                entries = None
+                if dircache is not None:
+                    mtime, entries = cachedlisting(nd)
+                if entries is None:
+                    try:
+                        with tracing.log(
+                            'dirstate.walk.traverse listdir %s', nd
+                        ):
+                            entries = listdir(join(nd), stat=True, skip=skip)
+                    except OSError as inst:
+                        if inst.errno in (errno.EACCES, errno.ENOENT):
+                            match.bad(
+                                self.pathto(nd),
+                                encoding.strtolocal(inst.strerror),
+                            )
+                            continue
+                        raise
+                    if dircache is not None:
+                        updatecache(nd, mtime, entries)
                 for f, kind, st in entries:
                     # Some matchers may return files in the visitentries set,
                     # instead of 'this', if the matcher explicitly mentions them
@@ -1021,10 +1144,13 @@ class dirstate(object):
                         elif kind == regkind or kind == lnkkind:
                             if nf in dmap:
                                 if matchalways or matchfn(nf):
-                                    results[nf] = st
+                                    results[nf] = filestat(nf, st)
                             elif (matchalways or matchfn(nf)) and not ignore(
                                 nf
                             ):
+                                st = filestat(nf, st)
+                                if st is None:
+                                    continue
                                 # unknown file -- normalize if necessary
                                 if not alreadynormed:
                                     nf = normalize(nf, False, True)
@@ -1038,6 +1164,9 @@ class dirstate(object):
             alreadynormed = not normalize or nd == d
             traverse([d], alreadynormed)
 
+        if dircache is not None:
+            dircache.write(prune=matchalways and not subrepos)
+
         for s in subrepos:
             del results[s]
         del results[b'.hg']
@@ -1087,7 +1216,8 @@ class dirstate(object):
                 # We may not have walked the full directory tree above,
                 # so stat and check everything we missed.
                 iv = iter(visit)
-                for st in util.statfiles([join(i) for i in visit]):
+                files = [join(i) for i in visit]
+                for st in util.statfiles(files, threads=self._statthreads):
                     results[next(iv)] = st
         return results
 
@@ -1200,6 +1330,12 @@ class dirstate(object):
 
         if rustmod is None:
             use_rust = False
+        elif self._use_tree:
+            # The tree format is not handled yet
+            use_rust = False
+        elif self._ui.configbool(b'experimental', b'dirstate.dircache'):
+            # The directory cache is not handled yet
+            use_rust = False
         elif self._checkcase:
             # Case-insensitive filesystems are not handled yet
             use_rust = False
@@ -1309,7 +1445,7 @@ class dirstate(object):
         return files in the dirstate (in whatever state) filtered by match
         """
         dmap = self._map
-        if rustmod is not None:
+        if rustmod is not None and not self._use_tree:
             dmap = self._map._rustmap
 
         if match.always():
@@ -1435,10 +1571,13 @@ class dirstatemap(object):
 
     @propertycache
     def _map(self):
-        self._map = {}
+        self._map = self._emptymap()
         self.read()
         return self._map
 
+    def _emptymap(self):
+        return {}
+
     @propertycache
     def copymap(self):
         self.copymap = {}
@@ -1721,6 +1860,177 @@ class dirstatemap(object):
         return f
 
 
+class dirstatetreemap(dirstatemap):
+    """dirstatemap stored in the tree format
+
+    `.hg/dirstate` is a small docket (see `dirstateutils.docket`) pointing to
+    a data file holding the entries as a tree (see `dirstateutils.tree`).
+    Entries are read lazily from the data file, and a write only appends the
+    changed nodes to it. The data file is compacted once more than half of it
+    is no longer reachable.
+    """
+
+    def __init__(self, ui, opener, root):
+        super(dirstatetreemap, self).__init__(ui, opener, root)
+        self._docket = None
+
+    def _emptymap(self):
+        return treemod.dirstatetree()
+
+    def clear(self):
+        super(dirstatetreemap, self).clear()
+        # start over with a new data file
+        self._docket = None
+
+    def nonnormalentries(self):
+        """Compute the nonnormal dirstate entries from the dmap"""
+        return self._map.nonnormalfiles(), self._otherparententries()
+
+    def _otherparententries(self):
+        return {
+            f
+            for f, e in pycompat.iteritems(self._map)
+            if e[0] == b'n' and e[2] == -2
+        }
+
+    @propertycache
+    def nonnormalset(self):
+        return self._map.nonnormalfiles()
+
+    @propertycache
+    def otherparentset(self):
+        return self._otherparententries()
+
+    @propertycache
+    def filefoldmap(self):
+        """Returns a dictionary mapping normalized case paths to their
+        non-normalized versions.
+        """
+        f = {}
+        normcase = util.normcase
+        for name, s in pycompat.iteritems(self._map):
+            if s[0] != b'r':
+                f[normcase(name)] = name
+        f[b'.'] = b'.'  # prevents useless util.fspath() invocation
+        return f
+
+    def hastrackeddir(self, d):
+        if "_dirs" in self.__dict__:
+            return d in self._dirs
+        return self._map.hastrackeddir(d)
+
+    def hasdir(self, d):
+        if "_alldirs" in self.__dict__:
+            return d in self._alldirs
+        return self._map.hasdir(d)
+
+    @propertycache
+    def _dirs(self):
+        return pathutil.dirs(
+            f for f, e in pycompat.iteritems(self._map) if e[0] != b'r'
+        )
+
+    @propertycache
+    def _alldirs(self):
+        return pathutil.dirs(list(self._map))
+
+    def _readdocket(self):
+        try:
+            fp = self._opendirstatefile()
+            try:
+                data = fp.read()
+            finally:
+                fp.close()
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return None
+        if not data:
+            return None
+        return docketmod.parse(data)
+
+    def parents(self):
+        if not self._parents:
+            docket = self._readdocket()
+            if docket is None:
+                self._parents = (nullid, nullid)
+            else:
+                self._parents = docket.parents
+        return self._parents
+
+    def read(self):
+        # ignore HG_PENDING because identity is used only for writing
+        self.identity = util.filestat.frompath(
+            self._opener.join(self._filename)
+        )
+
+        docket = self._readdocket()
+        if docket is None:
+            return
+        try:
+            with self._opener(docket.datafilename()) as fp:
+                if util.fstat(fp).st_size < docket.data_size:
+                    data = None
+                else:
+                    data = util.buffer(util.mmapread(fp, docket.data_size))
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            data = None
+        if data is None:
+            raise error.Abort(_(b'working directory state appears damaged!'))
+
+        self._docket = docket
+        self._map = treemod.dirstatetree(data, docket.root, docket.counts)
+        self.copymap = treemod.parsecopies(data, docket.copies)
+        if not self._dirtyparents:
+            self.setparents(*docket.parents)
+
+    def write(self, st, now):
+        tree = self._map
+        olddocket = self._docket
+        copies = treemod.packcopies(self.copymap)
+        if (
+            olddocket is not None
+            and olddocket.data_unreachable * 2 <= olddocket.data_size
+        ):
+            docket = olddocket.copy()
+            with self._opener(docket.datafilename(), b'ab') as fp:
+                # data written by a failed writer is left there
+                offset = util.fstat(fp).st_size
+                data = tree.write(offset, now)
+                fp.write(data)
+                fp.write(copies)
+            docket.data_unreachable += (
+                offset
+                - olddocket.data_size
+                + tree.unreachable
+                + olddocket.copies[1]
+            )
+        else:
+            # write everything to a new data file
+            docket = docketmod.dirstatedocket()
+            offset = 0
+            data = tree.write(offset, now, full=True)
+            with self._opener(docket.datafilename(), b'wb') as fp:
+                fp.write(data)
+                fp.write(copies)
+        tree.unreachable = 0
+        docket.data_size = offset + len(data) + len(copies)
+        docket.copies = (offset + len(data), len(copies))
+        docket.root = tree.root
+        docket.counts = tree.counts
+        docket.parents = self.parents()
+        st.write(docket.serialize())
+        st.close()
+        self._docket = docket
+        self._dirtyparents = False
+        util.clearcachedproperty(self, b"otherparentset")
+        self.nonnormalset = tree.nonnormalfiles()
+        if olddocket is None or docket.uid != olddocket.uid:
+            docketmod.cleanupdatafiles(self._opener, keep=docket.datafilename())
+
+
 if rustmod is not None:
 
     class dirstatemap(object):
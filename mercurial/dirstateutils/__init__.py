@@ -0,0 +1,8 @@
+# mercurial.dirstateutils -- utilities for the dirstate
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+from __future__ import absolute_import
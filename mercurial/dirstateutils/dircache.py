@@ -0,0 +1,125 @@
+# dircache.py - cache of the content of the working copy directories
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+from __future__ import absolute_import
+
+import errno
+
+from .. import (
+    error,
+    pycompat,
+)
+
+### Directory cache
+#
+# To find unknown files, `hg status` has to list every directory of the working
+# copy. Most of them only hold tracked files and other directories, and their
+# content does not change between two invocations.
+#
+# This cache records the content of such directories along with their mtime.
+# As long as the mtime of a directory is the same, its content is known and
+# listing it can be skipped. Directories modified during the same second as
+# the walk that listed them are not recorded, as a later change in that second
+# would not be visible in their mtime.
+#
+# The cache is stored in `.hg/dirstate-dircache`. Like the dirstate, it is
+# written without holding the wlock: a reader only uses entries whose mtime
+# still matches. The file starts with a header line followed by one block per
+# directory:
+#
+# * `<mtime> <directory>\n`
+# * one line per entry of the directory: `d<name>\n` for a directory,
+#   `f<name>\n` for a file or a symbolic link
+# * an empty line
+
+FILENAME = b'dirstate-dircache'
+HEADER = b'dircache-v1\n'
+
+DIR = b'd'
+FILE = b'f'
+
+
+class dircache(object):
+    """mapping of directories to their mtime and entries"""
+
+    def __init__(self, vfs):
+        self._vfs = vfs
+        self._dirs = None
+        self._visited = set()
+        self._dirty = False
+
+    def _load(self):
+        dirs = {}
+        try:
+            data = self._vfs.read(FILENAME)
+        except IOError as inst:
+            if inst.errno != errno.ENOENT:
+                raise
+            data = b''
+        if data.startswith(HEADER):
+            try:
+                for block in data[len(HEADER) :].split(b'\n\n'):
+                    if not block:
+                        continue
+                    lines = block.split(b'\n')
+                    mtime, d = lines[0].split(b' ', 1)
+                    entries = [(l[1:], l[0:1]) for l in lines[1:]]
+                    dirs[d] = (int(mtime), entries)
+            except ValueError:
+                dirs = {}
+        self._dirs = dirs
+
+    def get(self, d, mtime):
+        """return the [(name, kind)] entries of `d` if its mtime is `mtime`"""
+        if self._dirs is None:
+            self._load()
+        self._visited.add(d)
+        cached = self._dirs.get(d)
+        if cached is None or cached[0] != mtime:
+            return None
+        return cached[1]
+
+    def set(self, d, mtime, entries):
+        if self._dirs is None:
+            self._load()
+        self._visited.add(d)
+        self._dirs[d] = (mtime, entries)
+        self._dirty = True
+
+    def discard(self, d):
+        if self._dirs is None:
+            self._load()
+        if self._dirs.pop(d, None) is not None:
+            self._dirty = True
+
+    def write(self, prune=False):
+        """write the cache if it changed
+
+        With `prune`, the directories not visited are forgotten.
+        """
+        if self._dirs is None:
+            return
+        if prune:
+            for d in list(self._dirs):
+                if d not in self._visited:
+                    del self._dirs[d]
+                    self._dirty = True
+        if not self._dirty:
+            return
+        chunks = [HEADER]
+        for d, (mtime, entries) in sorted(pycompat.iteritems(self._dirs)):
+            chunks.append(b'%d %s\n' % (mtime, d))
+            for name, kind in entries:
+                chunks.append(b'%s%s\n' % (kind, name))
+            chunks.append(b'\n')
+        try:
+            with self._vfs(FILENAME, b'w', atomictemp=True) as fp:
+                fp.write(b''.join(chunks))
+        except (IOError, OSError, error.Abort):
+            # the cache is only an optimization
+            pass
+        self._dirty = False
@@ -0,0 +1,168 @@
+# docket.py - docket of the tree dirstate format
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+from __future__ import absolute_import
+
+import os
+import re
+import struct
+
+from ..i18n import _
+from ..node import hex
+
+from .. import error
+
+### Dirstate docket
+#
+# With the tree format, the dirstate is stored using 2 files:
+#
+# * a data file holding the tree of entries (see `tree.py`), named
+#   `dirstate.<uid>`. The file is only appended to, until it is rewritten
+#   with a new uid to drop the data no longer reachable.
+#
+# * the `dirstate` file itself, a small "docket" holding the working
+#   directory parents and the information needed to find and validate the
+#   tree in the data file.
+#
+# Replacing the docket atomically is enough to switch to a new state of the
+# dirstate. Readers only look at the part of the data file described by the
+# docket they read, so writers can keep appending to it.
+#
+# The docket is made of the format marker followed by:
+#
+# * 20 bytes: first parent of the working directory
+# * 20 bytes: second parent of the working directory
+# * 8 bytes: size of the data file described by the docket
+# * 8 bytes: amount of data no longer reachable in that part of the data file
+# * 8 bytes: offset of the children array of the root of the tree
+# * 4 bytes: number of children of the root of the tree
+# * 8 bytes: offset of the copies block
+# * 4 bytes: size of the copies block
+# * 4 bytes: number of entries in the tree
+# * 4 bytes: number of entries which are not removed
+# * 4 bytes: number of entries which are not "normal"
+# * 1 byte: size of the uid of the data file
+# * variable: uid of the data file
+
+FORMAT_MARKER = b'dirstate-tree-v1\n'
+S_HEADER = struct.Struct(b'>20s20sQQQIQIIIIB')
+
+ID_SIZE = 8
+
+_DATAFILE_RE = re.compile(br'^dirstate\.[0-9a-f]+$')
+
+
+def _make_uid():
+    """return a new unique identifier.
+
+    The identifier is random and composed of ascii characters."""
+    return hex(os.urandom(ID_SIZE))
+
+
+class dirstatedocket(object):
+    """metadata of a dirstate stored in the tree format"""
+
+    def __init__(self, uid=None):
+        if uid is None:
+            uid = _make_uid()
+        # identifier of the data file, a new one is used each time the data
+        # file is rewritten
+        self.uid = uid
+        self.parents = None
+        # size of the data file described by this docket, any data after it
+        # was written by a later (or failed) writer and should be ignored
+        self.data_size = 0
+        # amount of data no longer reachable from the root of the tree
+        self.data_unreachable = 0
+        # (offset, count) of the array of the root children nodes
+        self.root = (0, 0)
+        # (offset, size) of the copies block
+        self.copies = (0, 0)
+        # (entries, tracked, nonnormal) counts of the whole tree
+        self.counts = (0, 0, 0)
+
+    def copy(self):
+        new = dirstatedocket(uid=self.uid)
+        new.parents = self.parents
+        new.data_size = self.data_size
+        new.data_unreachable = self.data_unreachable
+        new.root = self.root
+        new.copies = self.copies
+        new.counts = self.counts
+        return new
+
+    def datafilename(self):
+        """The (vfs relative) name of the data file"""
+        return b'dirstate.%s' % self.uid
+
+    def serialize(self):
+        p1, p2 = self.parents
+        header = S_HEADER.pack(
+            p1,
+            p2,
+            self.data_size,
+            self.data_unreachable,
+            self.root[0],
+            self.root[1],
+            self.copies[0],
+            self.copies[1],
+            self.counts[0],
+            self.counts[1],
+            self.counts[2],
+            len(self.uid),
+        )
+        return b''.join([FORMAT_MARKER, header, self.uid])
+
+
+def isdocket(data):
+    """tell if `data` is the content of a dirstate docket"""
+    return data.startswith(FORMAT_MARKER)
+
+
+def parse(data):
+    """return the docket serialized in `data`"""
+    offset = len(FORMAT_MARKER)
+    if not isdocket(data) or len(data) < offset + S_HEADER.size:
+        raise error.Abort(_(b'working directory state appears damaged!'))
+    fields = S_HEADER.unpack_from(data, offset)
+    offset += S_HEADER.size
+    uid = data[offset : offset + fields[11]]
+    if len(uid) != fields[11]:
+        raise error.Abort(_(b'working directory state appears damaged!'))
+    docket = dirstatedocket(uid=uid)
+    docket.parents = fields[0:2]
+    docket.data_size = fields[2]
+    docket.data_unreachable = fields[3]
+    docket.root = fields[4:6]
+    docket.copies = fields[6:8]
+    docket.counts = fields[8:11]
+    return docket
+
+
+def cleanupdatafiles(vfs, keep=None):
+    """remove the data files no longer used by any docket
+
+    Besides the `dirstate` file itself, dockets are kept around as backups
+    (`journal.dirstate`, `undo.dirstate`, ...), the data files they use are
+    preserved.
+    """
+    datafiles = set()
+    used = set()
+    if keep is not None:
+        used.add(keep)
+    for f in vfs.listdir():
+        if _DATAFILE_RE.match(f):
+            datafiles.add(f)
+        elif b'dirstate' in f and vfs.isfile(f):
+            data = vfs.tryread(f)
+            if isdocket(data):
+                try:
+                    used.add(parse(data).datafilename())
+                except error.Abort:
+                    pass
+    for f in sorted(datafiles - used):
+        vfs.tryunlink(f)
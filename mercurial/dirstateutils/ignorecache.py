@@ -0,0 +1,198 @@
+# ignorecache.py - cache of the patterns of ignored files
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+from __future__ import absolute_import
+
+import os
+import struct
+
+from ..node import hex
+from .. import (
+    error,
+    match as matchmod,
+    pycompat,
+    util,
+)
+from ..utils import hashutil
+
+### Ignore cache
+#
+# Building the matcher of ignored files means reading and parsing the ignore
+# files, translating their patterns to regexps and compiling them. With
+# thousands of patterns, this shows in the startup time of every command
+# looking for unknown files.
+#
+# Compiled regexps cannot be stored, so this cache keeps the patterns sorted
+# by `match._patternindex`: the literal paths, names and suffixes are looked up
+# in sets and only the remaining patterns are compiled. The cache is keyed by
+# the content hash of every ignore file read, including the ones pulled by
+# `include:`, and is only used when none of them changed.
+#
+# The cache is stored in `.hg/dirstate-ignorecache`. Like the dirstate, it is
+# written without holding the wlock. It starts with a header line followed by
+# lists of fields. A list is a 4 bytes count followed by its fields, a field is
+# a 4 bytes size followed by its content. The lists are:
+#
+# * the files read, as `t<sha1> <path>` for the ignore files and `i<sha1>
+#   <path>` for the files they include
+# * the regexp string describing all the patterns
+# * the (kind, pattern, source) of every pattern, flattened
+# * the (kind, pattern, source) of the patterns left to regexps, flattened
+# * the literals of each bucket of the index, in `_patternindex._buckets` order
+
+FILENAME = b'dirstate-ignorecache'
+HEADER = b'ignore-cache-v1\n'
+
+S_SIZE = struct.Struct(b'>I')
+
+# suffix of the patterns of `match.includematcher`
+GLOBSUFFIX = b'(?:/|$)'
+
+
+def _hash(path):
+    return hex(hashutil.sha1(util.readfile(path)).digest())
+
+
+def _patternfiles(root, files):
+    """return the [(toplevel, hash, path)] of the files read to build the
+    patterns of the ignore `files`, or None if one of them is unreadable
+
+    The content of a file is hashed before it is parsed, so a file changing
+    in the meantime cannot be recorded with its new hash but its old patterns.
+    """
+    read = []
+    seen = set()
+    queue = [(True, f) for f in files]
+    while queue:
+        toplevel, path = queue.pop(0)
+        fullpath = os.path.join(root, util.localpath(path))
+        if not toplevel and fullpath in seen:
+            continue
+        seen.add(fullpath)
+        try:
+            read.append((toplevel, _hash(fullpath), fullpath))
+            patterns = matchmod.readpatternfile(fullpath, None)
+        except (IOError, OSError):
+            return None
+        for pattern in patterns:
+            kind, pat = matchmod._patsplit(pattern, None)
+            if kind == b'include':
+                queue.append((False, pat))
+    return read
+
+
+def _pack(fields):
+    chunks = [S_SIZE.pack(len(fields))]
+    for field in fields:
+        chunks.append(S_SIZE.pack(len(field)))
+        chunks.append(field)
+    return b''.join(chunks)
+
+
+def _unpack(data, offset):
+    """return the list of fields at `offset` and the offset after it"""
+    count = S_SIZE.unpack_from(data, offset)[0]
+    offset += S_SIZE.size
+    fields = []
+    for i in pycompat.xrange(count):
+        size = S_SIZE.unpack_from(data, offset)[0]
+        offset += S_SIZE.size
+        field = data[offset : offset + size]
+        if len(field) != size:
+            raise ValueError('truncated ignore cache')
+        fields.append(field)
+        offset += size
+    return fields, offset
+
+
+def _kindpats(fields):
+    return [
+        tuple(fields[i : i + 3]) for i in pycompat.xrange(0, len(fields), 3)
+    ]
+
+
+def _flatten(kindpats):
+    return [field for kindpat in kindpats for field in kindpat]
+
+
+def _load(vfs, root, files):
+    """return the (kindpats, index) stored in the cache if still valid"""
+    data = vfs.tryread(FILENAME)
+    if not data.startswith(HEADER):
+        return None
+    try:
+        offset = len(HEADER)
+        lists = []
+        for i in pycompat.xrange(4 + len(matchmod._patternindex._buckets)):
+            fields, offset = _unpack(data, offset)
+            lists.append(fields)
+    except (ValueError, struct.error):
+        return None
+    read, regex, kindpats, residual = lists[:4]
+    toplevel = [os.path.join(root, util.localpath(f)) for f in files]
+    if [r[42:] for r in read if r[0:1] == b't'] != toplevel:
+        return None
+    for r in read:
+        try:
+            if _hash(r[42:]) != r[1:41]:
+                return None
+        except (IOError, OSError):
+            return None
+    index = matchmod._patternindex(GLOBSUFFIX)
+    index.regex = regex[0]
+    index.residual = _kindpats(residual)
+    for bucket, values in zip(matchmod._patternindex._buckets, lists[4:]):
+        getattr(index, pycompat.sysstr(bucket)).update(values)
+    return _kindpats(kindpats), index
+
+
+def _write(vfs, read, kindpats, index):
+    lists = [
+        [b'%s%s %s' % (b't' if t else b'i', h, p) for t, h, p in read],
+        [index.regex],
+        _flatten(kindpats),
+        _flatten(index.residual),
+    ]
+    for bucket in matchmod._patternindex._buckets:
+        lists.append(sorted(getattr(index, pycompat.sysstr(bucket))))
+    try:
+        with vfs(FILENAME, b'w', atomictemp=True) as fp:
+            fp.write(HEADER)
+            for fields in lists:
+                fp.write(_pack(fields))
+    except (IOError, OSError, error.Abort):
+        # the cache is only an optimization
+        pass
+
+
+def ignorematcher(ui, vfs, root, files):
+    """return the matcher of the files ignored by the ignore `files`
+
+    The patterns are read from the cache if no ignore file changed, the cache
+    is written again otherwise.
+    """
+    loaded = _load(vfs, root, files)
+    if loaded is not None:
+        kindpats, index = loaded
+    else:
+        warnings = []
+
+        def warn(msg):
+            warnings.append(msg)
+            ui.warn(msg)
+
+        read = _patternfiles(root, files)
+        pats = [b'include:%s' % f for f in files]
+        kindpats = matchmod._donormalize(pats, b'glob', root, root, warn=warn)
+        if any(kind == b'set' for kind, pat, source in kindpats):
+            return matchmod.match(root, b'', [], pats, warn=ui.warn)
+        index = matchmod._buildindex(kindpats, GLOBSUFFIX)
+        if read is not None and not warnings:
+            _write(vfs, read, kindpats, index)
+    if not kindpats:
+        return matchmod.never()
+    return matchmod.includematcher(root, kindpats, index=index)
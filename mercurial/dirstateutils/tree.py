@@ -0,0 +1,429 @@
+# tree.py - tree of dirstate entries stored in an append-only file
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+from __future__ import absolute_import
+
+import struct
+
+from .. import (
+    policy,
+    pycompat,
+)
+
+parsers = policy.importmod('parsers')
+
+dirstatetuple = parsers.dirstatetuple
+
+### Dirstate tree
+#
+# The entries of the dirstate are stored as a tree following the directory
+# hierarchy. Each node of the tree has a base name, an optional dirstate entry
+# (directories have none, unless a removed file had the same name) and an
+# array of children nodes sorted by name.
+#
+# Only the path leading to a node has to be read to find its entry, so the
+# data file can be used directly (through mmap) without parsing it entirely.
+#
+# The data file is append-only. When nodes change, their new version is
+# appended along with new versions of the children arrays of all their
+# ancestors. The other arrays are referenced where they are. Data no longer
+# reachable from the root is accounted for in the docket, and the whole tree
+# is written to a new data file once there is too much of it.
+#
+# A node is stored in the children array of its parent as:
+#
+# * 8 bytes: offset of the base name of the node
+# * 2 bytes: size of the base name of the node
+# * 8 bytes: offset of the children array of the node
+# * 4 bytes: number of children of the node
+# * 4 bytes: number of entries in the subtree of the node (itself included)
+# * 4 bytes: number of those entries which are not removed
+# * 4 bytes: number of those entries which are not "normal"
+# * 4 bytes: highest mtime of those entries
+# * 1 byte: state of the entry of the node, NUL if the node has no entry
+# * 4 bytes: mode of the entry
+# * 4 bytes: size of the entry
+# * 4 bytes: mtime of the entry
+#
+# The copies block is a sequence of (destination, source) pairs, each one
+# stored as two 4 bytes sizes followed by the two paths.
+
+NODE = struct.Struct(b'>QHQIIIIlclll')
+COPY = struct.Struct(b'>II')
+
+_NOENTRY = b'\0'
+_NOCOUNTS = (0, 0, 0)
+_NOMTIME = -1
+
+
+def _counts(entry):
+    """return the (entries, tracked, nonnormal) counts of an entry"""
+    if entry is None:
+        return _NOCOUNTS
+    state = entry[0]
+    return (1, state != b'r', state != b'n' or entry[3] == -1)
+
+
+class _node(object):
+    __slots__ = (
+        'entry',
+        'children',
+        'ref',
+        'name',
+        'counts',
+        'maxmtime',
+        'childrenchanged',
+    )
+
+    def __init__(self):
+        # the dirstate entry of the node, if any
+        self.entry = None
+        # {name: node} mapping, None until loaded from the data file
+        self.children = None
+        # (offset, count) of the children array in the data file
+        self.ref = None
+        # (offset, size) of the base name in the data file
+        self.name = None
+        # [entries, tracked, nonnormal] counts of the subtree
+        self.counts = [0, 0, 0]
+        # highest mtime of the entries of the subtree, may be too high until
+        # the tree is written
+        self.maxmtime = _NOMTIME
+        # the children array has to be written again
+        self.childrenchanged = False
+
+
+class dirstatetree(object):
+    """mapping of file names to dirstate entries, stored as a tree
+
+    `data` is the content of the data file, `root` is the (offset, count) of
+    the children array of the root and `counts` are the counts of the whole
+    tree.
+    """
+
+    def __init__(self, data=b'', root=None, counts=_NOCOUNTS):
+        self._data = data
+        self._root = _node()
+        self._root.ref = root
+        self._root.counts = list(counts)
+        if root is None:
+            self._root.children = {}
+        # amount of data made unreachable since the tree was last written
+        self.unreachable = 0
+        # offset and pending chunks of the data being written
+        self._offset = 0
+        self._chunks = None
+
+    def _children(self, node):
+        """return the children of a node, loading them if needed"""
+        children = node.children
+        if children is None:
+            children = node.children = {}
+            if node.ref is not None:
+                data = self._data
+                start, count = node.ref
+                unpack = NODE.unpack_from
+                for offset in pycompat.xrange(
+                    start, start + count * NODE.size, NODE.size
+                ):
+                    fields = unpack(data, offset)
+                    child = _node()
+                    child.name = fields[0:2]
+                    if fields[3]:
+                        child.ref = fields[2:4]
+                    else:
+                        child.children = {}
+                    child.counts = list(fields[4:7])
+                    child.maxmtime = fields[7]
+                    if fields[8] != _NOENTRY:
+                        child.entry = dirstatetuple(*fields[8:12])
+                    name = bytes(data[fields[0] : fields[0] + fields[1]])
+                    children[name] = child
+        return children
+
+    def _path(self, f, create=False):
+        """return the list of nodes from the root to the node of `f`
+
+        Returns None if the node does not exist and `create` is False.
+        """
+        node = self._root
+        nodes = [node]
+        for name in f.split(b'/'):
+            children = self._children(node)
+            node = children.get(name)
+            if node is None:
+                if not create:
+                    return None
+                node = children[name] = _node()
+                node.children = {}
+            nodes.append(node)
+        return nodes
+
+    def _lookup(self, f):
+        node = self._root
+        for name in f.split(b'/'):
+            node = self._children(node).get(name)
+            if node is None:
+                return None
+        return node
+
+    def _changed(self, nodes, old, new):
+        """update the nodes leading to an entry changing from `old` to `new`"""
+        oldcounts = _counts(old)
+        newcounts = _counts(new)
+        delta = [n - o for n, o in zip(newcounts, oldcounts)]
+        mtime = _NOMTIME if new is None else new[3]
+        for node in nodes:
+            if mtime > node.maxmtime:
+                node.maxmtime = mtime
+            counts = node.counts
+            counts[0] += delta[0]
+            counts[1] += delta[1]
+            counts[2] += delta[2]
+        for node in nodes[:-1]:
+            node.childrenchanged = True
+
+    def __len__(self):
+        return self._root.counts[0]
+
+    def __contains__(self, f):
+        node = self._lookup(f)
+        return node is not None and node.entry is not None
+
+    def __getitem__(self, f):
+        node = self._lookup(f)
+        if node is None or node.entry is None:
+            raise KeyError(f)
+        return node.entry
+
+    def get(self, f, default=None):
+        node = self._lookup(f)
+        if node is None or node.entry is None:
+            return default
+        return node.entry
+
+    def __setitem__(self, f, entry):
+        nodes = self._path(f, create=True)
+        leaf = nodes[-1]
+        old = leaf.entry
+        leaf.entry = entry
+        self._changed(nodes, old, entry)
+
+    def pop(self, f, *default):
+        names = f.split(b'/')
+        nodes = self._path(f)
+        if nodes is None or nodes[-1].entry is None:
+            if default:
+                return default[0]
+            raise KeyError(f)
+        leaf = nodes[-1]
+        old = leaf.entry
+        leaf.entry = None
+        self._changed(nodes, old, None)
+        # drop the nodes left without entries
+        for i in pycompat.xrange(len(names), 0, -1):
+            node = nodes[i]
+            if node.counts[0]:
+                break
+            del nodes[i - 1].children[names[i - 1]]
+            if node.name is not None:
+                self.unreachable += node.name[1]
+            if node.ref is not None:
+                self.unreachable += node.ref[1] * NODE.size
+        return old
+
+    def __delitem__(self, f):
+        self.pop(f)
+
+    def clear(self):
+        self._root = _node()
+        self._root.children = {}
+        self._root.childrenchanged = True
+        self.unreachable = 0
+
+    def items(self):
+        stack = [(self._root, b'')]
+        while stack:
+            node, prefix = stack.pop()
+            for name, child in pycompat.iteritems(self._children(node)):
+                path = prefix + name
+                if child.entry is not None:
+                    yield path, child.entry
+                if child.counts[0] > (child.entry is not None):
+                    stack.append((child, path + b'/'))
+
+    iteritems = items
+
+    def __iter__(self):
+        for f, e in self.items():
+            yield f
+
+    def keys(self):
+        return list(self)
+
+    def hasdir(self, d):
+        """tell if there are entries in the directory `d`"""
+        node = self._lookup(d)
+        return node is not None and node.counts[0] > (node.entry is not None)
+
+    def hastrackeddir(self, d):
+        """tell if there are tracked files in the directory `d`"""
+        node = self._lookup(d)
+        if node is None:
+            return False
+        return node.counts[1] > _counts(node.entry)[1]
+
+    def nonnormalfiles(self):
+        """return the set of files with a state other than "normal"
+
+        Only the subtrees holding such files are visited.
+        """
+        nonnormal = set()
+        stack = [(self._root, b'')]
+        while stack:
+            node, prefix = stack.pop()
+            for name, child in pycompat.iteritems(self._children(node)):
+                if not child.counts[2]:
+                    continue
+                path = prefix + name
+                e = child.entry
+                if e is not None and (e[0] != b'n' or e[3] == -1):
+                    nonnormal.add(path)
+                stack.append((child, path + b'/'))
+        return nonnormal
+
+    def _entrieswithmtime(self, mtime):
+        """yield the files whose entry has `mtime`
+
+        Only the subtrees which may hold such entries are visited.
+        """
+        stack = [(self._root, b'')]
+        while stack:
+            node, prefix = stack.pop()
+            for name, child in pycompat.iteritems(self._children(node)):
+                if child.maxmtime < mtime:
+                    continue
+                path = prefix + name
+                e = child.entry
+                if e is not None and e[3] == mtime:
+                    yield path
+                stack.append((child, path + b'/'))
+
+    def _loadall(self, node):
+        """load the whole subtree of `node` and forget about the data file"""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            children = self._children(node)
+            node.ref = None
+            node.childrenchanged = True
+            for child in children.values():
+                child.name = None
+                stack.append(child)
+
+    def _append(self, data):
+        """queue `data` for writing, return its (offset, size)"""
+        offset = self._offset
+        self._chunks.append(data)
+        self._offset += len(data)
+        return offset, len(data)
+
+    def _writechildren(self, node):
+        children = node.children
+        records = []
+        maxmtime = _NOMTIME if node.entry is None else node.entry[3]
+        for name in sorted(children):
+            child = children[name]
+            if child.childrenchanged:
+                self._writechildren(child)
+            if child.maxmtime > maxmtime:
+                maxmtime = child.maxmtime
+            if child.name is None:
+                child.name = self._append(name)
+            e = child.entry
+            if e is None:
+                e = (_NOENTRY, 0, 0, 0)
+            ref = child.ref or (0, 0)
+            records.append(
+                NODE.pack(
+                    child.name[0],
+                    child.name[1],
+                    ref[0],
+                    ref[1],
+                    child.counts[0],
+                    child.counts[1],
+                    child.counts[2],
+                    child.maxmtime,
+                    e[0],
+                    e[1],
+                    e[2],
+                    e[3],
+                )
+            )
+        if node.ref is not None:
+            self.unreachable += node.ref[1] * NODE.size
+        if records:
+            node.ref = (self._append(b''.join(records))[0], len(records))
+        else:
+            node.ref = None
+        node.maxmtime = maxmtime
+        node.childrenchanged = False
+
+    def write(self, offset, now, full=False):
+        """return the data to write to the data file at `offset`
+
+        With `full`, the whole tree is written, otherwise only the changed
+        nodes are. Entries with an mtime equal to `now` have it forgotten, like
+        `parsers.pack_dirstate` does.
+        """
+        for f in list(self._entrieswithmtime(now)):
+            e = self[f]
+            if e[0] == b'n':
+                self[f] = dirstatetuple(e[0], e[1], e[2], -1)
+        if full:
+            self._loadall(self._root)
+        self._offset = offset
+        self._chunks = []
+        if self._root.childrenchanged:
+            self._writechildren(self._root)
+        data = b''.join(self._chunks)
+        self._chunks = None
+        return data
+
+    @property
+    def root(self):
+        """the (offset, count) of the children array of the root"""
+        return self._root.ref or (0, 0)
+
+    @property
+    def counts(self):
+        return tuple(self._root.counts)
+
+
+def parsecopies(data, block):
+    """return the copymap stored in the `(offset, size)` block of `data`"""
+    copymap = {}
+    offset, size = block
+    end = offset + size
+    while offset < end:
+        dsize, ssize = COPY.unpack_from(data, offset)
+        offset += COPY.size
+        dest = bytes(data[offset : offset + dsize])
+        offset += dsize
+        copymap[dest] = bytes(data[offset : offset + ssize])
+        offset += ssize
+    return copymap
+
+
+def packcopies(copymap):
+    """return the copies block for `copymap`"""
+    chunks = []
+    for dest, source in sorted(pycompat.iteritems(copymap)):
+        chunks.append(COPY.pack(len(dest), len(source)))
+        chunks.append(dest)
+        chunks.append(source)
+    return b''.join(chunks)
@@ -1364,9 +1364,11 @@ def outgoing(ui, repo, dest, opts):
     return 0  # exit code is zero since we found outgoing changes
 
 
-def verify(repo, level=None):
+def verify(repo, level=None, jobs=None, incremental=False):
     """verify the consistency of a repository"""
-    ret = verifymod.verify(repo, level=level)
+    ret = verifymod.verify(
+        repo, level=level, jobs=jobs, incremental=incremental
+    )
 
     # Broken subrepo references in hidden csets don't seem worth worrying about,
     # since they can't be pushed/pulled, and --hidden can be used if they are a
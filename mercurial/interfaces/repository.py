@@ -886,6 +886,9 @@ class ifilestorage(ifileindex, ifiledata, ifilemutation):
         to ``safe_renamed`` in order to indicate nodes that may perform the
         rename checks with currently accessible data.
 
+        If set, the ``startrev`` key is the first revision to check. Earlier
+        revisions were checked by a previous verify and can be skipped.
+
         The method yields objects conforming to the ``iverifyproblem``
         interface.
         """
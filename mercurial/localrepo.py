@@ -84,7 +84,10 @@ from .utils import (
     stringutil,
 )
 
-from .revlogutils import constants as revlogconst
+from .revlogutils import (
+    chunkcache,
+    constants as revlogconst,
+)
 
 release = lockmod.release
 urlerr = util.urlerr
@@ -1035,6 +1038,10 @@ def resolverevlogstorevfsoptions(ui, requirements, features):
     if mmapindexthreshold is not None:
         options[b'mmapindexthreshold'] = mmapindexthreshold
 
+    mmapdatathreshold = ui.configbytes(b'experimental', b'mmapdatathreshold')
+    if mmapdatathreshold is not None:
+        options[b'mmapdatathreshold'] = mmapdatathreshold
+
     withsparseread = ui.configbool(b'experimental', b'sparse-read')
     srdensitythres = float(
         ui.config(b'experimental', b'sparse-read.density-threshold')
@@ -1080,6 +1087,22 @@ def resolverevlogstorevfsoptions(ui, requirements, features):
             msg = _(b'invalid value for `storage.revlog.zstd.level` config: %d')
             raise error.Abort(msg % options[b'zstd.level'])
 
+    decompressedcachesize = ui.configbytes(
+        b'storage', b'revlog.decompressed-cache.size'
+    )
+    if decompressedcachesize > 0:
+        cache = chunkcache.decompressedchunkcache(decompressedcachesize)
+        options[b'decompressed-chunk-cache'] = cache
+    options[b'decompress-threads'] = ui.configint(
+        b'storage', b'revlog.decompress-threads'
+    )
+    options[b'fulltext-cache-size'] = ui.configbytes(
+        b'storage', b'revlog.fulltext-cache.size'
+    )
+    options[b'manifest-fulltext-store-size'] = ui.configbytes(
+        b'storage', b'manifest.fulltext-store.size'
+    )
+
     if requirementsmod.NARROW_REQUIREMENT in requirements:
         options[b'enableellipsis'] = True
 
@@ -1207,6 +1230,7 @@ class localrepository(object):
         requirementsmod.SIDEDATA_REQUIREMENT,
         requirementsmod.SPARSEREVLOG_REQUIREMENT,
         requirementsmod.NODEMAP_REQUIREMENT,
+        requirementsmod.DIRSTATE_TREE_REQUIREMENT,
         bookmarks.BOOKMARKS_IN_STORE_REQUIREMENT,
         requirementsmod.SHARESAFE_REQUIREMENT,
     }
@@ -1656,8 +1680,16 @@ class localrepository(object):
         """Extension point for wrapping the dirstate per-repo."""
         sparsematchfn = lambda: sparse.matcher(self)
 
+        use_tree = (
+            requirementsmod.DIRSTATE_TREE_REQUIREMENT in self.requirements
+        )
         return dirstate.dirstate(
-            self.vfs, self.ui, self.root, self._dirstatevalidate, sparsematchfn
+            self.vfs,
+            self.ui,
+            self.root,
+            self._dirstatevalidate,
+            sparsematchfn,
+            use_tree=use_tree,
         )
 
     def _dirstatevalidate(self, node):
@@ -3475,6 +3507,10 @@ def newreporequirements(ui, createopts):
     if ui.configbool(b'format', b'use-persistent-nodemap'):
         requirements.add(requirementsmod.NODEMAP_REQUIREMENT)
 
+    # experimental config: format.exp-use-dirstate-tree
+    if ui.configbool(b'format', b'exp-use-dirstate-tree'):
+        requirements.add(requirementsmod.DIRSTATE_TREE_REQUIREMENT)
+
     # if share-safe is enabled, let's create the new repository with the new
     # requirement
     if ui.configbool(b'format', b'use-share-safe'):
@@ -7,6 +7,7 @@
 
 from __future__ import absolute_import
 
+import errno
 import heapq
 import itertools
 import struct
@@ -1534,6 +1535,261 @@ class manifestfulltextcache(util.lrucachedict):
         self._read = False
 
 
+class manifestfulltextstore(object):
+    """Append-only on-disk store of manifest fulltexts
+
+    The store is made of two files in the cache directory:
+
+    - ``manifestfulltextstore``, the data file, made of entries of
+      20 bytes node, 4 bytes length, <length> manifest data
+    - ``manifestfulltextstore.idx``, the index, made of fixed size entries of
+      20 bytes node, 8 bytes offset in the data file, 4 bytes length
+
+    New fulltexts are appended to both files when the working copy lock is
+    released. Readers mmap the data file, so that reading a manifest only
+    touches the pages holding it, and pick up the entries appended by other
+    processes (chg or command server workers) on lookup misses.
+
+    Once the data file would grow past `maxsize` bytes, it is rewritten with
+    the most recent entries, up to half of `maxsize`. Entries read from the
+    older half of the data file are appended again, so that hot manifests
+    survive the rewrite.
+    """
+
+    _datafile = b'manifestfulltextstore'
+    _indexfile = b'manifestfulltextstore.idx'
+    _header = struct.Struct(b'>20sL')
+    _indexentry = struct.Struct(b'>20sQL')
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._opener = None
+        # node -> (offset, length) of the entries in the data file
+        self._entries = {}
+        # identity and amount of the index file read so far
+        self._indexid = None
+        self._indexsize = 0
+        # end of the last entry of the data file, as known from the index
+        self._datasize = 0
+        self._data = None
+        # node -> fulltext, waiting for the next write
+        self._pending = util.sortdict()
+        self._pendingsize = 0
+        # only record new fulltexts when they are going to be written
+        self._recording = False
+
+    def __len__(self):
+        self._refresh()
+        return len(self._entries)
+
+    def __contains__(self, node):
+        return node in self._pending or self.get(node) is not None
+
+    def _resetentries(self):
+        self._entries = {}
+        self._indexid = None
+        self._indexsize = 0
+        self._datasize = 0
+        self._data = None
+
+    def _refresh(self):
+        """read the index entries appended since the last refresh"""
+        if self._opener is None:
+            return
+        try:
+            st = self._opener.stat(self._indexfile)
+        except OSError as inst:
+            if inst.errno != errno.ENOENT:
+                raise
+            self._resetentries()
+            return
+        if (st.st_dev, st.st_ino) != self._indexid:
+            # the store was rewritten
+            self._resetentries()
+        elif st.st_size == self._indexsize:
+            return
+        with self._opener(self._indexfile) as fp:
+            st = util.fstat(fp)
+            if (st.st_dev, st.st_ino) != self._indexid:
+                self._resetentries()
+                self._indexid = (st.st_dev, st.st_ino)
+            fp.seek(self._indexsize)
+            data = fp.read()
+        entrysize = self._indexentry.size
+        # ignore a trailing partial entry, it is still being written
+        usable = len(data) - len(data) % entrysize
+        unpack = self._indexentry.unpack_from
+        for pos in pycompat.xrange(0, usable, entrysize):
+            node, offset, length = unpack(data, pos)
+            self._entries[node] = (offset, length)
+            end = offset + self._header.size + length
+            self._datasize = max(self._datasize, end)
+        self._indexsize += usable
+
+    def _mapdata(self, end):
+        """return a mapping of the data file covering `end` bytes or None"""
+        if self._data is None or len(self._data) < end:
+            try:
+                with self._opener(self._datafile) as fp:
+                    self._data = util.mmapread(fp)
+            except (IOError, OSError):
+                self._data = None
+                return None
+        if len(self._data) < end:
+            return None
+        return self._data
+
+    def _readentry(self, node, offset, length):
+        start = offset + self._header.size
+        data = self._mapdata(start + length)
+        if data is None:
+            return None
+        # the data file may have been rewritten under our feet
+        if data[offset:start] != self._header.pack(node, length):
+            return None
+        return data[start : start + length]
+
+    def get(self, node):
+        """return the fulltext of the manifest `node` or None"""
+        text = self._pending.get(node)
+        if text is not None:
+            return text
+        entry = self._entries.get(node)
+        if entry is None:
+            self._refresh()
+            entry = self._entries.get(node)
+            if entry is None:
+                return None
+        text = self._readentry(node, *entry)
+        if text is None:
+            # stale entry, reload the index and retry once
+            self._resetentries()
+            self._refresh()
+            entry = self._entries.get(node)
+            if entry is None:
+                return None
+            text = self._readentry(node, *entry)
+        if text is not None and entry[0] < self._datasize - self.maxsize // 2:
+            # keep hot entries out of the part dropped by the next rewrite
+            self._addpending(node, text)
+        return text
+
+    def add(self, node, text):
+        """record the fulltext of `node`, written by the next `write()`"""
+        if node in self._pending or node in self._entries:
+            return
+        self._addpending(node, bytes(text))
+
+    def _addpending(self, node, text):
+        if not self._recording:
+            return
+        # a single entry is not allowed to flush most of the store
+        if len(text) > self.maxsize // 2:
+            return
+        self._pending[node] = text
+        self._pendingsize += len(text)
+        while self._pendingsize > self.maxsize:
+            oldest = next(iter(self._pending))
+            self._pendingsize -= len(self._pending.pop(oldest))
+
+    def write(self):
+        """append the pending fulltexts to the store
+
+        This must be called with the working copy lock held.
+        """
+        if not self._pending or self._opener is None:
+            return
+        pending = list(self._pending.items())
+        self._pending.clear()
+        self._pendingsize = 0
+        try:
+            self._refresh()
+            try:
+                datasize = self._opener.stat(self._datafile).st_size
+            except OSError as inst:
+                if inst.errno != errno.ENOENT:
+                    raise
+                datasize = 0
+            hsize = self._header.size
+            newsize = datasize + sum(hsize + len(t) for n, t in pending)
+            if newsize > self.maxsize:
+                self._rewrite(pending)
+            else:
+                self._append(datasize, pending)
+        except (IOError, OSError):
+            # We could not write the store (e.g. permission error), this is
+            # only a cache.
+            pass
+
+    def _append(self, offset, entries):
+        data = []
+        index = []
+        for node, text in entries:
+            data.append(self._header.pack(node, len(text)))
+            data.append(text)
+            index.append(self._indexentry.pack(node, offset, len(text)))
+            offset += self._header.size + len(text)
+        # data first, so that index entries never point past the data file
+        with self._opener(self._datafile, b'ab') as fp:
+            fp.write(b''.join(data))
+        with self._opener(self._indexfile, b'ab') as fp:
+            fp.write(b''.join(index))
+
+    def _rewrite(self, pending):
+        """rewrite the store with the most recent entries only"""
+        budget = self.maxsize // 2
+        kept = []
+        seen = set()
+        for node, text in reversed(pending):
+            budget -= self._header.size + len(text)
+            if budget < 0:
+                break
+            kept.append((node, text))
+            seen.add(node)
+        else:
+            existing = sorted(
+                self._entries.items(), key=lambda e: e[1][0], reverse=True
+            )
+            for node, (offset, length) in existing:
+                if node in seen:
+                    continue
+                budget -= self._header.size + length
+                if budget < 0:
+                    break
+                text = self._readentry(node, offset, length)
+                if text is not None:
+                    kept.append((node, text))
+        kept.reverse()
+
+        data = []
+        index = []
+        offset = 0
+        for node, text in kept:
+            data.append(self._header.pack(node, len(text)))
+            data.append(text)
+            index.append(self._indexentry.pack(node, offset, len(text)))
+            offset += self._header.size + len(text)
+        # readers still using the old files validate the entries they read
+        with self._opener(self._datafile, b'w', atomictemp=True) as fp:
+            fp.write(b''.join(data))
+        with self._opener(self._indexfile, b'w', atomictemp=True) as fp:
+            fp.write(b''.join(index))
+        self._resetentries()
+
+    def clear(self, clear_persisted_data=False):
+        self._pending.clear()
+        self._pendingsize = 0
+        self._resetentries()
+        if clear_persisted_data and self._opener is not None:
+            self._opener.tryunlink(self._indexfile)
+            self._opener.tryunlink(self._datafile)
+
+    def stats(self):
+        """return the number of entries and size of the data file"""
+        self._refresh()
+        return len(self._entries), self._datasize
+
+
 # and upper bound of what we expect from compression
 # (real live value seems to be "3")
 MAXCOMPRESSION = 3
@@ -1571,15 +1827,21 @@ class manifestrevlog(object):
         # revs at a time (such as during commit --amend). When rebasing large
         # stacks of commits, the number can go up, hence the config knob below.
         cachesize = 4
+        storesize = 0
         optiontreemanifest = False
         opts = getattr(opener, 'options', None)
         if opts is not None:
             cachesize = opts.get(b'manifestcachesize', cachesize)
+            storesize = opts.get(b'manifest-fulltext-store-size', 0)
             optiontreemanifest = opts.get(b'treemanifest', False)
 
         self._treeondisk = optiontreemanifest or treemanifest
 
         self._fulltextcache = manifestfulltextcache(cachesize)
+        # only flat manifests are stored on disk
+        self._fulltextstore = None
+        if storesize > 0 and not self._treeondisk:
+            self._fulltextstore = manifestfulltextstore(storesize)
 
         if tree:
             assert self._treeondisk, b'opts is %r' % opts
@@ -1617,8 +1879,12 @@ class manifestrevlog(object):
             return
 
         self._fulltextcache._opener = repo.wcachevfs
+        if self._fulltextstore is not None:
+            self._fulltextstore._opener = repo.wcachevfs
         if repo._currentlock(repo._wlockref) is None:
             return
+        if self._fulltextstore is not None:
+            self._fulltextstore._recording = True
 
         reporef = weakref.ref(repo)
         manifestrevlogref = weakref.ref(self)
@@ -1636,6 +1902,8 @@ class manifestrevlog(object):
                 # there's a different manifest in play now, abort
                 return
             self._fulltextcache.write()
+            if self._fulltextstore is not None:
+                self._fulltextstore.write()
 
         repo._afterlock(persistmanifestcache)
 
@@ -1643,9 +1911,16 @@ class manifestrevlog(object):
     def fulltextcache(self):
         return self._fulltextcache
 
+    @property
+    def fulltextstore(self):
+        """the on-disk store of manifest fulltexts, or None"""
+        return self._fulltextstore
+
     def clearcaches(self, clear_persisted_data=False):
         self._revlog.clearcaches()
         self._fulltextcache.clear(clear_persisted_data=clear_persisted_data)
+        if self._fulltextstore is not None:
+            self._fulltextstore.clear(clear_persisted_data=clear_persisted_data)
         self._dirlogcache = {self.tree: self}
 
     def dirlog(self, d):
@@ -1729,6 +2004,8 @@ class manifestrevlog(object):
 
         if arraytext is not None:
             self.fulltextcache[n] = arraytext
+            if self._fulltextstore is not None:
+                self._fulltextstore.add(n, arraytext)
 
         return n
 
@@ -2071,7 +2348,14 @@ class manifestctx(object):
                 if self._node in store.fulltextcache:
                     text = pycompat.bytestr(store.fulltextcache[self._node])
                 else:
-                    text = store.revision(self._node)
+                    fulltextstore = getattr(store, 'fulltextstore', None)
+                    text = None
+                    if fulltextstore is not None:
+                        text = fulltextstore.get(self._node)
+                    if text is None:
+                        text = store.revision(self._node)
+                        if fulltextstore is not None:
+                            fulltextstore.add(self._node, text)
                     arraytext = bytearray(text)
                     store.fulltextcache[self._node] = arraytext
                 self._data = manifestdict(text)
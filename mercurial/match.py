@@ -631,25 +631,14 @@ class patternmatcher(basematcher):
 
         self._files = _explicitfiles(kindpats)
         self._prefix = _prefix(kindpats)
-        self._pats, self.matchfn = _buildmatch(kindpats, b'$', root)
-
-    @propertycache
-    def _dirs(self):
-        return set(pathutil.dirs(self._fileset))
+        self._index = _buildindex(kindpats, b'$')
+        self._pats, self.matchfn = self._index.regex, self._index.matchfn(root)
 
     def visitdir(self, dir):
-        if self._prefix and dir in self._fileset:
-            return b'all'
-        return dir in self._dirs or path_or_parents_in_set(dir, self._fileset)
+        return self._index.visitdir(dir)
 
     def visitchildrenset(self, dir):
-        ret = self.visitdir(dir)
-        if ret is True:
-            return b'this'
-        elif not ret:
-            return set()
-        assert ret == b'all'
-        return b'all'
+        return self._index.visitchildrenset(dir)
 
     def prefix(self):
         return self._prefix
@@ -700,60 +689,29 @@ class _dirchildren(object):
 
 
 class includematcher(basematcher):
-    def __init__(self, root, kindpats, badfn=None):
+    """Matches files and directories included by a set of (kind, pat, source)
+
+    `index` is an optional `_patternindex` of `kindpats`, as built by
+    `_buildindex(kindpats, b'(?:/|$)')`.
+    """
+
+    def __init__(self, root, kindpats, badfn=None, index=None):
         super(includematcher, self).__init__(badfn)
         if rustmod is not None:
             # We need to pass the patterns to Rust because they can contain
             # patterns from the user interface
             self._kindpats = kindpats
-        self._pats, self.matchfn = _buildmatch(kindpats, b'(?:/|$)', root)
+        if index is None:
+            index = _buildindex(kindpats, b'(?:/|$)')
+        self._index = index
+        self._pats, self.matchfn = index.regex, index.matchfn(root)
         self._prefix = _prefix(kindpats)
-        roots, dirs, parents = _rootsdirsandparents(kindpats)
-        # roots are directories which are recursively included.
-        self._roots = set(roots)
-        # dirs are directories which are non-recursively included.
-        self._dirs = set(dirs)
-        # parents are directories which are non-recursively included because
-        # they are needed to get to items in _dirs or _roots.
-        self._parents = parents
 
     def visitdir(self, dir):
-        if self._prefix and dir in self._roots:
-            return b'all'
-        return (
-            dir in self._dirs
-            or dir in self._parents
-            or path_or_parents_in_set(dir, self._roots)
-        )
-
-    @propertycache
-    def _allparentschildren(self):
-        # It may seem odd that we add dirs, roots, and parents, and then
-        # restrict to only parents. This is to catch the case of:
-        #   dirs = ['foo/bar']
-        #   parents = ['foo']
-        # if we asked for the children of 'foo', but had only added
-        # self._parents, we wouldn't be able to respond ['bar'].
-        return _dirchildren(
-            itertools.chain(self._dirs, self._roots, self._parents),
-            onlyinclude=self._parents,
-        )
+        return self._index.visitdir(dir)
 
     def visitchildrenset(self, dir):
-        if self._prefix and dir in self._roots:
-            return b'all'
-        # Note: this does *not* include the 'dir in self._parents' case from
-        # visitdir, that's handled below.
-        if (
-            b'' in self._roots
-            or dir in self._dirs
-            or path_or_parents_in_set(dir, self._roots)
-        ):
-            return b'this'
-
-        if dir in self._parents:
-            return self._allparentschildren.get(dir) or set()
-        return set()
+        return self._index.visitchildrenset(dir)
 
     @encoding.strmethod
     def __repr__(self):
@@ -1448,6 +1406,285 @@ def _buildregexmatch(kindpats, globsuffix):
         raise error.Abort(_(b"invalid pattern"))
 
 
+def _buildregex(kindpats, globsuffix):
+    """Return the regexp string `_buildmatch` describes kindpats with,
+    without compiling it."""
+    kindpats = [kp for kp in kindpats if kp[0] != b'subinclude']
+    if kindpats and all(k == b'rootfilesin' for k, p, s in kindpats):
+        dirs = {p for k, p, s in kindpats}
+        return b'rootfilesin: %s' % stringutil.pprint(list(sorted(dirs)))
+    return _joinregexes([_regex(k, p, globsuffix) for (k, p, s) in kindpats])
+
+
+def _globliteral(pat):
+    '''Whether a glob only matches itself'''
+    return not any(c in pat for c in (b'*', b'?', b'[', b'{', b'\\'))
+
+
+def _reliteral(pat):
+    r"""Return the string a regexp only matches, or None
+
+    >>> _reliteral(br'\.orig')
+    '.orig'
+    >>> _reliteral(br'foo.*')
+    """
+    res = []
+    i, n = 0, len(pat)
+    while i < n:
+        c = pat[i : i + 1]
+        i += 1
+        if c == b'\\':
+            c = pat[i : i + 1]
+            i += 1
+            if not c or c.isalnum():
+                return None
+        elif c in b'.^$*+?{}[]|()':
+            return None
+        res.append(c)
+    return b''.join(res)
+
+
+def _classifypattern(kind, pat, globsuffix):
+    """Return the (bucket, value) a pattern is stored as in a `_patternindex`
+
+    The bucket is None for the patterns left to regexps.
+    """
+    if globsuffix == b'$':
+        recursive = False
+    elif globsuffix == b'(?:/|$)':
+        recursive = True
+    else:
+        return None, None
+    if kind in (b'path', b'relpath'):
+        if pat == b'.' or (kind == b'relpath' and not pat):
+            return b'dirpaths', b''
+        if pat:
+            return b'dirpaths', pat
+    elif kind in (b'glob', b'rootglob') and _globliteral(pat):
+        if pat:
+            return (b'dirpaths' if recursive else b'paths'), pat
+        if kind == b'glob':
+            return b'dirpaths', b''
+    elif kind == b'relglob' and pat and b'/' not in pat:
+        if _globliteral(pat):
+            return (b'components' if recursive else b'names'), pat
+        if pat[0:1] == b'*' and len(pat) > 1 and _globliteral(pat[1:]):
+            suffix = pat[1:]
+            return (b'componentsuffixes' if recursive else b'suffixes'), suffix
+    elif kind == b'relre' and pat.endswith(b'$'):
+        if pat.startswith(b'^'):
+            literal = _reliteral(pat[1:-1])
+            if literal:
+                return b'paths', literal
+        else:
+            literal = _reliteral(pat[:-1])
+            if literal:
+                return b'suffixes', literal
+    return None, None
+
+
+class _patternindex(object):
+    r"""Patterns sorted by how they can be matched
+
+    The patterns matching literal paths, base names or suffixes are stored in
+    sets and looked up directly. Only the other ones, in `residual`, are
+    compiled to a regexp. The literals are compared to:
+
+    * `paths`: the path
+    * `names`: the base name of the path
+    * `suffixes`: the end of the path
+    * `dirpaths`: the path and each of its parent directories
+    * `components`: each component of the path
+    * `componentsuffixes`: the end of each component of the path
+
+    `regex` is the regexp string describing all the patterns. The residual
+    globs are grouped by the literal directory they start with, so a path is
+    only matched against the regexps of its parent directories. The
+    directories to visit are derived from the same sets.
+
+    >>> index = _buildindex([
+    ...     (b'relglob', b'*.o', b''),
+    ...     (b'relglob', b'build', b''),
+    ...     (b'rootglob', b'doc/index.html', b''),
+    ...     (b'relre', br'\.orig$', b''),
+    ...     (b'relre', b'^tmp-[0-9]+', b''),
+    ... ], b'(?:/|$)')
+    >>> sorted(index.componentsuffixes), sorted(index.components)
+    (['.o'], ['build'])
+    >>> sorted(index.dirpaths), sorted(index.suffixes)
+    (['doc/index.html'], ['.orig'])
+    >>> index.residual
+    [('relre', '^tmp-[0-9]+', '')]
+    >>> m = index.matchfn(b'')
+    >>> [m(f) for f in (b'a/b.o/c', b'a/build/c', b'doc/index.html/x')]
+    [True, True, True]
+    >>> [m(f) for f in (b'a.orig', b'tmp-1/a', b'a.org', b'src/build.c')]
+    [True, True, False, False]
+    """
+
+    _buckets = (
+        b'paths',
+        b'names',
+        b'suffixes',
+        b'dirpaths',
+        b'components',
+        b'componentsuffixes',
+    )
+
+    def __init__(self, globsuffix):
+        self.globsuffix = globsuffix
+        self.regex = b''
+        self.paths = set()
+        self.names = set()
+        self.suffixes = set()
+        self.dirpaths = set()
+        self.components = set()
+        self.componentsuffixes = set()
+        self.residual = []
+
+    def insert(self, bucket, value, kindpat):
+        if bucket is None:
+            self.residual.append(kindpat)
+        else:
+            getattr(self, pycompat.sysstr(bucket)).add(value)
+
+    def matchfn(self, root):
+        """Return a matcher function for the indexed patterns"""
+        paths = self.paths
+        names = self.names
+        extensions, suffixes = _splitsuffixes(self.suffixes)
+        dirpaths = self.dirpaths
+        components = self.components
+        compextensions, compsuffixes = _splitsuffixes(self.componentsuffixes)
+        bycomponent = bool(components or compextensions or compsuffixes)
+
+        groups = {}
+        for kindpat in self.residual:
+            groups.setdefault(_residualroot(*kindpat), []).append(kindpat)
+        residualmatchers = {}
+        for d, kindpats in pycompat.iteritems(groups):
+            residualmatchers[d] = _buildmatch(kindpats, self.globsuffix, root)[
+                1
+            ]
+        rootmatch = residualmatchers.pop(b'', None)
+
+        def mf(f):
+            if f in paths or f.endswith(suffixes):
+                return True
+            if extensions and f[f.rfind(b'.') :] in extensions:
+                return True
+            if names and f[f.rfind(b'/') + 1 :] in names:
+                return True
+            if dirpaths and path_or_parents_in_set(f, dirpaths):
+                return True
+            if bycomponent:
+                parts = f.split(b'/')
+                if not components.isdisjoint(parts):
+                    return True
+                for p in parts:
+                    if p[p.rfind(b'.') :] in compextensions:
+                        return True
+                    if p.endswith(compsuffixes):
+                        return True
+            if residualmatchers:
+                for d in pathutil.finddirs(f):
+                    m = residualmatchers.get(d)
+                    if m is not None and m(f):
+                        return True
+            if rootmatch is not None:
+                return rootmatch(f)
+            return False
+
+        return mf
+
+    @propertycache
+    def _visit(self):
+        roots, dirs, parents = _rootsdirsandparents(self.residual)
+        parents.update(pathutil.dirs(self.paths | self.dirpaths))
+        # literal names and suffixes can match in any directory
+        anywhere = b'' in roots or any(
+            (self.names, self.suffixes, self.components, self.componentsuffixes)
+        )
+        return anywhere, set(roots), set(dirs), parents
+
+    @propertycache
+    def _children(self):
+        anywhere, roots, dirs, parents = self._visit
+        return _dirchildren(
+            itertools.chain(self.paths, self.dirpaths, roots, dirs, parents),
+            onlyinclude=parents,
+        )
+
+    def visitdir(self, dir):
+        if self.dirpaths and path_or_parents_in_set(dir, self.dirpaths):
+            return b'all'
+        anywhere, roots, dirs, parents = self._visit
+        return (
+            anywhere
+            or dir in dirs
+            or dir in parents
+            or path_or_parents_in_set(dir, roots)
+        )
+
+    def visitchildrenset(self, dir):
+        if self.dirpaths and path_or_parents_in_set(dir, self.dirpaths):
+            return b'all'
+        anywhere, roots, dirs, parents = self._visit
+        if anywhere or dir in dirs or path_or_parents_in_set(dir, roots):
+            return b'this'
+        if dir in parents:
+            return self._children.get(dir) or set()
+        return set()
+
+
+def _splitsuffixes(suffixes):
+    """Split suffixes into a set of file extensions and a tuple of the others
+
+    >>> _splitsuffixes([b'.o', b'.tar.gz', b'~', b'.d/x'])
+    ({'.o'}, ('.d/x', '.tar.gz', '~'))
+    """
+    extensions = set()
+    others = []
+    for s in suffixes:
+        if s[0:1] == b'.' and b'.' not in s[1:] and b'/' not in s:
+            extensions.add(s)
+        else:
+            others.append(s)
+    return extensions, tuple(sorted(others))
+
+
+def _residualroot(kind, pat, source):
+    """Return the directory holding all the paths a residual pattern matches
+
+    Patterns are grouped by this directory, so only the ones rooted in the
+    parent directories of a path are tried.
+
+    >>> _residualroot(b'rootglob', b'src/lib/*.c', b'')
+    'src/lib'
+    >>> _residualroot(b'rootglob', b'*.c', b'')
+    ''
+    >>> _residualroot(b'relglob', b'src/*.c', b'')
+    ''
+    """
+    if kind not in (b'glob', b'rootglob') or b'\\' in pat:
+        return b''
+    root = _patternrootsanddirs([(kind, pat, source)])[0][0]
+    if root == pat:
+        return b''
+    return root
+
+
+def _buildindex(kindpats, globsuffix):
+    """Return a `_patternindex` of kindpats"""
+    index = _patternindex(globsuffix)
+    for kindpat in kindpats:
+        kind, pat, source = kindpat
+        bucket, value = _classifypattern(kind, pat, globsuffix)
+        index.insert(bucket, value, kindpat)
+    index.regex = _buildregex(kindpats, globsuffix)
+    return index
+
+
 def _patternrootsanddirs(kindpats):
     """Returns roots and directories corresponding to each pattern.
 
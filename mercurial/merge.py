@@ -1323,22 +1323,57 @@ def _getcwd():
         raise
 
 
+def _wdirwriterthreads(repo, wctx):
+    """number of threads writing the working directory during updates"""
+    if wctx.isinmemory() or not repo.ui.configbool(b'worker', b'enabled'):
+        return 0
+    return repo.ui.configint(b'experimental', b'worker.wdir-writer-threads')
+
+
 def batchremove(repo, wctx, actions):
     """apply removes to the working directory
 
     yields tuples for progress updates
     """
+    return _batchremove(repo, wctx, actions)
+
+
+def threadedbatchremove(repo, wctx, actions, threads):
+    """variant of batchremove() removing files from a pool of threads"""
+    return _batchremove(repo, wctx, actions, threads)
+
+
+def _removefile(task):
+    f, wfctx = task
+    try:
+        wfctx.remove(ignoremissing=True)
+    except OSError as inst:
+        return f, inst
+    return f, None
+
+
+def _batchremove(repo, wctx, actions, threads=0):
     verbose = repo.ui.verbose
     cwd = _getcwd()
+
+    def tasks():
+        for f, args, msg in actions:
+            repo.ui.debug(b" %s: %s -> r\n" % (f, msg))
+            if verbose:
+                repo.ui.note(_(b"removing %s\n") % f)
+            wfctx = wctx[f]
+            wfctx.audit()
+            yield f, wfctx
+
+    if threads:
+        results = worker.imap(
+            repo.ui, _removefile, tasks(), threaded=True, numworkers=threads
+        )
+    else:
+        results = (_removefile(t) for t in tasks())
     i = 0
-    for f, args, msg in actions:
-        repo.ui.debug(b" %s: %s -> r\n" % (f, msg))
-        if verbose:
-            repo.ui.note(_(b"removing %s\n") % f)
-        wctx[f].audit()
-        try:
-            wctx[f].remove(ignoremissing=True)
-        except OSError as inst:
+    for f, inst in results:
+        if inst is not None:
             repo.ui.warn(
                 _(b"update failed to remove %s: %s!\n")
                 % (f, pycompat.bytestr(inst.strerror))
@@ -1372,12 +1407,42 @@ def batchget(repo, mctx, wctx, wantfiledata, actions):
     empty dict. When wantfiledata is true, filedata[f] is a triple (mode, size,
     mtime) of the file f written for each action.
     """
+    with repo.wvfs.backgroundclosing(repo.ui, expectedcount=len(actions)):
+        for r in _batchget(repo, mctx, wctx, wantfiledata, actions):
+            yield r
+
+
+def threadedbatchget(repo, mctx, wctx, wantfiledata, actions, threads):
+    """variant of batchget() writing files from a pool of threads
+
+    The calling thread reads the file contents, decompressing their delta
+    chains, while the threads write the previous files, set their flags and
+    stat them.
+    """
+    return _batchget(repo, mctx, wctx, wantfiledata, actions, threads)
+
+
+def _writefile(wantfiledata, atomictemp, backgroundclose, task):
+    f, wfctx, data, flags = task
+    size = wfctx.write(
+        data, flags, backgroundclose=backgroundclose, atomictemp=atomictemp
+    )
+    if wantfiledata:
+        s = wfctx.lstat()
+        return f, (s.st_mode, size, s[stat.ST_MTIME])  # for dirstate.normal
+    return f, None
+
+
+def _batchget(repo, mctx, wctx, wantfiledata, actions, threads=0):
     filedata = {}
     verbose = repo.ui.verbose
     fctx = mctx.filectx
     ui = repo.ui
-    i = 0
-    with repo.wvfs.backgroundclosing(ui, expectedcount=len(actions)):
+    atomictemp = ui.configbool(b"experimental", b"update.atomic-file")
+    # background closing is only available to the main thread
+    backgroundclose = not threads
+
+    def tasks():
         for f, (flags, backup), msg in actions:
             repo.ui.debug(b" %s: %s -> g\n" % (f, msg))
             if verbose:
@@ -1398,22 +1463,28 @@ def batchget(repo, mctx, wctx, wantfiledata, actions):
                     util.rename(repo.wjoin(conflicting), orig)
             wfctx = wctx[f]
             wfctx.clearunknown()
-            atomictemp = ui.configbool(b"experimental", b"update.atomic-file")
-            size = wfctx.write(
-                fctx(f).data(),
-                flags,
-                backgroundclose=True,
-                atomictemp=atomictemp,
-            )
-            if wantfiledata:
-                s = wfctx.lstat()
-                mode = s.st_mode
-                mtime = s[stat.ST_MTIME]
-                filedata[f] = (mode, size, mtime)  # for dirstate.normal
-            if i == 100:
-                yield False, (i, f)
-                i = 0
-            i += 1
+            yield f, wfctx, fctx(f).data(), flags
+
+    staticargs = (wantfiledata, atomictemp, backgroundclose)
+    if threads:
+        results = worker.imap(
+            ui,
+            _writefile,
+            tasks(),
+            staticargs=staticargs,
+            threaded=True,
+            numworkers=threads,
+        )
+    else:
+        results = (_writefile(*staticargs + (t,)) for t in tasks())
+    i = 0
+    for f, data in results:
+        if wantfiledata:
+            filedata[f] = data
+        if i == 100:
+            yield False, (i, f)
+            i = 0
+        i += 1
     if i > 0:
         yield False, (i, f)
     yield True, filedata
@@ -1528,15 +1599,16 @@ def applyupdates(
     # When merging in-memory, we can't support worker processes, so set the
     # per-item cost at 0 in that case.
     cost = 0 if wctx.isinmemory() else 0.001
+    # Writer threads do not have to pickle their results back and are cheap to
+    # start, they are used instead of worker processes when configured.
+    writerthreads = _wdirwriterthreads(repo, wctx)
 
     # remove in parallel (must come before resolving path conflicts and getting)
-    prog = worker.worker(
-        repo.ui,
-        cost,
-        batchremove,
-        (repo, wctx),
-        list(mresult.getactions([mergestatemod.ACTION_REMOVE], sort=True)),
-    )
+    actions = list(mresult.getactions([mergestatemod.ACTION_REMOVE], sort=True))
+    if writerthreads > 0:
+        prog = threadedbatchremove(repo, wctx, actions, writerthreads)
+    else:
+        prog = worker.worker(repo.ui, cost, batchremove, (repo, wctx), actions)
     for i, item in prog:
         progress.increment(step=i, item=item)
     removed = mresult.len((mergestatemod.ACTION_REMOVE,))
@@ -1558,15 +1630,21 @@ def applyupdates(
     threadsafe = repo.ui.configbool(
         b'experimental', b'worker.wdir-get-thread-safe'
     )
-    prog = worker.worker(
-        repo.ui,
-        cost,
-        batchget,
-        (repo, mctx, wctx, wantfiledata),
-        list(mresult.getactions([mergestatemod.ACTION_GET], sort=True)),
-        threadsafe=threadsafe,
-        hasretval=True,
-    )
+    actions = list(mresult.getactions([mergestatemod.ACTION_GET], sort=True))
+    if writerthreads > 0:
+        prog = threadedbatchget(
+            repo, mctx, wctx, wantfiledata, actions, writerthreads
+        )
+    else:
+        prog = worker.worker(
+            repo.ui,
+            cost,
+            batchget,
+            (repo, mctx, wctx, wantfiledata),
+            actions,
+            threadsafe=threadsafe,
+            hasretval=True,
+        )
     getfiledata = {}
     for final, res in prog:
         if final:
@@ -542,6 +542,149 @@ def _checkinvalidmarkers(markers):
             )
 
 
+### Index of the obsstore
+#
+# Looking up the markers of a few changesets should not require decoding every
+# marker of the obsstore. With `experimental.obsstore.index`, the offsets of
+# the markers in the obsstore are stored in `.hg/cache/obsstore-index-v1`,
+# sorted by the node they are relevant to, so the markers of a node are found
+# by bisection and only them are decoded.
+#
+# The file starts with a header: the version, the size of the obsstore covered
+# by the index, the sha1 of the last bytes of the covered data, and the number
+# of entries of each section. The index is only used if the obsstore still
+# holds the covered data, the markers appended after it are added to the index
+# when it is loaded. The sections list the markers by predecessor, successor
+# and parent of the predecessor, as the `successors`, `predecessors` and
+# `children` mappings of the obsstore. Each entry is a node followed by the
+# offset of the marker in the obsstore.
+#
+# The index is updated as markers are added to the obsstore. It is not used if
+# some markers use sha256 nodes.
+
+_INDEX_FILENAME = b'obsstore-index-v1'
+_INDEX_VERSION = 1
+_indexheader = struct.Struct(b'>IQ20sIII')
+_indexentry = struct.Struct(b'>20sI')
+_INDEX_ENTRYSIZE = _indexentry.size
+# size of the data at the end of the covered obsstore that is hashed
+_INDEX_CHECKSIZE = 64
+
+# the sections of the index
+_SUCCESSORS = 0
+_PREDECESSORS = 1
+_CHILDREN = 2
+
+
+def _markersize(version, data, offset):
+    """return the size of the marker at offset"""
+    if version == _fm1version:
+        return _unpack(b'>I', data[offset : offset + 4])[0]
+    numsuc, mdsize = _unpack(b'>BI', data[offset : offset + 5])
+    return _fm0fsize + numsuc * _fm0fnodesize + mdsize
+
+
+def _indexentries(markers):
+    """return the entries of the markers as a list per section
+
+    markers is an iterable of (offset, marker).
+    """
+    sections = ([], [], [])
+    successors, predecessors, children = sections
+    entry = _indexentry.pack
+    for offset, mark in markers:
+        successors.append(entry(mark[0], offset))
+        for suc in mark[1]:
+            predecessors.append(entry(suc, offset))
+        if mark[5] is not None:
+            for p in mark[5]:
+                children.append(entry(p, offset))
+    return sections
+
+
+def _indexcheck(data, size):
+    return hashutil.sha1(data[max(0, size - _INDEX_CHECKSIZE) : size]).digest()
+
+
+class _obsindex(object):
+    """sorted entries of the markers of an obsstore, see _INDEX_FILENAME"""
+
+    def __init__(self, size, check, sections):
+        # size of the obsstore covered by the index, and the hash of its end
+        self.size = size
+        self.check = check
+        # bytes of the sorted entries of each section
+        self._sections = list(sections)
+
+    @classmethod
+    def fromdata(cls, data):
+        """parse the content of the index file"""
+        if len(data) < _indexheader.size:
+            raise ValueError('truncated obsstore index')
+        header = _indexheader.unpack_from(data)
+        version, size, check = header[:3]
+        if version != _INDEX_VERSION:
+            raise ValueError('unknown obsstore index version')
+        sections = []
+        offset = _indexheader.size
+        for count in header[3:]:
+            end = offset + count * _INDEX_ENTRYSIZE
+            sections.append(data[offset:end])
+            offset = end
+        if offset != len(data):
+            raise ValueError('invalid obsstore index size')
+        return cls(size, check, sections)
+
+    def todata(self):
+        counts = [len(s) // _INDEX_ENTRYSIZE for s in self._sections]
+        header = _indexheader.pack(
+            _INDEX_VERSION, self.size, self.check, *counts
+        )
+        return b''.join([header] + self._sections)
+
+    @staticmethod
+    def _bisect(section, key):
+        """return the index of the first entry of section not lower than key"""
+        lo, hi = 0, len(section) // _INDEX_ENTRYSIZE
+        size = len(key)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * _INDEX_ENTRYSIZE
+            if section[start : start + size] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def offsets(self, section, node):
+        """return the offsets of the markers of node in a section"""
+        section = self._sections[section]
+        start = self._bisect(section, node) * _INDEX_ENTRYSIZE
+        offsets = []
+        while section[start : start + 20] == node:
+            offsets.append(_indexentry.unpack_from(section, start)[1])
+            start += _INDEX_ENTRYSIZE
+        return offsets
+
+    def extend(self, sections, size, check):
+        """insert the entries of each section, for markers up to size"""
+        for i, entries in enumerate(sections):
+            if not entries:
+                continue
+            section = self._sections[i]
+            pieces = []
+            previous = 0
+            for entry in sorted(entries):
+                pos = self._bisect(section, entry) * _INDEX_ENTRYSIZE
+                pieces.append(section[previous:pos])
+                pieces.append(entry)
+                previous = pos
+            pieces.append(section[previous:])
+            self._sections[i] = b''.join(pieces)
+        self.size = size
+        self.check = check
+
+
 class obsstore(object):
     """Store obsolete markers
 
@@ -560,12 +703,18 @@ class obsstore(object):
     # parents: (tuple of nodeid) or None, parents of predecessors
     #          None is used when no data has been recorded
 
-    def __init__(self, svfs, defaultformat=_fm1version, readonly=False):
+    def __init__(
+        self, svfs, defaultformat=_fm1version, readonly=False, cachevfs=None
+    ):
         # caches for various obsolescence related cache
         self.caches = {}
         self.svfs = svfs
         self._defaultformat = defaultformat
         self._readonly = readonly
+        # vfs of the index of the markers, see _INDEX_FILENAME
+        self._cachevfs = cachevfs
+        # markers decoded through the index, by offset
+        self._indexedmarkers = {}
 
     def __iter__(self):
         return iter(self._all)
@@ -693,7 +842,7 @@ class obsstore(object):
             addedmarkers = transaction.changes.get(b'obsmarkers')
             if addedmarkers is not None:
                 addedmarkers.update(new)
-            self._addmarkers(new, data)
+            self._addmarkers(new, data, offset)
             # new marker *may* have changed several set. invalidate the cache.
             self.caches.clear()
         # records the number of new markers for the transaction hooks
@@ -731,18 +880,24 @@ class obsstore(object):
 
     @propertycache
     def successors(self):
+        if self._index is not None:
+            return _indexedmarkermap(self, _SUCCESSORS)
         successors = {}
         _addsuccessors(successors, self._all)
         return successors
 
     @propertycache
     def predecessors(self):
+        if self._index is not None:
+            return _indexedmarkermap(self, _PREDECESSORS)
         predecessors = {}
         _addpredecessors(predecessors, self._all)
         return predecessors
 
     @propertycache
     def children(self):
+        if self._index is not None:
+            return _indexedmarkermap(self, _CHILDREN)
         children = {}
         _addchildren(children, self._all)
         return children
@@ -750,10 +905,107 @@ class obsstore(object):
     def _cached(self, attr):
         return attr in self.__dict__
 
-    def _addmarkers(self, markers, rawdata):
+    @propertycache
+    def _index(self):
+        """the _obsindex of the markers, or None if not enabled or usable
+
+        The index is built if missing or invalid, and extended with the
+        markers added to the obsstore since it was written.
+        """
+        if self._cachevfs is None:
+            return None
+        data = self._data
+        if not data or len(data) > 0xFFFFFFFF:
+            return None
+        index = None
+        try:
+            index = _obsindex.fromdata(self._cachevfs.read(_INDEX_FILENAME))
+            if index.size > len(data) or index.check != _indexcheck(
+                data, index.size
+            ):
+                index = None
+        except (IOError, OSError, ValueError, struct.error):
+            index = None
+        if index is None:
+            if not self._indexable(self._all):
+                return None
+            start = 1
+            index = _obsindex(0, b'', (b'', b'', b''))
+            markers = self._all
+        elif index.size == len(data):
+            return index
+        else:
+            start = index.size
+            markers = list(_readmarkers(data, start)[1])
+            if not self._indexable(markers):
+                return None
+            _checkinvalidmarkers(markers)
+        offsets = self._markeroffsets(data, start, markers)
+        index.extend(
+            _indexentries(offsets), len(data), _indexcheck(data, len(data))
+        )
+        self._writeindex(index)
+        return index
+
+    @staticmethod
+    def _indexable(markers):
+        return not any(m[2] & usingsha256 for m in markers)
+
+    def _markeroffsets(self, data, offset, markers):
+        """return the (offset, marker) of markers, stored from offset"""
+        version = self._version
+        result = []
+        for mark in markers:
+            result.append((offset, mark))
+            offset += _markersize(version, data, offset)
+        return result
+
+    def _writeindex(self, index):
+        try:
+            with self._cachevfs(_INDEX_FILENAME, b'wb', atomictemp=True) as f:
+                f.write(index.todata())
+        except (IOError, OSError, error.Abort):
+            # the index is only an optimization
+            pass
+
+    def _markersat(self, offsets):
+        """return the markers stored at offsets in the obsstore"""
+        decoded = self._indexedmarkers
+        markers = []
+        for offset in offsets:
+            mark = decoded.get(offset)
+            if mark is None:
+                data = self._data
+                end = offset + _markersize(self._version, data, offset)
+                mark = list(_readmarkers(data, offset, end)[1])[0]
+                _checkinvalidmarkers([mark])
+                decoded[offset] = mark
+            markers.append(mark)
+        return markers
+
+    def _addmarkers(self, markers, rawdata, offset=None):
         markers = list(markers)  # to allow repeated iteration
-        self._data = self._data + rawdata
-        self._all.extend(markers)
+        if self._cached('_data'):
+            self._data = self._data + rawdata
+        if self._cached('_all'):
+            self._all.extend(markers)
+        if self._cached('_index') and self._index is not None:
+            index = self._index
+            if offset is None or offset != index.size:
+                # markers added to a stale index, forget it
+                del self.__dict__['_index']
+            elif not self._indexable(markers):
+                self._cachevfs.tryunlink(_INDEX_FILENAME)
+                self._index = None
+            else:
+                start = offset or 1
+                data = self._data
+                index.extend(
+                    _indexentries(self._markeroffsets(data, start, markers)),
+                    len(data),
+                    _indexcheck(data, len(data)),
+                )
+                self._writeindex(index)
         if self._cached('successors'):
             _addsuccessors(self.successors, markers)
         if self._cached('predecessors'):
@@ -796,6 +1048,41 @@ class obsstore(object):
         return seenmarkers
 
 
+class _indexedmarkermap(object):
+    """mapping of nodes to the set of their markers in a section of the
+    obsstore index, decoding the markers as they are looked up"""
+
+    def __init__(self, store, section):
+        self._store = store
+        self._section = section
+        self._markers = {}
+
+    def get(self, node, default=None):
+        markers = self._markers.get(node)
+        if markers is None:
+            offsets = self._store._index.offsets(self._section, node)
+            markers = set(self._store._markersat(offsets))
+            self._markers[node] = markers
+        if not markers:
+            return default
+        return markers
+
+    def __contains__(self, node):
+        return self.get(node) is not None
+
+    def __getitem__(self, node):
+        markers = self.get(node)
+        if markers is None:
+            raise KeyError(node)
+        return markers
+
+    def setdefault(self, node, default):
+        markers = self.get(node)
+        if markers is None:
+            markers = self._markers[node] = default
+        return markers
+
+
 def makestore(ui, repo):
     """Create an obsstore instance from a repo."""
     # read default format for new obsstore.
@@ -805,6 +1092,8 @@ def makestore(ui, repo):
     kwargs = {}
     if defaultformat is not None:
         kwargs['defaultformat'] = defaultformat
+    if ui.configbool(b'experimental', b'obsstore.index'):
+        kwargs['cachevfs'] = repo.cachevfs
     readonly = not isenabled(repo, createmarkersopt)
     store = obsstore(repo.svfs, readonly=readonly, **kwargs)
     if store and readonly:
@@ -79,7 +79,7 @@ _cextversions = {
     ('cext', 'base85'): 1,
     ('cext', 'bdiff'): 3,
     ('cext', 'mpatch'): 1,
-    ('cext', 'osutil'): 4,
+    ('cext', 'osutil'): 5,
     ('cext', 'parsers'): 17,
 }
 
@@ -18,6 +18,7 @@ import select
 import stat
 import sys
 import tempfile
+import threading
 import unicodedata
 
 from .i18n import _
@@ -591,21 +592,54 @@ def setsignalhandler():
 _wantedkinds = {stat.S_IFREG, stat.S_IFLNK}
 
 
-def statfiles(files):
-    """Stat each file in files. Yield each stat, or None if a file does not
-    exist or has a type we don't care about."""
-    lstat = os.lstat
-    getkind = stat.S_IFMT
-    for nf in files:
-        try:
-            st = lstat(nf)
-            if getkind(st.st_mode) not in _wantedkinds:
-                st = None
-        except OSError as err:
-            if err.errno not in (errno.ENOENT, errno.ENOTDIR):
-                raise
+def _statfile(nf):
+    try:
+        st = os.lstat(nf)
+        if stat.S_IFMT(st.st_mode) not in _wantedkinds:
             st = None
-        yield st
+    except OSError as err:
+        if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        st = None
+    return st
+
+
+def _statfilesthreaded(files, threads):
+    files = list(files)
+    stats = [None] * len(files)
+    errors = []
+
+    def run(start):
+        try:
+            for i in pycompat.xrange(start, len(files), threads):
+                stats[i] = _statfile(files[i])
+        except Exception as inst:
+            errors.append(inst)
+
+    workers = [
+        threading.Thread(target=run, args=(t,))
+        for t in pycompat.xrange(1, threads)
+    ]
+    for w in workers:
+        w.start()
+    run(0)
+    for w in workers:
+        w.join()
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def statfiles(files, threads=0):
+    """Stat each file in files. Yield each stat, or None if a file does not
+    exist or has a type we don't care about.
+
+    With threads, the files are stat'ed from that many threads. This hides
+    the latency of network filesystems, where every stat is a round trip to
+    the server."""
+    if threads > 1:
+        return _statfilesthreaded(files, threads)
+    return (_statfile(nf) for nf in files)
 
 
 def getuser():
@@ -45,6 +45,9 @@ COPIESSDC_REQUIREMENT = b'exp-copies-sidedata-changeset'
 # The repository use persistent nodemap for the changelog and the manifest.
 NODEMAP_REQUIREMENT = b'persistent-nodemap'
 
+# The dirstate is stored in the append-only tree format
+DIRSTATE_TREE_REQUIREMENT = b'exp-dirstate-tree-v1'
+
 # Denotes that the current repository is a share
 SHARED_REQUIREMENT = b'shared'
 
@@ -67,8 +70,11 @@ SHARESAFE_REQUIREMENT = b'share-safe'
 #   repo. Hence both of them should be stored in working copy
 # * SHARESAFE_REQUIREMENT needs to be stored in working dir to mark that rest of
 #   the requirements are stored in store's requires
+# * DIRSTATE_TREE_REQUIREMENT describes the format of the dirstate, which
+#   belongs to the working copy
 WORKING_DIR_REQUIREMENTS = {
     SPARSE_REQUIREMENT,
+    DIRSTATE_TREE_REQUIREMENT,
     SHARED_REQUIREMENT,
     RELATIVE_SHARED_REQUIREMENT,
     SHARESAFE_REQUIREMENT,
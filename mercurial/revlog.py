@@ -19,6 +19,7 @@ import errno
 import io
 import os
 import struct
+import threading
 import zlib
 
 # import stuff from node for others to import from revlog
@@ -116,6 +117,30 @@ _zlibdecompress = zlib.decompress
 # max size of revlog with inline data
 _maxinline = 131072
 _chunksize = 1048576
+# max number of entries of a size-bounded fulltext cache
+_fulltextcachemaxentries = 1000
+# amount of fulltext data restored at once by revlog.revisions()
+_revisionsbatchsize = 16777216
+# smaller chunks are not worth handing over to a decompression thread
+_threadeddecompressminsize = 65536
+
+# decompression thread pools, by (pid, number of threads)
+_decompressexecutors = {}
+# per thread decompressors, compression engines objects are not thread-safe
+_decompresslocal = threading.local()
+
+
+def _decompressexecutor(threads):
+    """return the process-wide pool of decompression threads"""
+    # the threads of a pool do not survive a fork (chg, worker), use a new one
+    key = (os.getpid(), threads)
+    executor = _decompressexecutors.get(key)
+    if executor is None:
+        executor = pycompat.futures.ThreadPoolExecutor(threads)
+        _decompressexecutors.clear()
+        _decompressexecutors[key] = executor
+    return executor
+
 
 # Flag processors for REVIDX_ELLIPSIS.
 def ellipsisreadprocessor(rl, text):
@@ -463,14 +488,22 @@ class revlog(object):
         self._checkambig = checkambig
         self._mmaplargeindex = mmaplargeindex
         self._censorable = censorable
-        # 3-tuple of (node, rev, text) for a raw revision.
-        self._revisioncache = None
+        # LRU of validated raw revisions (rev -> rawtext), sized in _loadindex
+        self._revisioncache = util.lrucachedict(1)
         # Maps rev to chain base rev.
         self._chainbasecache = util.lrucachedict(100)
         # 2-tuple of (offset, data) of raw data from the revlog at an offset.
         self._chunkcache = (0, b'')
         # How much data to read and cache into the raw revlog data cache.
         self._chunkcachesize = 65536
+        # Cache of decompressed chunks, shared with the other revlogs.
+        self._decompressedcache = None
+        # Number of threads used to decompress large chunks.
+        self._decompressthreads = 0
+        # Data files at least this large are mmapped rather than read.
+        self._mmapdatathreshold = None
+        # mmap of the data file, False if the file is too small to be mmapped.
+        self._datammap = None
         self._maxchainlen = None
         self._deltabothparents = True
         self.index = None
@@ -512,6 +545,13 @@ class revlog(object):
 
         if b'chunkcachesize' in opts:
             self._chunkcachesize = opts[b'chunkcachesize']
+        self._decompressedcache = opts.get(b'decompressed-chunk-cache')
+        self._decompressthreads = opts.get(b'decompress-threads', 0)
+        fulltextcachesize = opts.get(b'fulltext-cache-size', 0)
+        if fulltextcachesize > 0:
+            self._revisioncache = util.lrucachedict(
+                _fulltextcachemaxentries, maxcost=fulltextcachesize
+            )
         if b'maxchainlen' in opts:
             self._maxchainlen = opts[b'maxchainlen']
         if b'deltabothparents' in opts:
@@ -530,6 +570,7 @@ class revlog(object):
             self._maxdeltachainspan = opts[b'maxdeltachainspan']
         if self._mmaplargeindex and b'mmapindexthreshold' in opts:
             mmapindexthreshold = opts[b'mmapindexthreshold']
+        self._mmapdatathreshold = opts.get(b'mmapdatathreshold')
         self.hassidedata = bool(opts.get(b'side-data', False))
         if self.hassidedata:
             self._flagprocessors[REVIDX_SIDEDATA] = sidedatautil.processors
@@ -788,9 +829,12 @@ class revlog(object):
                 nodemaputil.setup_persistent_nodemap(transaction, self)
 
     def clearcaches(self):
-        self._revisioncache = None
+        self._revisioncache.clear()
         self._chainbasecache.clear()
         self._chunkcache = (0, b'')
+        self._datammap = None
+        if self._decompressedcache is not None:
+            self._decompressedcache.dropfile(self.indexfile)
         self._pcache = {}
         self._nodemap_docket = None
         self.index.clearcaches()
@@ -937,12 +981,21 @@ class revlog(object):
         """Obtain the delta chain for a revision.
 
         ``stoprev`` specifies a revision to stop at. If not specified, we
-        stop at the base of the chain.
+        stop at the base of the chain. It can also be a container of
+        revisions, in which case we stop at the one closest to ``rev``.
 
         Returns a 2-tuple of (chain, stopped) where ``chain`` is a list of
         revs in ascending order and ``stopped`` is a bool indicating whether
         ``stoprev`` was hit.
         """
+        if stoprev is not None and not isinstance(stoprev, int):
+            stoprevs = stoprev
+            chain = self._deltachain(rev)[0]
+            for i in pycompat.xrange(len(chain) - 1, -1, -1):
+                if chain[i] in stoprevs:
+                    return chain[i + 1 :], True
+            return chain, False
+
         # Try C implementation.
         try:
             return self.index.deltachain(rev, stoprev, self._generaldelta)
@@ -1653,6 +1706,15 @@ class revlog(object):
 
         Returns a str or a buffer instance of raw byte data.
         """
+        if (
+            self._mmapdatathreshold is not None
+            and not self._inline
+            and not self._writinghandles
+        ):
+            segment = self._mmapsegment(offset, length)
+            if segment is not None:
+                return segment
+
         o, d = self._chunkcache
         l = len(d)
 
@@ -1666,6 +1728,36 @@ class revlog(object):
 
         return self._readsegment(offset, length, df=df)
 
+    def _mmapsegment(self, offset, length):
+        """Obtain a segment of raw data from the mmapped data file.
+
+        The data file is mapped on first use and mapped again if the requested
+        segment lies beyond the current mapping (data appended since then).
+
+        Returns a buffer into the mapping, or None if the data file is too
+        small to be mmapped or does not contain the requested segment.
+        """
+        mapping = self._datammap
+        if mapping is False:
+            return None
+        end = offset + length
+        if mapping is None or len(mapping) < end:
+            try:
+                with self._datafp() as fp:
+                    size = self.opener.fstat(fp).st_size
+                    if size < self._mmapdatathreshold:
+                        mapping = False
+                    else:
+                        mapping = util.mmapread(fp)
+            except IOError as inst:
+                if inst.errno != errno.ENOENT:
+                    raise
+                return None
+            self._datammap = mapping
+            if mapping is False or len(mapping) < end:
+                return None
+        return util.buffer(mapping, offset, length)
+
     def _getsegmentforrevs(self, startrev, endrev, df=None):
         """Obtain a segment of raw data corresponding to a range of revisions.
 
@@ -1709,7 +1801,16 @@ class revlog(object):
 
         Returns a str holding uncompressed data for the requested revision.
         """
-        return self.decompress(self._getsegmentforrevs(rev, rev, df=df)[1])
+        cache = self._decompressedcache
+        if cache is None:
+            return self.decompress(self._getsegmentforrevs(rev, rev, df=df)[1])
+        entry = self.index[rev]
+        chunk = cache.get(self.indexfile, rev, entry)
+        if chunk is None:
+            segment = self._getsegmentforrevs(rev, rev, df=df)[1]
+            chunk = self.decompress(segment)
+            cache.insert(self.indexfile, rev, entry, chunk)
+        return chunk
 
     def _chunks(self, revs, df=None, targetsize=None):
         """Obtain decompressed chunks for the specified revisions.
@@ -1726,6 +1827,34 @@ class revlog(object):
         """
         if not revs:
             return []
+        cache = self._decompressedcache
+        if cache is None:
+            return self._readchunks(revs, df=df, targetsize=targetsize)
+
+        indexfile = self.indexfile
+        index = self.index
+        entries = [index[rev] for rev in revs]
+        chunks = [
+            cache.get(indexfile, rev, entry)
+            for rev, entry in zip(revs, entries)
+        ]
+        missing = [rev for rev, chunk in zip(revs, chunks) if chunk is None]
+        if missing:
+            fetched = iter(
+                self._readchunks(missing, df=df, targetsize=targetsize)
+            )
+            for i, chunk in enumerate(chunks):
+                if chunk is None:
+                    chunk = chunks[i] = next(fetched)
+                    cache.insert(indexfile, revs[i], entries[i], chunk)
+        return chunks
+
+    def _readchunks(self, revs, df=None, targetsize=None):
+        """Read and decompress chunks for the specified revisions.
+
+        Same as ``_chunks`` but always reads from the revlog data, bypassing
+        the decompressed chunk cache.
+        """
         start = self.start
         length = self.length
         inline = self._inline
@@ -1735,6 +1864,13 @@ class revlog(object):
         l = []
         ladd = l.append
 
+        # large chunks are decompressed by a pool of threads when enabled,
+        # zlib and zstd release the GIL while decompressing
+        executor = None
+        if self._decompressthreads > 0:
+            executor = _decompressexecutor(self._decompressthreads)
+        futures = []
+
         if not self._withsparseread:
             slicedchunks = (revs,)
         else:
@@ -1762,10 +1898,43 @@ class revlog(object):
                 if inline:
                     chunkstart += (rev + 1) * iosize
                 chunklength = length(rev)
-                ladd(decomp(buffer(data, chunkstart - offset, chunklength)))
+                chunk = buffer(data, chunkstart - offset, chunklength)
+                if executor is not None and (
+                    chunklength >= _threadeddecompressminsize
+                ):
+                    # decompressed in a thread, result collected below
+                    futures.append(
+                        (len(l), executor.submit(self._threaddecompress, chunk))
+                    )
+                    ladd(None)
+                else:
+                    ladd(decomp(chunk))
+
+        for i, future in futures:
+            l[i] = future.result()
 
         return l
 
+    def _threaddecompress(self, data):
+        """variant of decompress() safe to use from a decompression thread"""
+        t = data[0:1]
+        if t in (b'x', b'\0', b'u'):
+            # zlib.decompress is thread-safe, the others are no-op
+            return self.decompress(data)
+
+        decompressors = getattr(_decompresslocal, 'decompressors', None)
+        if decompressors is None:
+            decompressors = _decompresslocal.decompressors = {}
+        compressor = decompressors.get(t)
+        if compressor is None:
+            try:
+                engine = util.compengines.forrevlogheader(t)
+            except KeyError:
+                raise error.RevlogError(_(b'unknown compression type %r') % t)
+            compressor = engine.revlogcompressor(self._compengineopts)
+            decompressors[t] = compressor
+        return compressor.decompress(data)
+
     def _chunkclear(self):
         """Clear the raw chunk cache."""
         self._chunkcache = (0, b'')
@@ -1872,7 +2041,13 @@ class revlog(object):
         # ``rawtext`` is the text as stored inside the revlog. Might be the
         # revision or might need to be processed to retrieve the revision.
         rev, rawtext, validated = self._rawtext(node, rev, _df=_df)
+        return self._processrawtext(node, rev, rawtext, validated, raw=raw)
+
+    def _processrawtext(self, node, rev, rawtext, validated, raw=False):
+        """turn a rawtext into a (text, sidedata) 2-tuple
 
+        The flag processors are applied and the hash is checked if needed.
+        """
         if raw and validated:
             # if we don't want to process the raw text and that raw
             # text is cached, we can exit early.
@@ -1902,7 +2077,7 @@ class revlog(object):
         if validatehash:
             self.checkhash(text, node, rev=rev)
         if not validated:
-            self._revisioncache = (node, rev, rawtext)
+            self._revisioncache.insert(rev, rawtext, cost=len(rawtext))
 
         return text, sidedata
 
@@ -1912,28 +2087,21 @@ class revlog(object):
         returns (rev, rawtext, validated)
         """
 
-        # revision in the cache (could be useful to apply delta)
-        cachedrev = None
         # An intermediate text to apply deltas to
         basetext = None
 
-        # Check if we have the entry in cache
-        # The cache entry looks like (node, rev, rawtext)
-        if self._revisioncache:
-            if self._revisioncache[0] == node:
-                return (rev, self._revisioncache[2], True)
-            cachedrev = self._revisioncache[1]
-
         if rev is None:
             rev = self.rev(node)
 
-        chain, stopped = self._deltachain(rev, stoprev=cachedrev)
-        if stopped:
-            basetext = self._revisioncache[2]
+        # Check if we have the entry in cache
+        cache = self._revisioncache
+        if rev in cache:
+            return (rev, cache[rev], True)
 
-        # drop cache to save memory, the caller is expected to
-        # update self._revisioncache after validating the text
-        self._revisioncache = None
+        # any revision in the cache can be used to apply deltas to
+        chain, stopped = self._deltachain(rev, stoprev=cache or None)
+        if stopped:
+            basetext = cache[self.deltaparent(chain[0])]
 
         targetsize = None
         rawsize = self.index[rev][2]
@@ -1949,6 +2117,101 @@ class revlog(object):
         del basetext  # let us have a chance to free memory early
         return (rev, rawtext, False)
 
+    def revisions(self, revs):
+        """Generate ``(rev, text)`` for the given revision numbers.
+
+        This gives the same texts as calling ``revision()`` for each revision,
+        but is faster when many revisions are requested:
+
+        * the chunks of the delta chains of a batch of revisions are read and
+          decompressed at once, using sparse-read slicing if enabled,
+        * revisions used by several of the delta chains (requested or not) are
+          only restored once.
+
+        Revisions are generated in ascending order, whatever the order of
+        ``revs``.
+        """
+        revs = sorted(set(revs))
+        if revs and revs[0] == nullrev:
+            yield nullrev, b''
+            revs = revs[1:]
+
+        # find the revisions needed by several of the requested delta chains,
+        # they are worth keeping around once restored.
+        seen = set()
+        shared = set()
+        for rev in revs:
+            for r in self._deltachain(rev)[0]:
+                if r in seen:
+                    shared.add(r)
+                else:
+                    seen.add(r)
+        del seen
+
+        index = self.index
+        batch = []
+        batchsize = 0
+        for rev in revs:
+            batch.append(rev)
+            batchsize += max(index[rev][2], 0)
+            if _revisionsbatchsize <= batchsize:
+                for r in self._revisionsbatch(batch, shared):
+                    yield r
+                batch = []
+                batchsize = 0
+        if batch:
+            for r in self._revisionsbatch(batch, shared):
+                yield r
+
+    def _revisionsbatch(self, revs, shared):
+        """restore a batch of revisions for ``revisions()``
+
+        ``shared`` is the set of revisions worth keeping around while the
+        batch is restored.
+        """
+        # compute the part of each delta chain to apply, given the shared
+        # revisions restored by previous chains of the batch.
+        plans = []
+        planned = set()
+        users = collections.defaultdict(int)
+        needed = set()
+        for rev in revs:
+            chain, stopped = self._deltachain(rev, stoprev=planned or None)
+            stop = None
+            if stopped:
+                stop = self.deltaparent(chain[0])
+                users[stop] += 1
+            plans.append((rev, chain, stop))
+            planned.update(r for r in chain if r in shared)
+            needed.update(chain)
+
+        needed = sorted(needed)
+        chunks = dict(zip(needed, self._chunks(needed)))
+        del needed
+
+        texts = {}
+        for rev, chain, stop in plans:
+            text = None
+            if stop is not None:
+                text = texts[stop]
+                users[stop] -= 1
+                if not users[stop]:
+                    del texts[stop]
+            bins = []
+            for r in chain:
+                if text is None:
+                    text = bytes(chunks.pop(r))
+                else:
+                    bins.append(chunks.pop(r))
+                if users.get(r):
+                    text = mdiff.patches(text, bins)
+                    bins = []
+                    texts[r] = text
+            rawtext = mdiff.patches(text, bins)
+            del text, bins
+            node = self.node(rev)
+            yield rev, self._processrawtext(node, rev, rawtext, False)[0]
+
     def rawdata(self, nodeorrev, _df=None):
         """return an uncompressed raw data of a given node or revision number.
 
@@ -1980,8 +2243,10 @@ class revlog(object):
                 # revision data is accessed. But this case should be rare and
                 # it is extra work to teach the cache about the hash
                 # verification state.
-                if self._revisioncache and self._revisioncache[0] == node:
-                    self._revisioncache = None
+                cachedrev = rev
+                if cachedrev is None:
+                    cachedrev = self.index.get_rev(node)
+                self._revisioncache.pop(cachedrev, None)
 
                 revornode = rev
                 if revornode is None:
@@ -2332,7 +2597,7 @@ class revlog(object):
             rawtext = deltacomputer.buildtext(revinfo, fh)
 
         if type(rawtext) == bytes:  # only accept immutable objects
-            self._revisioncache = (node, curr, rawtext)
+            self._revisioncache.insert(curr, rawtext, cost=len(rawtext))
         self._chainbasecache[curr] = deltainfo.chainbase
         return node
 
@@ -2559,9 +2824,12 @@ class revlog(object):
         transaction.add(self.indexfile, end)
 
         # then reset internal state in memory to forget those revisions
-        self._revisioncache = None
+        self._revisioncache.clear()
         self._chaininfocache = util.lrucachedict(500)
         self._chunkclear()
+        self._datammap = None
+        if self._decompressedcache is not None:
+            self._decompressedcache.dropfile(self.indexfile)
 
         del self.index[rev:-1]
 
@@ -2977,7 +3245,7 @@ class revlog(object):
         state[b'skipread'] = set()
         state[b'safe_renamed'] = set()
 
-        for rev in self:
+        for rev in self.revs(start=state.get(b'startrev', 0)):
             node = self.node(rev)
 
             # Verify contents. 4 cases to care about:
@@ -0,0 +1,97 @@
+# chunkcache.py - cache of decompressed revlog chunks shared between revlogs
+#
+# Copyright 2020 Mercurial Developers
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+"""cache of decompressed revlog chunks
+
+Reading a revision means decompressing every chunk of its delta chain. Hot
+delta-chain bases (manifest snapshots, popular file revisions) end up being
+decompressed over and over again by busy processes (hgweb, annotate, ...).
+
+The `decompressedchunkcache` object defined here is a byte-bounded LRU of
+decompressed chunks. A single instance is created per repository and handed
+to every revlog through the store vfs options, so all revlogs of a repository
+compete for the same memory budget.
+
+Entries are keyed by ``(indexfile, rev)``. The index entry of the revision is
+stored alongside the data and checked on lookup, so that content replaced by a
+strip or a rollback is never served from the cache.
+"""
+
+from __future__ import absolute_import
+
+from .. import util
+
+# lrucachedict needs a bound on the number of entries, the real limit we care
+# about is the total size of the cached data.
+_MAXENTRIES = 1 << 20
+
+
+class decompressedchunkcache(object):
+    """byte-bounded LRU of decompressed revlog chunks
+
+    The cache keeps track of its hits and misses so that its size can be tuned
+    (see ``hg perf::revlogrevisions``).
+    """
+
+    def __init__(self, maxcost):
+        self.maxcost = maxcost
+        self._cache = util.lrucachedict(_MAXENTRIES, maxcost=maxcost)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def totalcost(self):
+        return self._cache.totalcost
+
+    def get(self, indexfile, rev, entry):
+        """return the cached chunk for `rev` or None
+
+        `entry` is the current index entry for `rev`. Cached data recorded for
+        a different entry is considered stale.
+        """
+        cached = self._cache.get((indexfile, rev))
+        if cached is not None and cached[0] == entry:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        return None
+
+    def insert(self, indexfile, rev, entry, chunk):
+        """record the decompressed `chunk` of `rev`"""
+        size = len(chunk)
+        # do not let a single huge chunk flush the whole cache
+        if size > self.maxcost // 2:
+            return
+        if not isinstance(chunk, bytes):
+            # do not keep alive the (possibly large) segment we sliced from
+            chunk = bytes(chunk)
+        self._cache.insert((indexfile, rev), (entry, chunk), cost=size)
+
+    def dropfile(self, indexfile):
+        """drop all entries related to the given revlog"""
+        cache = self._cache
+        for key in [k for k in cache if k[0] == indexfile]:
+            cache.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """return a dict of statistics about the cache usage"""
+        lookups = self.hits + self.misses
+        return {
+            b'hits': self.hits,
+            b'misses': self.misses,
+            b'hit-ratio': float(self.hits) / lookups if lookups else 0.0,
+            b'entries': len(self._cache),
+            b'size': self._cache.totalcost,
+            b'max-size': self.maxcost,
+        }
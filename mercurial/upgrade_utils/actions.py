@@ -78,6 +78,9 @@ class improvement(object):
 
     touches_requirements (bool)
         Whether this improvement changes repository requirements
+
+    touches_dirstate (bool)
+        Whether this improvement changes the format of the dirstate
     """
 
     def __init__(self, name, type, description, upgrademessage):
@@ -93,6 +96,7 @@ class improvement(object):
         self.touches_manifests = True
         self.touches_changelog = True
         self.touches_requirements = True
+        self.touches_dirstate = False
 
     def __eq__(self, other):
         if not isinstance(other, improvement):
@@ -151,6 +155,7 @@ class formatvariant(improvement):
     touches_manifests = True
     touches_changelog = True
     touches_requirements = True
+    touches_dirstate = False
 
     def __init__(self):
         raise NotImplementedError()
@@ -355,6 +360,30 @@ class persistentnodemap(requirementformatvariant):
     upgrademessage = _(b'Speedup revision lookup by node id.')
 
 
+@registerformatvariant
+class dirstatetree(requirementformatvariant):
+    name = b'dirstate-tree'
+
+    _requirement = requirements.DIRSTATE_TREE_REQUIREMENT
+
+    default = False
+
+    description = _(
+        b'the whole dirstate is read and rewritten by each command using it'
+    )
+
+    upgrademessage = _(
+        b'dirstate will be read lazily and updated by appending the changes'
+    )
+
+    # upgrade only needs to change the requirements and the dirstate
+    touches_filelogs = False
+    touches_manifests = False
+    touches_changelog = False
+    touches_requirements = True
+    touches_dirstate = True
+
+
 @registerformatvariant
 class copiessdc(requirementformatvariant):
     name = b'copies-sdc'
@@ -710,6 +739,8 @@ class UpgradeOperation(object):
         self.touches_changelog = self._touches_changelog()
         # whether the operation touches requirements file or not
         self.touches_requirements = self._touches_requirements()
+        # whether the operation changes the format of the dirstate
+        self.touches_dirstate = self._touches_dirstate()
         self.touches_store = (
             self.touches_filelogs
             or self.touches_manifests
@@ -770,6 +801,15 @@ class UpgradeOperation(object):
 
         return False
 
+    def _touches_dirstate(self):
+        for a in self.upgrade_actions:
+            if a.touches_dirstate:
+                return True
+        for a in self.removed_actions:
+            if a.touches_dirstate:
+                return True
+        return False
+
     def _write_labeled(self, l, label):
         """
         Utility function to aid writing of a list under one label
@@ -914,6 +954,7 @@ def supportremovedrequirements(repo):
         requirements.SIDEDATA_REQUIREMENT,
         requirements.COPIESSDC_REQUIREMENT,
         requirements.NODEMAP_REQUIREMENT,
+        requirements.DIRSTATE_TREE_REQUIREMENT,
         requirements.SHARESAFE_REQUIREMENT,
     }
     for name in compression.compengines:
@@ -943,6 +984,7 @@ def supporteddestrequirements(repo):
         requirements.SIDEDATA_REQUIREMENT,
         requirements.COPIESSDC_REQUIREMENT,
         requirements.NODEMAP_REQUIREMENT,
+        requirements.DIRSTATE_TREE_REQUIREMENT,
         requirements.SHARESAFE_REQUIREMENT,
     }
     for name in compression.compengines:
@@ -972,6 +1014,7 @@ def allowednewrequirements(repo):
         requirements.SIDEDATA_REQUIREMENT,
         requirements.COPIESSDC_REQUIREMENT,
         requirements.NODEMAP_REQUIREMENT,
+        requirements.DIRSTATE_TREE_REQUIREMENT,
         requirements.SHARESAFE_REQUIREMENT,
     }
     for name in compression.compengines:
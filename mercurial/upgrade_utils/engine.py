@@ -11,6 +11,7 @@ import stat
 
 from ..i18n import _
 from ..pycompat import getattr
+from ..dirstateutils import docket as docketmod
 from .. import (
     changelog,
     error,
@@ -536,4 +537,20 @@ def upgrade(ui, srcrepo, dstrepo, upgrade_op):
         ui.status(_(b'upgrading repository requirements\n'))
         scmutil.writereporequirements(srcrepo, upgrade_op.new_requirements)
 
+    if upgrade_op.touches_dirstate:
+        upgrade_dirstate(ui, srcrepo, upgrade_op)
+
     return backuppath
+
+
+def upgrade_dirstate(ui, srcrepo, upgrade_op):
+    """rewrite the dirstate in the format of the new requirements"""
+    ui.status(_(b'upgrading dirstate format\n'))
+    use_tree = (
+        requirements.DIRSTATE_TREE_REQUIREMENT in upgrade_op.new_requirements
+    )
+    srcrepo.dirstate.setformat(use_tree)
+    srcrepo.dirstate.write(None)
+    if not use_tree:
+        # the data files of the tree format are no longer used
+        docketmod.cleanupdatafiles(srcrepo.vfs)
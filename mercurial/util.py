@@ -1890,6 +1890,28 @@ _hardlinkfswhitelist = {
     b'zfs',
 }
 
+# filesystems where every stat is a round trip to a server
+_networkfstypes = {
+    b'afpfs',
+    b'afs',
+    b'cifs',
+    b'coda',
+    b'ncp',
+    b'nfs',
+    b'smb',
+    b'smbfs',
+    b'v9fs',
+    b'webdav',
+}
+
+
+def isnetworkfs(path):
+    """return True if path is on a network filesystem (best-effort)"""
+    try:
+        return getfstype(path) in _networkfstypes
+    except OSError:
+        return False
+
 
 def copyfile(src, dest, hardlink=False, copystat=False, checkambig=False):
     """copy a file, preserving mode and optionally other stat info like
@@ -11,6 +11,8 @@ import os
 
 from .i18n import _
 from .node import (
+    bin,
+    hex,
     nullid,
     short,
 )
@@ -20,18 +22,90 @@ from . import (
     pycompat,
     revlog,
     util,
+    worker,
 )
+from .utils import stringutil
 
 VERIFY_DEFAULT = 0
 VERIFY_FULL = 1
 
+# number of filelogs handed at once to a verify worker
+_FILESPERTASK = 8
 
-def verify(repo, level=None):
+# cache file recording the state of the store after the last successful verify
+_WATERMARKFILE = b'verify-watermark-v1'
+
+
+def verify(repo, level=None, jobs=None, incremental=False):
     with repo.lock():
-        v = verifier(repo, level)
+        v = verifier(repo, level, jobs, incremental)
         return v.verify()
 
 
+def _revlogsizes(repo):
+    """return a {indexfile: size} mapping of the revlogs in the store
+
+    The size is the total size of the index and data files of the revlog.
+    """
+    sizes = {}
+    for f, f2, size in repo.store.walk():
+        if f and f[-2:] in (b'.i', b'.d'):
+            name = f[:-2] + b'.i'
+            sizes[name] = sizes.get(name, 0) + size
+    return sizes
+
+
+def _revlogmark(repo, name):
+    """return the (revcount, tipnode, dataend) triple of a store revlog"""
+    rl = revlog.revlog(repo.svfs, name)
+    count = len(rl)
+    if not count:
+        return 0, nullid, 0
+    return count, rl.node(count - 1), rl.end(count - 1)
+
+
+def _watermarkheader(repo):
+    # a format change rewrites every revlog
+    return b' '.join(sorted(repo.requirements))
+
+
+def _readwatermark(repo):
+    """read the state of the store recorded by the last successful verify
+
+    Returns a {indexfile: (revcount, tipnode, dataend, size)} mapping, or None
+    if nothing usable was recorded.
+    """
+    try:
+        lines = repo.cachevfs.read(_WATERMARKFILE).splitlines()
+    except (IOError, OSError):
+        return None
+    if not lines or lines[0] != _watermarkheader(repo):
+        return None
+    marks = {}
+    try:
+        for line in lines[1:]:
+            count, node, end, size, name = line.split(b' ', 4)
+            marks[name] = (int(count), bin(node), int(end), int(size))
+    except (ValueError, TypeError):
+        return None
+    return marks
+
+
+def _writewatermark(repo, marks):
+    try:
+        with repo.cachevfs(_WATERMARKFILE, b'w', atomictemp=True) as fp:
+            fp.write(_watermarkheader(repo) + b'\n')
+            for name, (count, node, end, size) in sorted(marks.items()):
+                fp.write(
+                    b'%d %s %d %d %s\n' % (count, hex(node), end, size, name)
+                )
+    except (IOError, OSError, error.Abort) as inst:
+        repo.ui.debug(
+            b"couldn't write verify watermark: %s\n"
+            % stringutil.forcebytestr(inst)
+        )
+
+
 def _normpath(f):
     # under hg < 2.4, convert didn't sanitize paths properly, so a
     # converted repo may contain repeated slashes
@@ -41,13 +115,23 @@ def _normpath(f):
 
 
 class verifier(object):
-    def __init__(self, repo, level=None):
+    def __init__(self, repo, level=None, jobs=None, incremental=False):
         self.repo = repo.unfiltered()
         self.ui = repo.ui
         self.match = repo.narrowmatch()
         if level is None:
             level = VERIFY_DEFAULT
         self._level = level
+        # number of worker processes checking the filelogs
+        self._jobs = jobs or 1
+        # issues found by a worker, replayed in order by the main process
+        self._records = None
+        # only check the revisions added since the last successful verify
+        self._incremental = incremental
+        # {indexfile: first revision to check} for an incremental verify
+        self._startrevs = {}
+        # files whose filelog changed since the last successful verify
+        self._changedfiles = set()
         self.badrevs = set()
         self.errors = 0
         self.warnings = 0
@@ -63,11 +147,17 @@ class verifier(object):
 
     def _warn(self, msg):
         """record a "warning" level issue"""
+        if self._records is not None:
+            self._records.append(('_warn', (msg,)))
+            return
         self.ui.warn(msg + b"\n")
         self.warnings += 1
 
     def _err(self, linkrev, msg, filename=None):
         """record a "error" level issue"""
+        if self._records is not None:
+            self._records.append(('_err', (linkrev, msg, filename)))
+            return
         if linkrev is not None:
             self.badrevs.add(linkrev)
             linkrev = b"%d" % linkrev
@@ -86,6 +176,114 @@ class verifier(object):
             fmsg = pycompat.byterepr(inst)
         self._err(linkrev, b"%s: %s" % (msg, fmsg), filename)
 
+    def _note(self, msg):
+        """display a message in verbose mode"""
+        if self._records is not None:
+            self._records.append(('_note', (msg,)))
+            return
+        self.ui.note(msg)
+
+    def _replay(self, records):
+        """report the issues recorded by a worker"""
+        for name, args in records:
+            getattr(self, name)(*args)
+
+    def _startrev(self, obj):
+        """return the first revision of `obj` that needs to be checked"""
+        return self._startrevs.get(getattr(obj, 'indexfile', None), 0)
+
+    def _checkedbefore(self, obj, node, startrev):
+        """tell if `node` is a revision of `obj` checked by a previous verify
+
+        `startrev` is the first revision of `obj` checked by this run.
+        """
+        if not startrev:
+            return False
+        try:
+            return obj.rev(node) < startrev
+        except error.StorageError:
+            return False
+
+    def _checkedfilenodes(self, f, nodes):
+        """tell if all `nodes` of `f` were checked by a previous verify"""
+        fl = self.repo.file(f)
+        startrev = self._startrev(fl)
+        return all(self._checkedbefore(fl, n, startrev) for n in nodes)
+
+    def _loadwatermark(self, sizes):
+        """prepare an incremental verify from the last successful one
+
+        `sizes` is the current {indexfile: size} mapping of the store.
+
+        Revlogs are append-only, so revisions already checked by the last
+        successful verify cannot have changed, unless the revlog was rewritten
+        (strip, censor, upgrade, ...). Rewritten revlogs are detected by
+        comparing their last checked revision and the end of its data with the
+        recorded ones.
+
+        Returns the recorded marks, or None if everything must be checked.
+        """
+        ui = self.ui
+        repo = self.repo
+        marks = _readwatermark(repo)
+        if marks is None:
+            ui.status(_(b"no previous verify recorded, checking everything\n"))
+            return None
+        startrevs = {}
+        changedfiles = set()
+        for name, size in pycompat.iteritems(sizes):
+            mark = marks.get(name)
+            if mark is not None and mark[3] == size:
+                startrevs[name] = mark[0]
+                continue
+            if mark is not None:
+                count, node, end = mark[:3]
+                try:
+                    rl = revlog.revlog(repo.svfs, name)
+                    rewritten = len(rl) < count or (
+                        count
+                        and (
+                            rl.node(count - 1) != node
+                            or rl.end(count - 1) != end
+                        )
+                    )
+                except error.StorageError:
+                    rewritten = True
+                if rewritten:
+                    break
+                startrevs[name] = count
+            if name.startswith(b'data/'):
+                changedfiles.add(name[5:-2])
+        else:
+            if all(name in sizes for name in marks):
+                self._startrevs = startrevs
+                self._changedfiles = changedfiles
+                return marks
+        ui.status(
+            _(
+                b"repository rewritten since the last verify, checking everything\n"
+            )
+        )
+        return None
+
+    def _savewatermark(self, sizes, marks):
+        """record the state of the store after a successful verify
+
+        `marks` are the ones recorded by the previous verify if this one was
+        incremental.
+        """
+        repo = self.repo
+        newmarks = {}
+        for name, size in pycompat.iteritems(sizes):
+            mark = marks.get(name) if marks is not None else None
+            if mark is None or mark[3] != size:
+                try:
+                    mark = _revlogmark(repo, name) + (size,)
+                except error.StorageError:
+                    continue
+            newmarks[name] = mark
+        _writewatermark(repo, newmarks)
+
     def _checkrevlog(self, obj, name, linkrev):
         """verify high level property of a revlog
 
@@ -110,7 +308,7 @@ class verifier(object):
         elif self.revlogv1:
             self._warn(_(b"warning: `%s' uses revlog format 0") % name)
 
-    def _checkentry(self, obj, i, node, seen, linkrevs, f):
+    def _checkentry(self, obj, i, node, seen, linkrevs, f, startrev=0):
         """verify a single revlog entry
 
         arguments are:
@@ -120,6 +318,8 @@ class verifier(object):
         - seen:     nodes previously seen for this revlog
         - linkrevs: [changelog-revisions] introducing "node"
         - f:        string label ("changelog", "manifest", or filename)
+        - startrev: first revision checked, earlier ones were checked by a
+                    previous verify
 
         Performs the following checks:
         - linkrev points to an existing changelog revision,
@@ -156,13 +356,22 @@ class verifier(object):
 
         try:
             p1, p2 = obj.parents(node)
-            if p1 not in seen and p1 != nullid:
+            checkedbefore = self._checkedbefore
+            if (
+                p1 not in seen
+                and p1 != nullid
+                and not checkedbefore(obj, p1, startrev)
+            ):
                 self._err(
                     lr,
                     _(b"unknown parent 1 %s of %s") % (short(p1), short(node)),
                     f,
                 )
-            if p2 not in seen and p2 != nullid:
+            if (
+                p2 not in seen
+                and p2 != nullid
+                and not checkedbefore(obj, p2, startrev)
+            ):
                 self._err(
                     lr,
                     _(b"unknown parent 2 %s of %s") % (short(p2), short(node)),
@@ -197,6 +406,13 @@ class verifier(object):
                 % (self.revlogv1 and 1 or 0)
             )
 
+        sizes = _revlogsizes(repo)
+        marks = None
+        if self._incremental:
+            marks = self._loadwatermark(sizes)
+            self._incremental = marks is not None
+        checked = len(repo.changelog) - self._startrev(repo.changelog)
+
         # data verification
         mflinkrevs, filelinkrevs = self._verifychangelog()
         filenodes = self._verifymanifest(mflinkrevs)
@@ -207,7 +423,7 @@ class verifier(object):
         # final report
         ui.status(
             _(b"checked %d changesets with %d changes to %d files\n")
-            % (len(repo.changelog), filerevisions, totalfiles)
+            % (checked, filerevisions, totalfiles)
         )
         if self.warnings:
             ui.warn(_(b"%d warnings encountered!\n") % self.warnings)
@@ -226,6 +442,7 @@ class verifier(object):
                     % min(self.badrevs)
                 )
             return 1
+        self._savewatermark(sizes, marks)
         return 0
 
     def _verifychangelog(self):
@@ -254,13 +471,14 @@ class verifier(object):
         filelinkrevs = {}
         seen = {}
         self._checkrevlog(cl, b"changelog", 0)
+        start = self._startrev(cl)
         progress = ui.makeprogress(
             _(b'checking'), unit=_(b'changesets'), total=len(repo)
         )
-        for i in repo:
+        for i in pycompat.xrange(start, len(cl)):
             progress.update(i)
             n = cl.node(i)
-            self._checkentry(cl, i, n, seen, [i], b"changelog")
+            self._checkentry(cl, i, n, seen, [i], b"changelog", start)
 
             try:
                 changes = cl.read(n)
@@ -329,14 +547,17 @@ class verifier(object):
             # Do not check manifest if there are only changelog entries with
             # null manifests.
             self._checkrevlog(mf, label, 0)
+        start = self._startrev(mf)
         progress = ui.makeprogress(
             _(b'checking'), unit=_(b'manifests'), total=len(mf)
         )
-        for i in mf:
+        for i in pycompat.xrange(start, len(mf)):
             if not dir:
                 progress.update(i)
             n = mf.node(i)
-            lr = self._checkentry(mf, i, n, seen, mflinkrevs.get(n, []), label)
+            lr = self._checkentry(
+                mf, i, n, seen, mflinkrevs.get(n, []), label, start
+            )
             if n in mflinkrevs:
                 del mflinkrevs[n]
             elif dir:
@@ -388,7 +609,13 @@ class verifier(object):
         if self.havemf:
             # since we delete entry in `mflinkrevs` during iteration, any
             # remaining entries are "missing". We need to issue errors for them.
-            changesetpairs = [(c, m) for m in mflinkrevs for c in mflinkrevs[m]]
+            # (new changesets can also use a manifest checked previously)
+            changesetpairs = [
+                (c, m)
+                for m in mflinkrevs
+                if not self._checkedbefore(mf, m, start)
+                for c in mflinkrevs[m]
+            ]
             for c, m in sorted(changesetpairs):
                 if dir:
                     self._err(
@@ -432,7 +659,7 @@ class verifier(object):
 
         if not dir and subdirnodes:
             subdirprogress.complete()
-            if self.warnorphanstorefiles:
+            if self.warnorphanstorefiles and not self._incremental:
                 for f in sorted(storefiles):
                     self._warn(_(b"warning: orphan data file '%s'") % f)
 
@@ -451,6 +678,10 @@ class verifier(object):
             for f in sorted(filelinkrevs):
                 progress.increment()
                 if f not in filenodes:
+                    if self._incremental and self._startrev(repo.file(f)):
+                        # the file was removed, or its entry only appears in
+                        # manifests checked by a previous verify
+                        continue
                     lr = filelinkrevs[f][0]
                     self._err(lr, _(b"in changeset but not in manifest"), f)
 
@@ -458,6 +689,10 @@ class verifier(object):
             for f in sorted(filenodes):
                 progress.increment()
                 if f not in filelinkrevs:
+                    if self._incremental and self._checkedfilenodes(
+                        f, filenodes[f]
+                    ):
+                        continue
                     try:
                         fl = repo.file(f)
                         lr = min([fl.linkrev(fl.rev(n)) for n in filenodes[f]])
@@ -470,9 +705,7 @@ class verifier(object):
     def _verifyfiles(self, filenodes, filelinkrevs):
         repo = self.repo
         ui = self.ui
-        lrugetctx = self.lrugetctx
         revlogv1 = self.revlogv1
-        havemf = self.havemf
         ui.status(_(b"checking files\n"))
 
         storefiles = set()
@@ -481,6 +714,7 @@ class verifier(object):
                 self._err(None, _(b"cannot decode filename '%s'") % f2)
             elif (size > 0 or not revlogv1) and f.startswith(b'data/'):
                 storefiles.add(_normpath(f))
+        self._storefiles = storefiles
 
         state = {
             # TODO this assumes revlog storage for changelog.
@@ -490,139 +724,182 @@ class verifier(object):
             b'erroroncensored': ui.config(b'censor', b'policy') == b'abort',
         }
 
-        files = sorted(set(filenodes) | set(filelinkrevs))
+        files = sorted(set(filenodes) | set(filelinkrevs) | self._changedfiles)
         revisions = 0
         progress = ui.makeprogress(
             _(b'checking'), unit=_(b'files'), total=len(files)
         )
-        for i, f in enumerate(files):
-            progress.update(i, item=f)
+        if self._jobs > 1 and pycompat.isposix and worker.ismainthread():
+            # Filelogs are independent from each other, they are checked by
+            # worker processes. Workers record the issues they find and the
+            # main process reports them in order, as a sequential run would.
+            results = worker.imap(
+                ui,
+                self._verifyfilesworker,
+                files,
+                staticargs=(filenodes, filelinkrevs, state),
+                threaded=False,
+                numworkers=self._jobs,
+                chunksize=_FILESPERTASK,
+            )
+            for f, filerevisions, records in results:
+                progress.increment(item=f)
+                self._replay(records)
+                revisions += filerevisions
+        else:
+            for i, f in enumerate(files):
+                progress.update(i, item=f)
+                revisions += self._verifyfile(f, filenodes, filelinkrevs, state)
+        progress.complete()
+
+        if self.warnorphanstorefiles and not self._incremental:
+            for f in sorted(storefiles):
+                self._warn(_(b"warning: orphan data file '%s'") % f)
+
+        return len(files), revisions
+
+    def _verifyfilesworker(self, filenodes, filelinkrevs, state, f):
+        """verify a filelog, recording the issues found instead of reporting
+        them"""
+        self._records = []
+        try:
+            revisions = self._verifyfile(f, filenodes, filelinkrevs, state)
+            return f, revisions, self._records
+        finally:
+            self._records = None
+
+    def _checkstorefiles(self, files):
+        """mark the store files of a filelog as known"""
+        if self._records is not None:
+            self._records.append(('_checkstorefiles', (files,)))
+            return
+        for ff in files:
             try:
-                linkrevs = filelinkrevs[f]
+                self._storefiles.remove(ff)
             except KeyError:
-                # in manifest but not in changelog
-                linkrevs = []
+                if self.warnorphanstorefiles:
+                    self._warn(_(b" warning: revlog '%s' not in fncache!") % ff)
+                    self.fncachewarned = True
 
-            if linkrevs:
-                lr = linkrevs[0]
-            else:
-                lr = None
+    def _verifyfile(self, f, filenodes, filelinkrevs, state):
+        """verify the filelog of `f`, return the number of revisions checked"""
+        repo = self.repo
+        ui = self.ui
+        lrugetctx = self.lrugetctx
+        havemf = self.havemf
+        revisions = 0
+        try:
+            linkrevs = filelinkrevs[f]
+        except KeyError:
+            # in manifest but not in changelog
+            linkrevs = []
 
-            try:
-                fl = repo.file(f)
-            except error.StorageError as e:
-                self._err(lr, _(b"broken revlog! (%s)") % e, f)
-                continue
+        if linkrevs:
+            lr = linkrevs[0]
+        else:
+            lr = None
 
-            for ff in fl.files():
-                try:
-                    storefiles.remove(ff)
-                except KeyError:
-                    if self.warnorphanstorefiles:
-                        self._warn(
-                            _(b" warning: revlog '%s' not in fncache!") % ff
-                        )
-                        self.fncachewarned = True
+        try:
+            fl = repo.file(f)
+        except error.StorageError as e:
+            self._err(lr, _(b"broken revlog! (%s)") % e, f)
+            return revisions
 
-            if not len(fl) and (self.havecl or self.havemf):
-                self._err(lr, _(b"empty or missing %s") % f)
-            else:
-                # Guard against implementations not setting this.
-                state[b'skipread'] = set()
-                state[b'safe_renamed'] = set()
+        self._checkstorefiles(fl.files())
+        start = self._startrev(fl)
 
-                for problem in fl.verifyintegrity(state):
-                    if problem.node is not None:
-                        linkrev = fl.linkrev(fl.rev(problem.node))
-                    else:
-                        linkrev = None
+        if not len(fl) and (self.havecl or self.havemf):
+            self._err(lr, _(b"empty or missing %s") % f)
+        else:
+            # Guard against implementations not setting this.
+            state[b'skipread'] = set()
+            state[b'safe_renamed'] = set()
+            state[b'startrev'] = start
+
+            for problem in fl.verifyintegrity(state):
+                if problem.node is not None:
+                    linkrev = fl.linkrev(fl.rev(problem.node))
+                else:
+                    linkrev = None
 
-                    if problem.warning:
-                        self._warn(problem.warning)
-                    elif problem.error:
-                        self._err(
-                            linkrev if linkrev is not None else lr,
-                            problem.error,
-                            f,
-                        )
-                    else:
-                        raise error.ProgrammingError(
-                            b'problem instance does not set warning or error '
-                            b'attribute: %s' % problem.msg
-                        )
+                if problem.warning:
+                    self._warn(problem.warning)
+                elif problem.error:
+                    self._err(
+                        linkrev if linkrev is not None else lr,
+                        problem.error,
+                        f,
+                    )
+                else:
+                    raise error.ProgrammingError(
+                        b'problem instance does not set warning or error '
+                        b'attribute: %s' % problem.msg
+                    )
 
-            seen = {}
-            for i in fl:
-                revisions += 1
-                n = fl.node(i)
-                lr = self._checkentry(fl, i, n, seen, linkrevs, f)
-                if f in filenodes:
-                    if havemf and n not in filenodes[f]:
-                        self._err(lr, _(b"%s not in manifests") % (short(n)), f)
-                    else:
-                        del filenodes[f][n]
+        seen = {}
+        for i in fl.revs(start=start):
+            revisions += 1
+            n = fl.node(i)
+            lr = self._checkentry(fl, i, n, seen, linkrevs, f, start)
+            if f in filenodes:
+                if havemf and n not in filenodes[f]:
+                    self._err(lr, _(b"%s not in manifests") % (short(n)), f)
+                else:
+                    del filenodes[f][n]
 
-                if n in state[b'skipread'] and n not in state[b'safe_renamed']:
-                    continue
+            if n in state[b'skipread'] and n not in state[b'safe_renamed']:
+                continue
 
-                # check renames
-                try:
-                    # This requires resolving fulltext (at least on revlogs,
-                    # though not with LFS revisions). We may want
-                    # ``verifyintegrity()`` to pass a set of nodes with
-                    # rename metadata as an optimization.
-                    rp = fl.renamed(n)
-                    if rp:
-                        if lr is not None and ui.verbose:
-                            ctx = lrugetctx(lr)
-                            if not any(rp[0] in pctx for pctx in ctx.parents()):
-                                self._warn(
-                                    _(
-                                        b"warning: copy source of '%s' not"
-                                        b" in parents of %s"
-                                    )
-                                    % (f, ctx)
-                                )
-                        fl2 = repo.file(rp[0])
-                        if not len(fl2):
-                            self._err(
-                                lr,
+            # check renames
+            try:
+                # This requires resolving fulltext (at least on revlogs,
+                # though not with LFS revisions). We may want
+                # ``verifyintegrity()`` to pass a set of nodes with
+                # rename metadata as an optimization.
+                rp = fl.renamed(n)
+                if rp:
+                    if lr is not None and ui.verbose:
+                        ctx = lrugetctx(lr)
+                        if not any(rp[0] in pctx for pctx in ctx.parents()):
+                            self._warn(
                                 _(
-                                    b"empty or missing copy source revlog "
-                                    b"%s:%s"
+                                    b"warning: copy source of '%s' not"
+                                    b" in parents of %s"
                                 )
-                                % (rp[0], short(rp[1])),
-                                f,
+                                % (f, ctx)
                             )
-                        elif rp[1] == nullid:
-                            ui.note(
-                                _(
-                                    b"warning: %s@%s: copy source"
-                                    b" revision is nullid %s:%s\n"
-                                )
-                                % (f, lr, rp[0], short(rp[1]))
+                    fl2 = repo.file(rp[0])
+                    if not len(fl2):
+                        self._err(
+                            lr,
+                            _(b"empty or missing copy source revlog %s:%s")
+                            % (rp[0], short(rp[1])),
+                            f,
+                        )
+                    elif rp[1] == nullid:
+                        self._note(
+                            _(
+                                b"warning: %s@%s: copy source"
+                                b" revision is nullid %s:%s\n"
                             )
-                        else:
-                            fl2.rev(rp[1])
-                except Exception as inst:
-                    self._exc(
-                        lr, _(b"checking rename of %s") % short(n), inst, f
-                    )
-
-            # cross-check
-            if f in filenodes:
-                fns = [(v, k) for k, v in pycompat.iteritems(filenodes[f])]
-                for lr, node in sorted(fns):
-                    self._err(
-                        lr,
-                        _(b"manifest refers to unknown revision %s")
-                        % short(node),
-                        f,
-                    )
-        progress.complete()
-
-        if self.warnorphanstorefiles:
-            for f in sorted(storefiles):
-                self._warn(_(b"warning: orphan data file '%s'") % f)
-
-        return len(files), revisions
+                            % (f, lr, rp[0], short(rp[1]))
+                        )
+                    else:
+                        fl2.rev(rp[1])
+            except Exception as inst:
+                self._exc(lr, _(b"checking rename of %s") % short(n), inst, f)
+
+        # cross-check
+        if f in filenodes:
+            fns = [
+                (v, k)
+                for k, v in pycompat.iteritems(filenodes[f])
+                if not self._checkedbefore(fl, k, start)
+            ]
+            for lr, node in sorted(fns):
+                self._err(
+                    lr,
+                    _(b"manifest refers to unknown revision %s") % short(node),
+                    f,
+                )
+        return revisions
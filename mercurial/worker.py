@@ -7,7 +7,9 @@
 
 from __future__ import absolute_import
 
+import collections
 import errno
+import itertools
 import os
 import signal
 import sys
@@ -171,26 +173,288 @@ def worker(
     return func(*staticargs + (args,))
 
 
-def _posixworker(ui, func, staticargs, args, hasretval):
-    workers = _numworkers(ui)
+def imap(
+    ui,
+    func,
+    tasks,
+    staticargs=(),
+    ordered=True,
+    threaded=None,
+    threadsafe=True,
+    numworkers=None,
+    chunksize=1,
+):
+    """run `func(*staticargs + (task,))` for each task, possibly in parallel
+
+    returns an iterator over the results
+
+    Unlike `worker()`, `tasks` can be any iterable. It is consumed lazily, as
+    workers become available, so that the caller can produce the tasks while
+    the workers process the previous ones, and a slow task does not hold back
+    the other workers. The number of tasks being processed or waiting to be
+    processed is bounded.
+
+    ordered - when True, results are yielded in the order of `tasks`.
+    Otherwise they are yielded as soon as they are available.
+
+    threaded - whether to use threads or worker processes. The default is to
+    use processes where fork() is available. Only threads are supported on
+    Windows. Tasks and results have to be picklable to be processed by worker
+    processes.
+
+    threadsafe - whether tasks can be executed using threads. Should be
+    disabled for CPU heavy tasks that don't release the GIL.
+
+    numworkers - number of workers, defaults to the `worker.numcpus` config.
+
+    chunksize - number of tasks sent at once to a worker process, to lower the
+    communication overhead of small tasks.
+    """
+    if numworkers is None:
+        numworkers = _numworkers(ui)
+    if threaded is None:
+        threaded = _platformworker is _windowsworker
+    elif not threaded and _platformworker is _windowsworker:
+        threaded = True
+    if not threaded and not ismainthread():
+        # The POSIX worker has to install a handler for SIGCHLD.
+        # Python up to 3.9 only allows this in the main thread.
+        threaded = True
+    enabled = ui.configbool(b'worker', b'enabled') and numworkers > 1
+    if threaded and not threadsafe and _DISALLOW_THREAD_UNSAFE:
+        enabled = False
+
+    if not enabled:
+        return (func(*staticargs + (task,)) for task in tasks)
+    if threaded:
+        return _threadimap(func, staticargs, tasks, ordered, numworkers)
+    return _posiximap(
+        ui, func, staticargs, tasks, ordered, numworkers, chunksize
+    )
+
+
+# number of pending tasks per worker thread
+_THREAD_BACKLOG = 4
+
+
+def _threadimap(func, staticargs, tasks, ordered, workers):
+    maxpending = workers * _THREAD_BACKLOG
+    futures = pycompat.futures
+    executor = futures.ThreadPoolExecutor(workers)
+    pending = collections.deque()
+    try:
+        for task in tasks:
+            pending.append(executor.submit(func, *staticargs + (task,)))
+            while len(pending) >= maxpending:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, notdone = futures.wait(
+                        pending, return_when=futures.FIRST_COMPLETED
+                    )
+                    pending = collections.deque(notdone)
+                    for f in done:
+                        yield f.result()
+        if ordered:
+            while pending:
+                yield pending.popleft().result()
+        else:
+            for f in futures.as_completed(pending):
+                yield f.result()
+            pending.clear()
+    finally:
+        # do not let the remaining tasks run when the consumer bails
+        for f in pending:
+            f.cancel()
+        executor.shutdown()
+
+
+def _chunks(tasks, chunksize):
+    tasks = iter(tasks)
+    while True:
+        chunk = list(itertools.islice(tasks, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _posixwriteall(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _posiximap(ui, func, staticargs, tasks, ordered, workers, chunksize):
+    chunks = _chunks(tasks, chunksize)
+    first = next(chunks, None)
+    second = next(chunks, None)
+    if second is None:
+        # a single chunk of work is not worth a worker process
+        for task in first or ():
+            yield func(*staticargs + (task,))
+        return
+    chunks = itertools.chain([first, second], chunks)
+
     oldhandler = signal.getsignal(signal.SIGINT)
     signal.signal(signal.SIGINT, signal.SIG_IGN)
-    pids, problem = set(), [0]
+    children = _posixchildren()
+    ui.flush()
+    selector = selectors.DefaultSelector()
+    # file descriptors of the parent side of the pipes, closed in children
+    parentfds = []
+    # worker -> sequence number of the chunk it is processing
+    busy = {}
+    idle = []
+    # results of the chunks received ahead of their turn, by sequence number
+    ahead = {}
+    # sequence number of the next chunk to be sent and yielded
+    state = {'sent': 0, 'yielded': 0, 'exhausted': False, 'lost': False}
+
+    def childsetup():
+        signal.signal(signal.SIGINT, oldhandler)
+        children.restorehandler()
+
+    def workerfunc(taskrfd, resultwfd):
+        for fd in parentfds:
+            os.close(fd)
+        reader = _blockingreader(os.fdopen(taskrfd, 'rb', 0))
+        while True:
+            chunk = util.pickle.load(reader)
+            if chunk is None:
+                return 0
+            seq, chunktasks = chunk
+            results = [func(*staticargs + (t,)) for t in chunktasks]
+            _posixwriteall(resultwfd, util.pickle.dumps((seq, results)))
+
+    def spawn():
+        taskrfd, taskwfd = os.pipe()
+        resultrfd, resultwfd = os.pipe()
+        parentfds.extend((taskwfd, resultrfd))
+        _posixfork(
+            ui,
+            children,
+            lambda: workerfunc(taskrfd, resultwfd),
+            childsetup,
+        )
+        os.close(taskrfd)
+        os.close(resultwfd)
+        resultfp = os.fdopen(resultrfd, 'rb', 0)
+        selector.register(resultfp, selectors.EVENT_READ, data=taskwfd)
+        return taskwfd
+
+    def send(taskwfd):
+        """give a chunk of tasks to a worker, or tell it to stop"""
+        # apply backpressure when the results have to be kept in order
+        if ordered and len(ahead) >= workers * 2:
+            idle.append(taskwfd)
+            return
+        chunk = None
+        if not state['exhausted']:
+            chunk = next(chunks, None)
+            state['exhausted'] = chunk is None
+        try:
+            if chunk is None:
+                _posixwriteall(taskwfd, util.pickle.dumps(None))
+                os.close(taskwfd)
+            else:
+                seq = state['sent']
+                state['sent'] += 1
+                busy[taskwfd] = seq
+                _posixwriteall(taskwfd, util.pickle.dumps((seq, chunk)))
+        except OSError as e:
+            # the worker died, the failure is reported by its exit status
+            if e.errno != errno.EPIPE:
+                raise
+
+    def cleanup():
+        signal.signal(signal.SIGINT, oldhandler)
+        children.wait()
+        children.restorehandler()
+        selector.close()
+        for fd in idle:
+            os.close(fd)
+        return children.problem
 
-    def killworkers():
+    try:
+        for i in pycompat.xrange(workers):
+            if state['exhausted']:
+                break
+            send(spawn())
+        while selector.get_map():
+            for key, events in selector.select():
+                taskwfd = key.data
+                try:
+                    seq, results = util.pickle.load(
+                        _blockingreader(key.fileobj)
+                    )
+                except EOFError:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    if busy.pop(taskwfd, None) is not None:
+                        # the worker died while processing tasks, its exit
+                        # status tells why
+                        state['lost'] = True
+                    continue
+                except IOError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                del busy[taskwfd]
+                if ordered:
+                    ahead[seq] = results
+                # keep the worker busy while the results are consumed
+                send(taskwfd)
+                if not ordered:
+                    for r in results:
+                        yield r
+                while ordered and state['yielded'] in ahead:
+                    for r in ahead.pop(state['yielded']):
+                        yield r
+                    state['yielded'] += 1
+                    while idle and len(ahead) < workers * 2:
+                        send(idle.pop())
+    except:  # re-raises
+        children.kill()
+        cleanup()
+        raise
+    status = cleanup()
+    if status:
+        if status < 0:
+            os.kill(os.getpid(), -status)
+        raise error.WorkerError(status)
+    if state['lost']:
+        raise error.WorkerError(255)
+
+
+class _posixchildren(object):
+    """track the worker processes, killing them all when one of them fails
+
+    ``problem`` is the first non-zero exit status of a worker.
+    """
+
+    def __init__(self):
+        self.pids = set()
+        self.problem = 0
+        self.oldchldhandler = signal.signal(signal.SIGCHLD, self._sigchld)
+
+    def restorehandler(self):
+        signal.signal(signal.SIGCHLD, self.oldchldhandler)
+
+    def kill(self):
         # unregister SIGCHLD handler as all children will be killed. This
         # function shouldn't be interrupted by another SIGCHLD; otherwise pids
         # could be updated while iterating, which would cause inconsistency.
-        signal.signal(signal.SIGCHLD, oldchldhandler)
+        self.restorehandler()
         # if one worker bails, there's no good reason to wait for the rest
-        for p in pids:
+        for p in self.pids:
             try:
                 os.kill(p, signal.SIGTERM)
             except OSError as err:
                 if err.errno != errno.ESRCH:
                     raise
 
-    def waitforworkers(blocking=True):
+    def wait(self, blocking=True):
+        pids = self.pids
         for pid in pids.copy():
             p = st = 0
             while True:
@@ -213,19 +477,65 @@ def _posixworker(ui, func, staticargs, args, hasretval):
                 continue
             pids.discard(p)
             st = _exitstatus(st)
-            if st and not problem[0]:
-                problem[0] = st
+            if st and not self.problem:
+                self.problem = st
 
-    def sigchldhandler(signum, frame):
-        waitforworkers(blocking=False)
-        if problem[0]:
-            killworkers()
+    def _sigchld(self, signum, frame):
+        self.wait(blocking=False)
+        if self.problem:
+            self.kill()
 
-    oldchldhandler = signal.signal(signal.SIGCHLD, sigchldhandler)
-    ui.flush()
+
+def _posixfork(ui, children, workerfunc, childsetup):
+    """fork a worker process running `workerfunc`, return its pid
+
+    `childsetup` is called first thing in the child process.
+    """
     parentpid = os.getpid()
+    # make sure we use os._exit in all worker code paths. otherwise the
+    # worker may do some clean-ups which could cause surprises like
+    # deadlock. see sshpeer.cleanup for example.
+    # override error handling *before* fork. this is necessary because
+    # exception (signal) may arrive after fork, before "pid =" assignment
+    # completes, and other exception handler (dispatch.py) can lead to
+    # unexpected code path without os._exit.
+    ret = -1
+    try:
+        pid = os.fork()
+        if pid == 0:
+            childsetup()
+            ret = scmutil.callcatch(ui, workerfunc)
+    except:  # parent re-raises, child never returns
+        if os.getpid() == parentpid:
+            raise
+        exctype = sys.exc_info()[0]
+        force = not issubclass(exctype, KeyboardInterrupt)
+        ui.traceback(force=force)
+    finally:
+        if os.getpid() != parentpid:
+            try:
+                ui.flush()
+            except:  # never returns, no re-raises
+                pass
+            finally:
+                os._exit(ret & 255)
+    children.pids.add(pid)
+    return pid
+
+
+def _posixworker(ui, func, staticargs, args, hasretval):
+    workers = _numworkers(ui)
+    oldhandler = signal.getsignal(signal.SIGINT)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    children = _posixchildren()
+    ui.flush()
     pipes = []
     retval = {}
+
+    def childsetup():
+        signal.signal(signal.SIGINT, oldhandler)
+        children.restorehandler()
+
     for pargs in partition(args, min(workers, len(args))):
         # Every worker gets its own pipe to send results on, so we don't have to
         # implement atomic writes larger than PIPE_BUF. Each forked process has
@@ -234,45 +544,17 @@ def _posixworker(ui, func, staticargs, args, hasretval):
         # care what order they're in).
         rfd, wfd = os.pipe()
         pipes.append((rfd, wfd))
-        # make sure we use os._exit in all worker code paths. otherwise the
-        # worker may do some clean-ups which could cause surprises like
-        # deadlock. see sshpeer.cleanup for example.
-        # override error handling *before* fork. this is necessary because
-        # exception (signal) may arrive after fork, before "pid =" assignment
-        # completes, and other exception handler (dispatch.py) can lead to
-        # unexpected code path without os._exit.
-        ret = -1
-        try:
-            pid = os.fork()
-            if pid == 0:
-                signal.signal(signal.SIGINT, oldhandler)
-                signal.signal(signal.SIGCHLD, oldchldhandler)
-
-                def workerfunc():
-                    for r, w in pipes[:-1]:
-                        os.close(r)
-                        os.close(w)
-                    os.close(rfd)
-                    for result in func(*(staticargs + (pargs,))):
-                        os.write(wfd, util.pickle.dumps(result))
-                    return 0
-
-                ret = scmutil.callcatch(ui, workerfunc)
-        except:  # parent re-raises, child never returns
-            if os.getpid() == parentpid:
-                raise
-            exctype = sys.exc_info()[0]
-            force = not issubclass(exctype, KeyboardInterrupt)
-            ui.traceback(force=force)
-        finally:
-            if os.getpid() != parentpid:
-                try:
-                    ui.flush()
-                except:  # never returns, no re-raises
-                    pass
-                finally:
-                    os._exit(ret & 255)
-        pids.add(pid)
+
+        def workerfunc(rfd=rfd, wfd=wfd, pargs=pargs):
+            for r, w in pipes[:-1]:
+                os.close(r)
+                os.close(w)
+            os.close(rfd)
+            for result in func(*(staticargs + (pargs,))):
+                os.write(wfd, util.pickle.dumps(result))
+            return 0
+
+        _posixfork(ui, children, workerfunc, childsetup)
     selector = selectors.DefaultSelector()
     for rfd, wfd in pipes:
         os.close(wfd)
@@ -280,10 +562,10 @@ def _posixworker(ui, func, staticargs, args, hasretval):
 
     def cleanup():
         signal.signal(signal.SIGINT, oldhandler)
-        waitforworkers()
-        signal.signal(signal.SIGCHLD, oldchldhandler)
+        children.wait()
+        children.restorehandler()
         selector.close()
-        return problem[0]
+        return children.problem
 
     try:
         openpipes = len(pipes)
@@ -304,7 +586,7 @@ def _posixworker(ui, func, staticargs, args, hasretval):
                         continue
                     raise
     except:  # re-raises
-        killworkers()
+        children.kill()
         cleanup()
         raise
     status = cleanup()
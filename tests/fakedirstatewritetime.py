@@ -72,6 +72,12 @@ def fakewrite(ui, func):
         )
         dirstate.dirstatemap.write = wrapper
 
+    # The tree format does not use pack_dirstate either
+    orig_dirstatetreemap_write = dirstate.dirstatetreemap.write
+    dirstate.dirstatetreemap.write = (
+        lambda self, st, now: orig_dirstatetreemap_write(self, st, fakenow)
+    )
+
     orig_dirstate_getfsnow = dirstate._getfsnow
     wrapper = lambda *args: pack_dirstate(fakenow, orig_pack_dirstate, *args)
 
@@ -87,6 +93,7 @@ def fakewrite(ui, func):
         dirstate._getfsnow = orig_dirstate_getfsnow
         if rustmod is not None:
             dirstate.dirstatemap.write = orig_dirstatemap_write
+        dirstate.dirstatetreemap.write = orig_dirstatetreemap_write
 
 
 def _poststatusfixup(orig, workingctx, status, fixup):
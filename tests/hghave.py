@@ -477,6 +477,19 @@ def has_symlink():
         return False
 
 
+@check("inotify", "Linux inotify")
+def has_inotify():
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import ctypes
+
+        libc = ctypes.CDLL(None)
+        return bool(libc.inotify_init1)
+    except (ImportError, OSError, AttributeError):
+        return False
+
+
 @check("hardlink", "hardlinks")
 def has_hardlink():
     from mercurial import util
@@ -0,0 +1,113 @@
+=============================
+Test the binary branch cache
+=============================
+
+  $ cat >> $HGRCPATH << EOF
+  > [experimental]
+  > branchmap.binary = yes
+  > [extensions]
+  > strip =
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ for b in a b c d; do
+  >   hg branch -q $b
+  >   echo $b > $b
+  >   hg commit -qAm $b
+  > done
+  $ hg up -q a
+  $ echo a >> a
+  $ hg commit -qm a2
+  $ hg branches
+  a                              4:* (glob)
+  d                              3:* (glob)
+  c                              2:* (glob)
+  b                              1:* (glob)
+  $ ls .hg/cache | grep branch
+  branch3-served
+  $ f --size .hg/cache/branch3-served
+  .hg/cache/branch3-served: size=185
+
+The branches changed by a transaction are appended
+
+  $ echo a >> a
+  $ hg commit -qm a3 --close-branch
+  $ f --size .hg/cache/branch3-served
+  .hg/cache/branch3-served: size=253
+  $ hg branches -c
+  d                              3:* (glob)
+  a                              5:* (closed) (glob)
+  c                              2:* (glob)
+  b                              1:* (glob)
+
+Looking up a branch only decodes its heads, from the last record mentioning
+it
+
+  $ cat > $TESTTMP/lookup.py << EOF
+  > from mercurial import registrar
+  > cmdtable = {}
+  > command = registrar.command(cmdtable)
+  > @command(b'branchlookup', [], b'LABEL...')
+  > def branchlookup(ui, repo, *labels):
+  >     bmap = repo.branchmap()
+  >     for label in labels:
+  >         ui.write(b'%s: %d\n' % (label, bmap.hasbranch(label)))
+  >     ui.write(b'%d decoded\n' % len(bmap._entries))
+  >     ui.write(b'%d heads\n' % len(bmap.branchheads(labels[0], closed=True)))
+  > EOF
+  $ hg branchlookup a b unknown --config extensions.lookup=$TESTTMP/lookup.py
+  a: 1
+  b: 1
+  unknown: 0
+  2 decoded
+  1 heads
+
+The whole file is written again once the appended records are too large
+
+  $ hg up -q b
+  $ echo b >> b
+  $ hg commit -qm b2
+  $ f --size .hg/cache/branch3-served
+  .hg/cache/branch3-served: size=117
+
+The heads match the ones computed without cache
+
+  $ hg heads -T '{rev} {branch}\n' --config experimental.branchmap.binary=no
+  6 b
+  3 d
+  2 c
+  $ hg heads -T '{rev} {branch}\n'
+  6 b
+  3 d
+  2 c
+
+An interrupted append is ignored
+
+  $ printf 'garbage' >> .hg/cache/branch3-served
+  $ hg heads -T '{rev} {branch}\n' --debug
+  6 b
+  3 d
+  2 c
+  $ hg up -q c
+  $ echo c >> c
+  $ hg commit -qm c2
+  $ hg heads -T '{rev} {branch}\n' --debug
+  7 c
+  6 b
+  3 d
+
+An invalid cache is computed again
+
+  $ "$PYTHON" -c "open('.hg/cache/branch3-served', 'wb').write(b'\0\0\0\1')"
+  $ hg heads -T '{rev} {branch}\n' --debug
+  invalid branch cache (served): unknown version
+  7 c
+  6 b
+  3 d
+  $ hg strip -q 7
+  $ hg heads -T '{rev} {branch}\n' --debug
+  invalid branch cache (served): tip differs
+  6 b
+  3 d
+  2 c
@@ -374,7 +374,7 @@ Show all commands + options
   unbundle: update
   unshelve: abort, continue, interactive, keep, name, tool, date
   update: clean, check, merge, date, rev, tool
-  verify: full
+  verify: full, jobs, incremental
   version: template
 
   $ hg init a
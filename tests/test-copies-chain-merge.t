@@ -700,6 +700,7 @@ We upgrade a repository that is not using sidedata (the filelog case) and
   sparserevlog:       yes    yes     yes
   sidedata:            no    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no    yes      no
   plain-cl-delta:     yes    yes     yes
   compression:        * (glob)
@@ -41,6 +41,7 @@ Check that copies are recorded correctly
   sparserevlog:       yes    yes     yes
   sidedata:           yes    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:         yes    yes      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -55,6 +56,7 @@ Check that copies are recorded correctly
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -426,6 +428,7 @@ downgrading (keeping some sidedata)
   sparserevlog:       yes    yes     yes
   sidedata:           yes    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:         yes    yes      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -452,6 +455,7 @@ downgrading (keeping some sidedata)
   sparserevlog:       yes    yes     yes
   sidedata:           yes    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -480,6 +484,7 @@ upgrading
   sparserevlog:       yes    yes     yes
   sidedata:           yes    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:         yes    yes      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
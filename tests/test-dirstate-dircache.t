@@ -0,0 +1,101 @@
+=====================================
+Test the cache of directories content
+=====================================
+
+  $ cat >> $HGRCPATH << EOF
+  > [experimental]
+  > dirstate.dircache = yes
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ mkdir -p dir/subdir other ignored
+  $ echo a > dir/subdir/a
+  $ echo b > dir/b
+  $ echo c > other/c
+  $ echo i > ignored/i
+  $ echo 'ignored/i' > .hgignore
+  $ hg add -q
+  $ hg commit -qm initial
+
+Directories holding only tracked files are cached
+
+  $ touch -t 200001010000 . dir dir/subdir other ignored
+  $ hg status
+  $ cat .hg/dirstate-dircache
+  dircache-v1
+  946684800 
+  d.hg
+  f.hgignore
+  ddir
+  dignored
+  dother
+  
+  946684800 dir
+  fb
+  dsubdir
+  
+  946684800 dir/subdir
+  fa
+  
+  946684800 other
+  fc
+  
+
+Changes in the working copy are still detected
+
+  $ echo aa > dir/subdir/a
+  $ rm other/c
+  $ hg status
+  M dir/subdir/a
+  ! other/c
+  $ hg revert -q other/c
+
+  $ echo u > dir/unknown
+  $ hg status
+  M dir/subdir/a
+  ? dir/unknown
+  $ grep -c '^946684800 dir$' .hg/dirstate-dircache
+  0
+  [1]
+
+  $ echo new > dir/subdir/new
+  $ hg add dir/subdir/new
+  $ touch -t 200001010001 dir/subdir
+  $ hg status
+  M dir/subdir/a
+  A dir/subdir/new
+  ? dir/unknown
+  $ grep 'dir/subdir$' .hg/dirstate-dircache
+  946684860 dir/subdir
+
+A file no longer tracked is reported even if the directory did not change
+
+  $ hg forget dir/subdir/new
+  $ hg status
+  M dir/subdir/a
+  ? dir/subdir/new
+  ? dir/unknown
+
+Ignore rules are evaluated again
+
+  $ echo 'dir/subdir' >> .hgignore
+  $ hg status
+  M .hgignore
+  M dir/subdir/a
+  ? dir/unknown
+  $ hg status --ignored
+  I dir/subdir/new
+  I ignored/i
+
+Removed directories are forgotten
+
+  $ rm -r other
+  $ hg status
+  M .hgignore
+  M dir/subdir/a
+  ! other/c
+  ? dir/unknown
+  $ grep -c other .hg/dirstate-dircache
+  0
+  [1]
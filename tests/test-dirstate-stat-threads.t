@@ -0,0 +1,60 @@
+====================================================
+Test stat'ing the files of the dirstate from threads
+====================================================
+
+  $ hg init repo
+  $ cd repo
+  $ mkdir -p dir/subdir other
+  $ for i in 1 2 3 4 5 6 7 8 9; do
+  >   echo $i > dir/f$i
+  >   echo $i > dir/subdir/f$i
+  >   echo $i > other/f$i
+  > done
+  $ hg add -q
+  $ hg commit -qm initial
+
+  $ echo changed > dir/f1
+  $ echo changed and bigger > dir/subdir/f2
+  $ rm other/f3
+  $ rm dir/f4
+  $ mkdir dir/f4
+  $ hg rm -q dir/subdir/f5
+  $ echo new > other/new
+  $ hg add other/new
+
+The files not visited while walking are stat'ed from threads when not listing
+unknown files, the result does not depend on the number of threads
+
+  $ hg status -mard --config experimental.dirstate.stat-threads=0 > ../serial
+  $ cat ../serial
+  M dir/f1
+  M dir/subdir/f2
+  A other/new
+  R dir/subdir/f5
+  ! dir/f4
+  ! other/f3
+  $ for t in 2 3 8 100; do
+  >   hg status -mard --config experimental.dirstate.stat-threads=$t | cmp - ../serial
+  > done
+
+  $ hg status -mard --config experimental.dirstate.stat-threads=4 dir
+  M dir/f1
+  M dir/subdir/f2
+  R dir/subdir/f5
+  ! dir/f4
+
+#if symlink
+  $ ln -s f6 dir/link
+  $ hg add dir/link
+  $ rm dir/f7
+  $ ln -s f8 dir/f7
+  $ hg status -mard --config experimental.dirstate.stat-threads=4
+  M dir/f1
+  M dir/f7
+  M dir/subdir/f2
+  A dir/link
+  A other/new
+  R dir/subdir/f5
+  ! dir/f4
+  ! other/f3
+#endif
@@ -0,0 +1,190 @@
+===================================
+Test the tree format of the dirstate
+===================================
+
+  $ cat << EOF >> $HGRCPATH
+  > [format]
+  > exp-use-dirstate-tree=yes
+  > EOF
+
+  $ dirstate() {
+  >   hg debugstate --no-dates | awk '{print $1, $2, $3, $NF}'
+  > }
+
+  $ datafile() {
+  >   echo .hg/dirstate.`tail -c 16 .hg/dirstate`
+  > }
+
+  $ hg init test-repo
+  $ cd test-repo
+  $ grep dirstate .hg/requires
+  exp-dirstate-tree-v1
+  $ hg debugformat | grep dirstate-tree
+  dirstate-tree:      yes
+
+  $ mkdir -p dir/subdir other
+  $ echo a > dir/subdir/a
+  $ echo b > dir/b
+  $ echo c > other/c
+  $ echo d > d
+  $ hg add -q
+  $ hg status
+  A d
+  A dir/b
+  A dir/subdir/a
+  A other/c
+  $ hg commit -m 'initial'
+  $ hg status
+  $ dirstate
+  n 644 2 d
+  n 644 2 dir/b
+  n 644 2 dir/subdir/a
+  n 644 2 other/c
+
+The dirstate file is a small docket pointing to a data file
+
+  $ f --size .hg/dirstate
+  .hg/dirstate: size=126
+  $ f --size `datafile`
+  .hg/dirstate.*: size=* (glob)
+
+Recording changes
+
+  $ echo aa >> dir/subdir/a
+  $ hg cp d dir/d2
+  $ hg remove other/c
+  $ hg status -C
+  M dir/subdir/a
+  A dir/d2
+    d
+  R other/c
+  $ dirstate
+  n 644 2 d
+  n 644 2 dir/b
+  a 0 -1 dir/d2
+  n 644 2 dir/subdir/a
+  r 0 0 other/c
+  copy: d -> dir/d2
+  $ hg files dir
+  dir/b
+  dir/d2
+  dir/subdir/a
+  $ hg commit -m 'changes'
+  $ hg status
+  $ dirstate
+  n 644 2 d
+  n 644 2 dir/b
+  n 644 2 dir/d2
+  n 644 5 dir/subdir/a
+
+The data file is eventually written again from scratch
+
+  $ for i in 1 2 3 4 5 6 7 8; do
+  >   echo $i >> dir/b
+  >   hg commit -q -m "change $i"
+  > done
+  $ hg status
+  $ dirstate
+  n 644 2 d
+  n 644 18 dir/b
+  n 644 2 dir/d2
+  n 644 5 dir/subdir/a
+
+Rollback restores the previous docket
+
+  $ hg update -q 0
+  $ dirstate
+  n 644 2 d
+  n 644 2 dir/b
+  n 644 2 dir/subdir/a
+  n 644 2 other/c
+  $ echo e > e
+  $ hg add e
+  $ hg commit -q -m 'new head'
+  $ hg rollback -q
+  $ hg status
+  A e
+  $ hg revert -q e
+  $ rm e
+
+A damaged data file is detected
+
+  $ mv `datafile` ../datafile
+  $ hg status
+  abort: working directory state appears damaged!
+  [255]
+  $ mv ../datafile `datafile`
+  $ hg status
+
+Upgrading and downgrading
+-------------------------
+
+  $ hg debugupgraderepo --run --quiet --config format.exp-use-dirstate-tree=no
+  upgrade will perform the following actions:
+  
+  requirements
+     preserved: dotencode, fncache, generaldelta, revlogv1, sparserevlog, store
+     removed: exp-dirstate-tree-v1
+  
+  processed revlogs:
+    - all-filelogs
+    - changelog
+    - manifest
+  
+
+
+
+  $ grep dirstate .hg/requires
+  [1]
+
+The data file used by the backup of the dirstate of the last transaction is
+kept
+
+  $ ls .hg | grep 'dirstate\.'
+  dirstate.* (glob)
+  $ hg status
+  $ dirstate
+  n 644 2 d
+  n 644 2 dir/b
+  n 644 2 dir/subdir/a
+  n 644 2 other/c
+
+  $ hg debugupgraderepo --run --quiet
+  upgrade will perform the following actions:
+  
+  requirements
+     preserved: dotencode, fncache, generaldelta, revlogv1, sparserevlog, store
+     added: exp-dirstate-tree-v1
+  
+  processed revlogs:
+    - all-filelogs
+    - changelog
+    - manifest
+  
+
+
+
+  $ grep dirstate .hg/requires
+  exp-dirstate-tree-v1
+  $ ls .hg | grep 'dirstate\.'
+  dirstate.* (glob)
+  dirstate.* (glob)
+
+Changes are appended to the data file
+
+  $ datafile > ../before
+  $ f --size `datafile`
+  .hg/dirstate.*: size=375 (glob)
+  $ echo e > e
+  $ hg add e
+  $ datafile | cmp - ../before
+  $ f --size `datafile`
+  .hg/dirstate.*: size=580 (glob)
+  $ hg revert -q e
+  $ rm e
+  $ hg status
+  $ dirstate
+  n 644 2 d
+  n 644 2 dir/b
+  n 644 2 dir/subdir/a
+  n 644 2 other/c
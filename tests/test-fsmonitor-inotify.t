@@ -0,0 +1,83 @@
+#require inotify
+
+===========================================
+Test the inotify file monitor for fsmonitor
+===========================================
+
+  $ cat >> $HGRCPATH << EOF
+  > [extensions]
+  > fsmonitor =
+  > [fsmonitor]
+  > backend = inotify
+  > timeout = 10
+  > inotify-idle-timeout = 300
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ mkdir -p dir/subdir other
+  $ echo a > dir/a
+  $ echo b > dir/subdir/b
+  $ echo c > other/c
+  $ echo d > d
+  $ echo 'ignored' > .hgignore
+  $ hg add -q
+  $ hg commit -qm initial
+
+The daemon is started by the first status
+
+  $ hg status
+  $ cat .hg/fsmonitor-inotify.pid >> $DAEMON_PIDS
+  $ hg status --debug | grep '^fsmonitor:'
+  fsmonitor: 0 files changed since the last status
+
+Only the changed files are reported
+
+  $ echo aa >> dir/a
+  $ echo new > dir/subdir/new
+  $ rm other/c
+  $ echo i > ignored
+  $ hg status --debug
+  fsmonitor: 4 files changed since the last status
+  M dir/a
+  ! other/c
+  ? dir/subdir/new
+
+The content of new or moved directories is reported
+
+  $ mkdir -p new/subdir
+  $ echo f > new/subdir/f
+  $ mv dir moved
+  $ hg status --debug
+  fsmonitor: 9 files changed since the last status
+  ! dir/a
+  ! dir/subdir/b
+  ! other/c
+  ? moved/a
+  ? moved/subdir/b
+  ? moved/subdir/new
+  ? new/subdir/f
+  $ mv moved dir
+  $ echo g > dir/subdir/g
+  $ rm -r new
+  $ hg status --debug
+  fsmonitor: 12 files changed since the last status
+  M dir/a
+  ! other/c
+  ? dir/subdir/g
+  ? dir/subdir/new
+
+The result is the same as without fsmonitor
+
+  $ hg status --config extensions.fsmonitor=!
+  M dir/a
+  ! other/c
+  ? dir/subdir/g
+  ? dir/subdir/new
+
+The daemon can be stopped
+
+  $ hg debuginotify --stop
+  $ hg debuginotify --stop
+  no inotify daemon is running
+  [1]
@@ -622,10 +622,20 @@ Test command without options
       Please see https://mercurial-scm.org/wiki/RepositoryCorruption for more
       information about recovery from corruption of the repository.
   
+      With --jobs, files are checked by several processes in parallel. Issues
+      are reported in the same order as with a sequential check.
+  
+      With --incremental, only the data added since the last successful verify
+      is checked. Everything is checked if no previous verify was recorded or if
+      the repository was rewritten since then (strip, censor, upgrade, ...).
+  
       Returns 0 on success, 1 if errors are encountered.
   
   options:
   
+    --jobs NUM    number of processes checking files in parallel
+    --incremental only check data added since the last successful verify
+  
   (some details hidden, use --verbose to show complete help)
 
   $ hg help diff
@@ -0,0 +1,87 @@
+==========================================
+Test the cache of the ignored file patterns
+==========================================
+
+  $ cat >> $HGRCPATH << EOF
+  > [experimental]
+  > dirstate.ignorecache = yes
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ cat > .hgignore << EOF
+  > syntax: glob
+  > *.o
+  > build
+  > rootglob:doc/index.html
+  > include:ignore.extra
+  > syntax: regexp
+  > \.orig$
+  > ^tmp-[0-9]+
+  > EOF
+  $ echo 'glob:*.log' > ignore.extra
+  $ mkdir -p src/build doc
+  $ touch a.o src/b.o src/build/c src/build.c doc/index.html doc/other.html
+  $ touch a.orig a.org tmp-1 tmp-a x.log
+  $ hg status
+  ? .hgignore
+  ? a.org
+  ? doc/other.html
+  ? ignore.extra
+  ? src/build.c
+  ? tmp-a
+
+The patterns are read from the cache
+
+  $ f --size .hg/dirstate-ignorecache
+  .hg/dirstate-ignorecache: size=* (glob)
+  $ hg status --ignored
+  I a.o
+  I a.orig
+  I doc/index.html
+  I src/b.o
+  I src/build/c
+  I tmp-1
+  I x.log
+  $ hg debugignore
+  <includematcher includes='.*\\.o(?:/|$)|(?:|.*/)build(?:/|$)|doc/index\\.html(?:/|$)|.*\\.log(?:/|$)|.*\\.orig$|^tmp-[0-9]+'>
+  $ hg debugignore --config experimental.dirstate.ignorecache=no
+  <includematcher includes='.*\\.o(?:/|$)|(?:|.*/)build(?:/|$)|doc/index\\.html(?:/|$)|.*\\.log(?:/|$)|.*\\.orig$|^tmp-[0-9]+'>
+
+A change to an included file is noticed
+
+  $ echo 'glob:*.html' >> ignore.extra
+  $ hg status
+  ? .hgignore
+  ? a.org
+  ? ignore.extra
+  ? src/build.c
+  ? tmp-a
+
+So are other ignore files
+
+  $ echo 'tmp-a' > ../extra
+  $ hg status --config ui.ignore.extra=../extra
+  ? .hgignore
+  ? a.org
+  ? ignore.extra
+  ? src/build.c
+  $ hg status
+  ? .hgignore
+  ? a.org
+  ? ignore.extra
+  ? src/build.c
+  ? tmp-a
+
+Invalid patterns are still reported
+
+  $ echo 're:[' >> ignore.extra
+  $ hg status
+  abort: ignore.extra: invalid pattern (relre): [
+  [255]
+  $ hg status
+  abort: ignore.extra: invalid pattern (relre): [
+  [255]
+  $ hg status --config experimental.dirstate.ignorecache=no
+  abort: ignore.extra: invalid pattern (relre): [
+  [255]
@@ -0,0 +1,87 @@
+Test the on-disk store of manifest fulltexts
+
+  $ cat << EOF > verbosemanifest.py
+  > # extension reporting manifests restored from the revlog
+  > 
+  > from __future__ import absolute_import
+  > 
+  > from mercurial import (
+  >     extensions,
+  >     manifest,
+  >     node,
+  > )
+  > 
+  > def extsetup(ui):
+  >     def revision(orig, self, nodeorrev, *args, **kwargs):
+  >         ui.write(b"restoring manifest %s\n" % node.short(nodeorrev))
+  >         return orig(self, nodeorrev, *args, **kwargs)
+  > 
+  >     extensions.wrapfunction(manifest.manifestrevlog, 'revision', revision)
+  > EOF
+  $ cat << EOF >> $HGRCPATH
+  > [storage]
+  > manifest.fulltext-store.size = 1KB
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ for i in 0 1 2; do
+  >   echo $i > file$i
+  >   hg commit -qAm $i
+  > done
+  $ hg debugmanifestfulltextcache | tail -1
+  fulltext store contains 3 manifest entries, 354 bytes of 1.00 KB
+  $ ls .hg/wcache | grep fulltextstore
+  manifestfulltextstore
+  manifestfulltextstore.idx
+
+Manifests are read from the store rather than restored from the revlog
+
+  $ hg files -r 1 --config extensions.verbosemanifest=$TESTTMP/verbosemanifest.py
+  file0
+  file1
+  $ hg debugmanifestfulltextcache --clear
+  $ hg files -r 1 --config extensions.verbosemanifest=$TESTTMP/verbosemanifest.py
+  restoring manifest d22d7be75f30
+  file0
+  file1
+
+Manifests restored while holding the working copy lock are recorded
+
+  $ hg up -q 0 --config extensions.verbosemanifest=$TESTTMP/verbosemanifest.py
+  restoring manifest * (glob)
+  restoring manifest * (glob)
+  $ hg debugmanifestfulltextcache | tail -1
+  fulltext store contains 2 manifest entries, 236 bytes of 1.00 KB
+  $ hg files -r 0 --config extensions.verbosemanifest=$TESTTMP/verbosemanifest.py
+  file0
+
+The store is rewritten with the most recent entries once full
+
+  $ hg up -q tip
+  $ for i in 3 4 5 6 7 8 9; do
+  >   echo $i > file$i
+  >   hg commit -qAm $i
+  > done
+  $ hg debugmanifestfulltextcache | tail -1
+  fulltext store contains 2 manifest entries, 941 bytes of 1.00 KB
+  $ hg files -r tip --config extensions.verbosemanifest=$TESTTMP/verbosemanifest.py
+  file0
+  file1
+  file2
+  file3
+  file4
+  file5
+  file6
+  file7
+  file8
+  file9
+
+A corrupted store is ignored
+
+  $ rm .hg/wcache/manifestfulltextcache
+  $ echo garbage > .hg/wcache/manifestfulltextstore
+  $ hg files -r tip --config extensions.verbosemanifest=$TESTTMP/verbosemanifest.py | head -1
+  restoring manifest * (glob)
+
+  $ cd ..
@@ -73,8 +73,7 @@ class PatternMatcherTests(unittest.TestCase):
         self.assertTrue(m.visitdir(b''))
         self.assertTrue(m.visitdir(b'dir'))
         self.assertEqual(m.visitdir(b'dir/subdir'), b'all')
-        # OPT: This should probably be 'all' if its parent is?
-        self.assertTrue(m.visitdir(b'dir/subdir/x'))
+        self.assertEqual(m.visitdir(b'dir/subdir/x'), b'all')
         self.assertFalse(m.visitdir(b'folder'))
 
     def testVisitchildrensetPrefix(self):
@@ -82,11 +81,10 @@ class PatternMatcherTests(unittest.TestCase):
             util.localpath(b'/repo'), b'', patterns=[b'path:dir/subdir']
         )
         assert isinstance(m, matchmod.patternmatcher)
-        self.assertEqual(m.visitchildrenset(b''), b'this')
-        self.assertEqual(m.visitchildrenset(b'dir'), b'this')
+        self.assertEqual(m.visitchildrenset(b''), {b'dir'})
+        self.assertEqual(m.visitchildrenset(b'dir'), {b'subdir'})
         self.assertEqual(m.visitchildrenset(b'dir/subdir'), b'all')
-        # OPT: This should probably be 'all' if its parent is?
-        self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), b'all')
         self.assertEqual(m.visitchildrenset(b'folder'), set())
 
     def testVisitdirRootfilesin(self):
@@ -98,10 +96,9 @@ class PatternMatcherTests(unittest.TestCase):
         assert isinstance(m, matchmod.patternmatcher)
         self.assertFalse(m.visitdir(b'dir/subdir/x'))
         self.assertFalse(m.visitdir(b'folder'))
-        # FIXME: These should probably be True.
-        self.assertFalse(m.visitdir(b''))
-        self.assertFalse(m.visitdir(b'dir'))
-        self.assertFalse(m.visitdir(b'dir/subdir'))
+        self.assertTrue(m.visitdir(b''))
+        self.assertTrue(m.visitdir(b'dir'))
+        self.assertTrue(m.visitdir(b'dir/subdir'))
 
     def testVisitchildrensetRootfilesin(self):
         m = matchmod.match(
@@ -112,11 +109,9 @@ class PatternMatcherTests(unittest.TestCase):
         assert isinstance(m, matchmod.patternmatcher)
         self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), set())
         self.assertEqual(m.visitchildrenset(b'folder'), set())
-        # FIXME: These should probably be {'dir'}, {'subdir'} and 'this',
-        # respectively, or at least 'this' for all three.
-        self.assertEqual(m.visitchildrenset(b''), set())
-        self.assertEqual(m.visitchildrenset(b'dir'), set())
-        self.assertEqual(m.visitchildrenset(b'dir/subdir'), set())
+        self.assertEqual(m.visitchildrenset(b''), {b'dir'})
+        self.assertEqual(m.visitchildrenset(b'dir'), {b'subdir'})
+        self.assertEqual(m.visitchildrenset(b'dir/subdir'), b'this')
 
     def testVisitdirGlob(self):
         m = matchmod.match(
@@ -135,7 +130,7 @@ class PatternMatcherTests(unittest.TestCase):
             util.localpath(b'/repo'), b'', patterns=[b'glob:dir/z*']
         )
         assert isinstance(m, matchmod.patternmatcher)
-        self.assertEqual(m.visitchildrenset(b''), b'this')
+        self.assertEqual(m.visitchildrenset(b''), {b'dir'})
         self.assertEqual(m.visitchildrenset(b'folder'), set())
         self.assertEqual(m.visitchildrenset(b'dir'), b'this')
         # OPT: these should probably be set().
@@ -152,8 +147,7 @@ class IncludeMatcherTests(unittest.TestCase):
         self.assertTrue(m.visitdir(b''))
         self.assertTrue(m.visitdir(b'dir'))
         self.assertEqual(m.visitdir(b'dir/subdir'), b'all')
-        # OPT: This should probably be 'all' if its parent is?
-        self.assertTrue(m.visitdir(b'dir/subdir/x'))
+        self.assertEqual(m.visitdir(b'dir/subdir/x'), b'all')
         self.assertFalse(m.visitdir(b'folder'))
 
     def testVisitchildrensetPrefix(self):
@@ -164,8 +158,7 @@ class IncludeMatcherTests(unittest.TestCase):
         self.assertEqual(m.visitchildrenset(b''), {b'dir'})
         self.assertEqual(m.visitchildrenset(b'dir'), {b'subdir'})
         self.assertEqual(m.visitchildrenset(b'dir/subdir'), b'all')
-        # OPT: This should probably be 'all' if its parent is?
-        self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), b'all')
         self.assertEqual(m.visitchildrenset(b'folder'), set())
 
     def testVisitdirRootfilesin(self):
@@ -215,6 +208,108 @@ class IncludeMatcherTests(unittest.TestCase):
         self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), b'this')
 
 
+class PatternIndexTests(unittest.TestCase):
+    kindpats = [
+        (b'path', b'dir/subdir', b''),
+        (b'rootglob', b'doc/index.html', b''),
+        (b'glob', b'src/main.c', b''),
+        (b'relglob', b'build', b''),
+        (b'relglob', b'*.o', b''),
+        (b'relglob', b'*.tar.gz', b''),
+        (b'relglob', b'*~', b''),
+        (b'relre', br'\.orig$', b''),
+        (b'relre', br'^top\.txt$', b''),
+        (b'relre', b'^tmp-[0-9]+', b''),
+        (b'rootglob', b'lib/*.py', b''),
+        (b'rootglob', b'lib/sub/**/x', b''),
+        (b'rootfilesin', b'conf', b''),
+    ]
+    paths = [
+        b'dir/subdir',
+        b'dir/subdir/a',
+        b'dir/subdirectory',
+        b'doc/index.html',
+        b'doc/index.html/a',
+        b'doc/index.htm',
+        b'src/main.c',
+        b'src/main.c/a',
+        b'build',
+        b'a/build/b',
+        b'a/build.c',
+        b'a.o',
+        b'a.o/b',
+        b'a.od',
+        b'.o',
+        b'x.tar.gz',
+        b'x.gz',
+        b'a~/b',
+        b'a.orig',
+        b'a.orig/b',
+        b'top.txt',
+        b'a/top.txt',
+        b'tmp-12/a',
+        b'tmp-a',
+        b'lib/a.py',
+        b'lib/a/b.py',
+        b'lib/sub/x',
+        b'lib/sub/a/b/x',
+        b'lib/sub/a/x/y',
+        b'conf/a',
+        b'conf/a/b',
+    ]
+
+    def testMatchesLikeRegexps(self):
+        for globsuffix in (b'$', b'(?:/|$)'):
+            index = matchmod._buildindex(self.kindpats, globsuffix)
+            self.assertTrue(index.residual)
+            self.assertTrue(len(index.residual) < len(self.kindpats))
+            self.assertEqual(
+                index.regex,
+                matchmod._buildmatch(self.kindpats, globsuffix, b'')[0],
+            )
+            mf = index.matchfn(b'')
+            for kindpat in self.kindpats:
+                regexmf = matchmod._buildmatch([kindpat], globsuffix, b'')[1]
+                for f in self.paths:
+                    self.assertEqual(
+                        bool(regexmf(f)),
+                        bool(
+                            matchmod._buildindex([kindpat], globsuffix).matchfn(
+                                b''
+                            )(f)
+                        ),
+                        (globsuffix, kindpat, f),
+                    )
+            regexmf = matchmod._buildmatch(self.kindpats, globsuffix, b'')[1]
+            for f in self.paths:
+                self.assertEqual(bool(regexmf(f)), bool(mf(f)), (globsuffix, f))
+
+    def testVisitchildrensetLiterals(self):
+        m = matchmod.match(
+            util.localpath(b'/repo'),
+            b'',
+            include=[b'path:dir/subdir', b'rootglob:lib/*.py'],
+        )
+        assert isinstance(m, matchmod.includematcher)
+        self.assertEqual(m.visitchildrenset(b''), {b'dir', b'lib'})
+        self.assertEqual(m.visitchildrenset(b'dir'), {b'subdir'})
+        self.assertEqual(m.visitchildrenset(b'dir/subdir'), b'all')
+        self.assertEqual(m.visitchildrenset(b'dir/subdir/x'), b'all')
+        self.assertEqual(m.visitchildrenset(b'lib'), b'this')
+        self.assertEqual(m.visitchildrenset(b'folder'), set())
+
+    def testVisitchildrensetAnywhere(self):
+        m = matchmod.match(
+            util.localpath(b'/repo'),
+            b'',
+            include=[b'path:dir/subdir', b'relglob:*.o'],
+        )
+        assert isinstance(m, matchmod.includematcher)
+        self.assertEqual(m.visitchildrenset(b''), b'this')
+        self.assertEqual(m.visitchildrenset(b'folder'), b'this')
+        self.assertEqual(m.visitchildrenset(b'dir/subdir'), b'all')
+
+
 class ExactMatcherTests(unittest.TestCase):
     def testVisitdir(self):
         m = matchmod.exact(files=[b'dir/subdir/foo.txt'])
@@ -324,11 +419,8 @@ class DifferenceMatcherTests(unittest.TestCase):
         self.assertEqual(dm.visitdir(b''), True)
         self.assertEqual(dm.visitdir(b'dir'), True)
         self.assertFalse(dm.visitdir(b'dir/subdir'))
-        # OPT: We should probably return False for these; we don't because
-        # patternmatcher.visitdir() (our m2) doesn't return 'all' for subdirs of
-        # an 'all' pattern, just True.
-        self.assertEqual(dm.visitdir(b'dir/subdir/z'), True)
-        self.assertEqual(dm.visitdir(b'dir/subdir/x'), True)
+        self.assertFalse(dm.visitdir(b'dir/subdir/z'))
+        self.assertFalse(dm.visitdir(b'dir/subdir/x'))
         self.assertEqual(dm.visitdir(b'dir/foo'), b'all')
         self.assertEqual(dm.visitdir(b'folder'), b'all')
 
@@ -343,11 +435,8 @@ class DifferenceMatcherTests(unittest.TestCase):
         self.assertEqual(dm.visitchildrenset(b'dir/subdir'), set())
         self.assertEqual(dm.visitchildrenset(b'dir/foo'), b'all')
         self.assertEqual(dm.visitchildrenset(b'folder'), b'all')
-        # OPT: We should probably return set() for these; we don't because
-        # patternmatcher.visitdir() (our m2) doesn't return 'all' for subdirs of
-        # an 'all' pattern, just 'this'.
-        self.assertEqual(dm.visitchildrenset(b'dir/subdir/z'), b'this')
-        self.assertEqual(dm.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(dm.visitchildrenset(b'dir/subdir/z'), set())
+        self.assertEqual(dm.visitchildrenset(b'dir/subdir/x'), set())
 
     # We're using includematcher instead of patterns because it behaves slightly
     # better (giving narrower results) than patternmatcher.
@@ -364,11 +453,8 @@ class DifferenceMatcherTests(unittest.TestCase):
         self.assertEqual(dm.visitdir(b'dir/subdir'), b'all')
         self.assertFalse(dm.visitdir(b'dir/foo'))
         self.assertFalse(dm.visitdir(b'folder'))
-        # OPT: We should probably return False for these; we don't because
-        # patternmatcher.visitdir() (our m2) doesn't return 'all' for subdirs of
-        # an 'all' pattern, just True.
-        self.assertEqual(dm.visitdir(b'dir/subdir/z'), True)
-        self.assertEqual(dm.visitdir(b'dir/subdir/x'), True)
+        self.assertEqual(dm.visitdir(b'dir/subdir/z'), b'all')
+        self.assertEqual(dm.visitdir(b'dir/subdir/x'), b'all')
 
     def testVisitchildrensetIncludeInclude(self):
         m1 = matchmod.match(
@@ -383,11 +469,8 @@ class DifferenceMatcherTests(unittest.TestCase):
         self.assertEqual(dm.visitchildrenset(b'dir/subdir'), b'all')
         self.assertEqual(dm.visitchildrenset(b'dir/foo'), set())
         self.assertEqual(dm.visitchildrenset(b'folder'), set())
-        # OPT: We should probably return set() for these; we don't because
-        # patternmatcher.visitdir() (our m2) doesn't return 'all' for subdirs of
-        # an 'all' pattern, just 'this'.
-        self.assertEqual(dm.visitchildrenset(b'dir/subdir/z'), b'this')
-        self.assertEqual(dm.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(dm.visitchildrenset(b'dir/subdir/z'), b'all')
+        self.assertEqual(dm.visitchildrenset(b'dir/subdir/x'), b'all')
 
 
 class IntersectionMatcherTests(unittest.TestCase):
@@ -454,11 +537,8 @@ class IntersectionMatcherTests(unittest.TestCase):
         self.assertEqual(im.visitdir(b'dir/subdir'), b'all')
         self.assertFalse(im.visitdir(b'dir/foo'))
         self.assertFalse(im.visitdir(b'folder'))
-        # OPT: We should probably return 'all' for these; we don't because
-        # patternmatcher.visitdir() (our m2) doesn't return 'all' for subdirs of
-        # an 'all' pattern, just True.
-        self.assertEqual(im.visitdir(b'dir/subdir/z'), True)
-        self.assertEqual(im.visitdir(b'dir/subdir/x'), True)
+        self.assertEqual(im.visitdir(b'dir/subdir/z'), b'all')
+        self.assertEqual(im.visitdir(b'dir/subdir/x'), b'all')
 
     def testVisitchildrensetM2SubdirPrefix(self):
         m1 = matchmod.alwaysmatcher()
@@ -471,9 +551,8 @@ class IntersectionMatcherTests(unittest.TestCase):
         self.assertEqual(im.visitchildrenset(b'dir/subdir'), b'all')
         self.assertEqual(im.visitchildrenset(b'dir/foo'), set())
         self.assertEqual(im.visitchildrenset(b'folder'), set())
-        # OPT: We should probably return 'all' for these
-        self.assertEqual(im.visitchildrenset(b'dir/subdir/z'), b'this')
-        self.assertEqual(im.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(im.visitchildrenset(b'dir/subdir/z'), b'all')
+        self.assertEqual(im.visitchildrenset(b'dir/subdir/x'), b'all')
 
     # We're using includematcher instead of patterns because it behaves slightly
     # better (giving narrower results) than patternmatcher.
@@ -561,8 +640,7 @@ class IntersectionMatcherTests(unittest.TestCase):
         self.assertFalse(im.visitdir(b'dir/foo'))
         self.assertFalse(im.visitdir(b'folder'))
         self.assertFalse(im.visitdir(b'dir/subdir/z'))
-        # OPT: this should probably be 'all' not True.
-        self.assertEqual(im.visitdir(b'dir/subdir/x'), True)
+        self.assertEqual(im.visitdir(b'dir/subdir/x'), b'all')
 
     def testVisitchildrensetIncludeInclude3(self):
         m1 = matchmod.match(
@@ -578,8 +656,7 @@ class IntersectionMatcherTests(unittest.TestCase):
         self.assertEqual(im.visitchildrenset(b'dir/foo'), set())
         self.assertEqual(im.visitchildrenset(b'folder'), set())
         self.assertEqual(im.visitchildrenset(b'dir/subdir/z'), set())
-        # OPT: this should probably be 'all' not 'this'.
-        self.assertEqual(im.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(im.visitchildrenset(b'dir/subdir/x'), b'all')
 
     # We're using includematcher instead of patterns because it behaves slightly
     # better (giving narrower results) than patternmatcher.
@@ -740,9 +817,8 @@ class UnionMatcherTests(unittest.TestCase):
         self.assertEqual(um.visitdir(b'dir/subdir'), b'all')
         self.assertFalse(um.visitdir(b'dir/foo'))
         self.assertFalse(um.visitdir(b'folder'))
-        # OPT: These two should probably be 'all' not True.
-        self.assertEqual(um.visitdir(b'dir/subdir/z'), True)
-        self.assertEqual(um.visitdir(b'dir/subdir/x'), True)
+        self.assertEqual(um.visitdir(b'dir/subdir/z'), b'all')
+        self.assertEqual(um.visitdir(b'dir/subdir/x'), b'all')
 
     def testVisitchildrensetIncludeInclude(self):
         m1 = matchmod.match(
@@ -757,9 +833,8 @@ class UnionMatcherTests(unittest.TestCase):
         self.assertEqual(um.visitchildrenset(b'dir/subdir'), b'all')
         self.assertEqual(um.visitchildrenset(b'dir/foo'), set())
         self.assertEqual(um.visitchildrenset(b'folder'), set())
-        # OPT: These next two could be 'all' instead of 'this'.
-        self.assertEqual(um.visitchildrenset(b'dir/subdir/z'), b'this')
-        self.assertEqual(um.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(um.visitchildrenset(b'dir/subdir/z'), b'all')
+        self.assertEqual(um.visitchildrenset(b'dir/subdir/x'), b'all')
 
     # We're using includematcher instead of patterns because it behaves slightly
     # better (giving narrower results) than patternmatcher.
@@ -776,9 +851,8 @@ class UnionMatcherTests(unittest.TestCase):
         self.assertEqual(um.visitdir(b'dir/subdir'), b'all')
         self.assertFalse(um.visitdir(b'dir/foo'))
         self.assertEqual(um.visitdir(b'folder'), b'all')
-        # OPT: These should probably be 'all' not True.
-        self.assertEqual(um.visitdir(b'dir/subdir/z'), True)
-        self.assertEqual(um.visitdir(b'dir/subdir/x'), True)
+        self.assertEqual(um.visitdir(b'dir/subdir/z'), b'all')
+        self.assertEqual(um.visitdir(b'dir/subdir/x'), b'all')
 
     def testVisitchildrensetIncludeInclude2(self):
         m1 = matchmod.match(
@@ -793,9 +867,8 @@ class UnionMatcherTests(unittest.TestCase):
         self.assertEqual(um.visitchildrenset(b'dir/subdir'), b'all')
         self.assertEqual(um.visitchildrenset(b'dir/foo'), set())
         self.assertEqual(um.visitchildrenset(b'folder'), b'all')
-        # OPT: These next two could be 'all' instead of 'this'.
-        self.assertEqual(um.visitchildrenset(b'dir/subdir/z'), b'this')
-        self.assertEqual(um.visitchildrenset(b'dir/subdir/x'), b'this')
+        self.assertEqual(um.visitchildrenset(b'dir/subdir/z'), b'all')
+        self.assertEqual(um.visitchildrenset(b'dir/subdir/x'), b'all')
 
     # We're using includematcher instead of patterns because it behaves slightly
     # better (giving narrower results) than patternmatcher.
@@ -813,8 +886,7 @@ class UnionMatcherTests(unittest.TestCase):
         self.assertFalse(um.visitdir(b'dir/foo'))
         self.assertFalse(um.visitdir(b'folder'))
         self.assertEqual(um.visitdir(b'dir/subdir/x'), b'all')
-        # OPT: this should probably be 'all' not True.
-        self.assertEqual(um.visitdir(b'dir/subdir/z'), True)
+        self.assertEqual(um.visitdir(b'dir/subdir/z'), b'all')
 
     def testVisitchildrensetIncludeInclude3(self):
         m1 = matchmod.match(
@@ -830,8 +902,7 @@ class UnionMatcherTests(unittest.TestCase):
         self.assertEqual(um.visitchildrenset(b'dir/foo'), set())
         self.assertEqual(um.visitchildrenset(b'folder'), set())
         self.assertEqual(um.visitchildrenset(b'dir/subdir/x'), b'all')
-        # OPT: this should probably be 'all' not 'this'.
-        self.assertEqual(um.visitchildrenset(b'dir/subdir/z'), b'this')
+        self.assertEqual(um.visitchildrenset(b'dir/subdir/z'), b'all')
 
     # We're using includematcher instead of patterns because it behaves slightly
     # better (giving narrower results) than patternmatcher.
@@ -878,9 +949,8 @@ class SubdirMatcherTests(unittest.TestCase):
 
         self.assertEqual(sm.visitdir(b''), True)
         self.assertEqual(sm.visitdir(b'subdir'), b'all')
-        # OPT: These next two should probably be 'all' not True.
-        self.assertEqual(sm.visitdir(b'subdir/x'), True)
-        self.assertEqual(sm.visitdir(b'subdir/z'), True)
+        self.assertEqual(sm.visitdir(b'subdir/x'), b'all')
+        self.assertEqual(sm.visitdir(b'subdir/z'), b'all')
         self.assertFalse(sm.visitdir(b'foo'))
 
     def testVisitchildrenset(self):
@@ -891,9 +961,8 @@ class SubdirMatcherTests(unittest.TestCase):
 
         self.assertEqual(sm.visitchildrenset(b''), {b'subdir'})
         self.assertEqual(sm.visitchildrenset(b'subdir'), b'all')
-        # OPT: These next two should probably be 'all' not 'this'.
-        self.assertEqual(sm.visitchildrenset(b'subdir/x'), b'this')
-        self.assertEqual(sm.visitchildrenset(b'subdir/z'), b'this')
+        self.assertEqual(sm.visitchildrenset(b'subdir/x'), b'all')
+        self.assertEqual(sm.visitchildrenset(b'subdir/z'), b'all')
         self.assertEqual(sm.visitchildrenset(b'foo'), set())
 
 
@@ -943,21 +1012,15 @@ class PrefixdirMatcherTests(unittest.TestCase):
         )
         pm = matchmod.prefixdirmatcher(b'd', m)
 
-        # OPT: visitchildrenset could possibly return {'e'} and {'f'} for these
-        # next two, respectively; patternmatcher does not have this
-        # optimization.
-        self.assertEqual(m.visitchildrenset(b''), b'this')
-        self.assertEqual(m.visitchildrenset(b'e'), b'this')
-        self.assertEqual(m.visitchildrenset(b'e/f'), b'this')
+        self.assertEqual(m.visitchildrenset(b''), {b'e'})
+        self.assertEqual(m.visitchildrenset(b'e'), {b'a.txt', b'f'})
+        self.assertEqual(m.visitchildrenset(b'e/f'), {b'b.txt'})
         self.assertEqual(m.visitchildrenset(b'e/f/g'), set())
 
-        # OPT: visitchildrenset could possibly return {'d'}, {'e'}, and {'f'}
-        # for these next three, respectively; patternmatcher does not have this
-        # optimization.
         self.assertEqual(pm.visitchildrenset(b''), b'this')
-        self.assertEqual(pm.visitchildrenset(b'd'), b'this')
-        self.assertEqual(pm.visitchildrenset(b'd/e'), b'this')
-        self.assertEqual(pm.visitchildrenset(b'd/e/f'), b'this')
+        self.assertEqual(pm.visitchildrenset(b'd'), {b'e'})
+        self.assertEqual(pm.visitchildrenset(b'd/e'), {b'a.txt', b'f'})
+        self.assertEqual(pm.visitchildrenset(b'd/e/f'), {b'b.txt'})
         self.assertEqual(pm.visitchildrenset(b'd/e/f/g'), set())
 
 
@@ -0,0 +1,84 @@
+==============================
+Test the index of the obsstore
+==============================
+
+  $ cat >> $HGRCPATH << EOF
+  > [experimental]
+  > evolution = all
+  > obsstore.index = yes
+  > [extensions]
+  > amend =
+  > strip =
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ echo a > a
+  $ hg commit -qAm a
+  $ for i in 1 2 3; do
+  >   echo $i >> a
+  >   hg amend -q
+  > done
+  $ echo b > b
+  $ hg commit -qAm b
+
+The index is written with the markers, one entry per predecessor and one per
+successor
+
+  $ f --size .hg/cache/obsstore-index-v1
+  .hg/cache/obsstore-index-v1: size=188
+  $ hg log -G --hidden -T '{rev} {obsfate}\n'
+  @  4
+  |
+  o  3
+  
+  x  2 rewritten using amend as 3:* (glob)
+  
+  x  1 rewritten using amend as 2:* (glob)
+  
+  x  0 rewritten using amend as 1:* (glob)
+  
+  $ hg debugobsolete --rev 2 --hidden -T '{succnodes % "{node|short}"}\n'
+  8146bbb24aaf
+  5e392f91430f
+
+Markers added by a transaction are added to the index
+
+  $ hg debugobsolete `hg log -r 4 -T '{node}'` -d '0 0'
+  1 new obsolescence markers
+  obsoleted 1 changesets
+  $ f --size .hg/cache/obsstore-index-v1
+  .hg/cache/obsstore-index-v1: size=212
+  $ hg log -r 'obsolete()' --hidden -T '{rev} '
+  0 1 2 4  (no-eol)
+
+Markers added without the index are added to it when it is read
+
+  $ hg up -q 3
+  $ echo c > c
+  $ hg commit -qAm c
+  $ hg debugobsolete `hg log -r 3 -T '{node}'` `hg log -r 5 -T '{node}'` \
+  >   -d '0 0' --config experimental.obsstore.index=no
+  1 new obsolescence markers
+  obsoleted 1 changesets
+  1 new orphan changesets
+  $ f --size .hg/cache/obsstore-index-v1
+  .hg/cache/obsstore-index-v1: size=212
+  $ hg log -G -T '{rev} {instabilities}\n'
+  @  5 orphan
+  |
+  x  3
+  
+  $ f --size .hg/cache/obsstore-index-v1
+  .hg/cache/obsstore-index-v1: size=260
+
+The index is rebuilt when the obsstore changed
+
+  $ hg debugobsolete --delete 1
+  deleted 1 obsolescence markers
+  $ hg log -r 'obsolete()' --hidden -T '{rev} '
+  0 2 3 4  (no-eol)
+  $ hg log -r 'obsolete()' --hidden -T '{rev} ' --config experimental.obsstore.index=no
+  0 2 3 4  (no-eol)
+  $ f --size .hg/cache/obsstore-index-v1
+  .hg/cache/obsstore-index-v1: size=212
@@ -41,6 +41,7 @@ Unlock further check (we are here to test the feature)
   sparserevlog:       yes
   sidedata:            no
   persistent-nodemap: yes
+  dirstate-tree:       no
   copies-sdc:          no
   plain-cl-delta:     yes
   compression:        zlib
@@ -560,6 +561,7 @@ downgrading
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap: yes     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -596,6 +598,7 @@ upgrading
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no    yes      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
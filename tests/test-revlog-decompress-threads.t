@@ -0,0 +1,62 @@
+Create threadreport.py
+  $ cat << EOF > threadreport.py
+  > # extension reporting chunks decompressed outside of the main thread
+  > 
+  > from __future__ import absolute_import
+  > 
+  > import threading
+  > 
+  > from mercurial import (
+  >     extensions,
+  >     revlog,
+  > )
+  > 
+  > def extsetup(ui):
+  >     def threaddecompress(orig, self, data):
+  >         if threading.current_thread() is not threading.main_thread():
+  >             ui.write(b"chunk of %d bytes decompressed in a thread\n"
+  >                      % len(data))
+  >         return orig(self, data)
+  > 
+  >     extensions.wrapfunction(revlog.revlog, '_threaddecompress',
+  >                             threaddecompress)
+  > EOF
+
+setting up a repository with large chunks
+  $ cat << EOF > gen.py
+  > import hashlib, sys
+  > for l in range(5000):
+  >     print(hashlib.sha1(('%s-%d' % (sys.argv[1], l)).encode()).hexdigest())
+  > EOF
+  $ hg init a
+  $ cd a
+  $ for i in `$TESTDIR/seq.py 1 2` ; do
+  > $PYTHON ../gen.py $i > big
+  > echo $i > small
+  > hg commit -qAm $i
+  > done
+  $ hg cat -r 1 big > ../big-1
+
+  $ cat << EOF >> $HGRCPATH
+  > [extensions]
+  > threadreport=$TESTTMP/threadreport.py
+  > EOF
+
+no thread is used by default
+  $ hg cat -r 1 big -o big-1
+  $ cmp big-1 ../big-1
+  $ rm big-1
+
+large chunks are decompressed by the threads, small ones are not
+  $ hg cat -r 1 big small -o '%s-1' --config storage.revlog.decompress-threads=4 \
+  >   | sort
+  chunk of 118995 bytes decompressed in a thread
+  chunk of 119008 bytes decompressed in a thread
+  $ cmp big-1 ../big-1
+  $ cat small-1
+  2
+  $ hg verify -q --config storage.revlog.decompress-threads=4 | sort -u
+  chunk of 118995 bytes decompressed in a thread
+  chunk of 119008 bytes decompressed in a thread
+
+  $ cd ..
@@ -0,0 +1,47 @@
+Test the cache of decompressed revlog chunks shared between revlogs
+
+  $ CONTRIBDIR="$TESTDIR/../contrib"
+  $ cat >> $HGRCPATH << EOF
+  > [extensions]
+  > perf=$CONTRIBDIR/perf.py
+  > [perf]
+  > presleep=0
+  > stub=on
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ for i in 1 2 3 4 5; do
+  >   echo "line $i" >> a
+  >   echo "line $i" >> b
+  >   hg commit -Aqm "commit $i"
+  > done
+  $ hg log -p -r 3 > ../log-nocache.txt
+
+Reading with the cache enabled gives the same result
+
+  $ cat >> .hg/hgrc << EOF
+  > [storage]
+  > revlog.decompressed-cache.size = 1MB
+  > EOF
+  $ hg log -p -r 3 > ../log-cache.txt
+  $ cmp ../log-nocache.txt ../log-cache.txt
+  $ hg verify -q
+
+Hits and misses are reported by perf
+
+  $ hg perfrevlogrevisions -m --dist 1 --reverse \
+  >   --config perf.stub=no --config perf.run-limits=0.0-1 2> /dev/null
+  decompressed chunk cache: 2 hits, 5 misses (28%), 5 entries, */1048576 bytes (glob)
+
+Stripping does not serve stale data from the cache
+
+  $ hg debugstrip -q -r 4 --config extensions.strip=
+  $ echo "other" >> a
+  $ hg commit -qm "replacement"
+  $ hg cat -r 4 a
+  line 1
+  line 2
+  line 3
+  line 4
+  other
@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+
+import unittest
+
+from mercurial.node import nullid
+from mercurial import (
+    encoding,
+    revlog,
+    transaction,
+    vfs as vfsmod,
+)
+
+import silenttestrunner
+
+
+def gentext(rev):
+    return b''.join(b'line %d of rev %d\n' % (i, rev) for i in range(50))
+
+
+class fulltextcachetests(unittest.TestCase):
+    def setUp(self):
+        self.vfs = vfsmod.vfs(encoding.environ.get(b'TESTTMP', b'/tmp'))
+        self.vfs.options = {
+            b'generaldelta': True,
+            b'revlogv1': True,
+            b'fulltext-cache-size': 1000000,
+        }
+        self.vfs.tryunlink(b'_fulltextcache.i')
+        self.vfs.tryunlink(b'_fulltextcache.d')
+        self.addCleanup(self.vfs.tryunlink, b'_fulltextcache.i')
+        self.addCleanup(self.vfs.tryunlink, b'_fulltextcache.d')
+        tr = transaction.transaction(
+            lambda msg: None, self.vfs, {'plain': self.vfs}, b'journal'
+        )
+        rl = revlog.revlog(self.vfs, b'_fulltextcache.i')
+        p1 = nullid
+        for rev in range(10):
+            p1 = rl.addrevision(gentext(rev), tr, rev, p1, nullid)
+        tr.close()
+        self.rl = revlog.revlog(self.vfs, b'_fulltextcache.i')
+
+    def testdeltachainstopset(self):
+        rl = self.rl
+        chain = rl._deltachain(9)[0]
+        self.assertEqual(rl._deltachain(9, stoprev=set())[0], chain)
+        stop = chain[len(chain) // 2]
+        expected = chain[chain.index(stop) + 1 :]
+        self.assertEqual(
+            rl._deltachain(9, stoprev={stop}), rl._deltachain(9, stoprev=stop)
+        )
+        # the revision closest to the one requested is used
+        self.assertEqual(
+            rl._deltachain(9, stoprev={chain[0], stop}), (expected, True)
+        )
+        self.assertEqual(rl._deltachain(9, stoprev={9}), ([], True))
+
+    def testmultipleentries(self):
+        rl = self.rl
+        for rev in (3, 7, 5):
+            self.assertEqual(rl.revision(rev), gentext(rev))
+        self.assertEqual(sorted(rl._revisioncache), [3, 5, 7])
+        rl._revisioncache[3] = b'bogus'
+        # the closest cached revision is used as base
+        self.assertEqual(rl.revision(8), gentext(8))
+        self.assertEqual(rl.revision(9), gentext(9))
+        rl.clearcaches()
+        self.assertEqual(len(rl._revisioncache), 0)
+
+    def testsizebound(self):
+        self.vfs.options[b'fulltext-cache-size'] = len(gentext(0)) * 2
+        rl = revlog.revlog(self.vfs, b'_fulltextcache.i')
+        for rev in range(10):
+            self.assertEqual(rl.revision(rev), gentext(rev))
+        self.assertLessEqual(len(rl._revisioncache), 2)
+        self.assertIn(9, rl._revisioncache)
+
+    def testdefault(self):
+        del self.vfs.options[b'fulltext-cache-size']
+        rl = revlog.revlog(self.vfs, b'_fulltextcache.i')
+        for rev in range(10):
+            self.assertEqual(rl.revision(rev), gentext(rev))
+        self.assertEqual(list(rl._revisioncache), [9])
+
+
+if __name__ == '__main__':
+    silenttestrunner.main(__name__)
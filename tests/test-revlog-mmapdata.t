@@ -0,0 +1,58 @@
+Create verbosemmap.py
+  $ cat << EOF > verbosemmap.py
+  > # extension to make util.mmapread verbose
+  > 
+  > from __future__ import absolute_import
+  > 
+  > from mercurial import (
+  >     extensions,
+  >     pycompat,
+  >     util,
+  > )
+  > 
+  > def extsetup(ui):
+  >     def mmapread(orig, fp):
+  >         ui.write(b"mmapping %s\n" % pycompat.bytestr(fp.name))
+  >         ui.flush()
+  >         return orig(fp)
+  > 
+  >     extensions.wrapfunction(util, 'mmapread', mmapread)
+  > EOF
+
+setting up base repo with a non-inline filelog
+  $ cat << EOF > gen.py
+  > import hashlib, sys
+  > for l in range(5000):
+  >     print(hashlib.sha1(('%s-%d' % (sys.argv[1], l)).encode()).hexdigest())
+  > EOF
+  $ hg init a
+  $ cd a
+  $ for i in `$TESTDIR/seq.py 1 3` ; do
+  > $PYTHON ../gen.py $i > big
+  > hg commit -qAm $i
+  > done
+  $ ls .hg/store/data
+  big.d
+  big.i
+  $ hg cat -r 1 big > ../big-1
+
+set up verbosemmap extension
+  $ cat << EOF >> $HGRCPATH
+  > [extensions]
+  > verbosemmap=$TESTTMP/verbosemmap.py
+  > EOF
+
+mmap the data file which is more than 4k long, once
+  $ hg cat -r 1 big -o big-1 --config experimental.mmapdatathreshold=4k
+  mmapping $TESTTMP/a/.hg/store/data/big.d
+  $ cmp big-1 ../big-1
+  $ rm big-1
+  $ hg verify -q --config experimental.mmapdatathreshold=4k
+  mmapping $TESTTMP/a/.hg/store/data/big.d
+
+do not mmap the data file which is still less than 1MB
+  $ hg cat -r 1 big -o big-1 --config experimental.mmapdatathreshold=1MB
+  $ cmp big-1 ../big-1
+  $ rm big-1
+
+  $ cd ..
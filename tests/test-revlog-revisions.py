@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+
+import unittest
+
+from mercurial.node import nullid, nullrev
+from mercurial import (
+    encoding,
+    revlog,
+    transaction,
+    vfs as vfsmod,
+)
+
+import silenttestrunner
+
+
+def gentext(rev, branch):
+    lines = [b'common line %d\n' % i for i in range(30)]
+    lines[rev % 30] = b'rev %d on branch %d\n' % (rev, branch)
+    return b''.join(lines)
+
+
+class revisionstests(unittest.TestCase):
+    def setUp(self):
+        self.vfs = vfsmod.vfs(encoding.environ.get(b'TESTTMP', b'/tmp'))
+        self.vfs.options = {
+            b'generaldelta': True,
+            b'revlogv1': True,
+            b'sparse-revlog': True,
+        }
+        self.vfs.tryunlink(b'_revisions.i')
+        self.vfs.tryunlink(b'_revisions.d')
+        self.addCleanup(self.vfs.tryunlink, b'_revisions.i')
+        self.addCleanup(self.vfs.tryunlink, b'_revisions.d')
+        tr = transaction.transaction(
+            lambda msg: None, self.vfs, {'plain': self.vfs}, b'journal'
+        )
+        rl = revlog.revlog(self.vfs, b'_revisions.i')
+        # three interleaved branches forking from the same root
+        heads = [nullid, nullid, nullid]
+        self.texts = []
+        for rev in range(60):
+            branch = rev % 3 if rev else 0
+            text = gentext(rev, branch)
+            p1 = heads[branch] if rev else nullid
+            node = rl.addrevision(text, tr, rev, p1, nullid)
+            if not rev:
+                heads = [node, node, node]
+            heads[branch] = node
+            self.texts.append(text)
+        tr.close()
+
+    def newrevlog(self):
+        return revlog.revlog(self.vfs, b'_revisions.i')
+
+    def check(self, revs):
+        rl = self.newrevlog()
+        result = list(rl.revisions(revs))
+        expected = sorted(set(revs))
+        self.assertEqual([rev for rev, text in result], expected)
+        for rev, text in result:
+            if rev == nullrev:
+                self.assertEqual(text, b'')
+            else:
+                self.assertEqual(text, self.texts[rev])
+                self.assertEqual(text, rl.revision(rev))
+
+    def testall(self):
+        self.check(range(60))
+
+    def testsubsets(self):
+        self.check([])
+        self.check([42])
+        self.check([59, 3, 31, 3])
+        self.check(range(0, 60, 3))
+        self.check(range(1, 60, 7))
+        self.check([nullrev, 10, 20])
+
+    def testsmallbatches(self):
+        orig = revlog._revisionsbatchsize
+        revlog._revisionsbatchsize = 1000
+        try:
+            self.check(range(60))
+            self.check(range(59, 0, -5))
+        finally:
+            revlog._revisionsbatchsize = orig
+
+
+if __name__ == '__main__':
+    silenttestrunner.main(__name__)
@@ -58,6 +58,7 @@ Check that we can upgrade to sidedata
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -71,6 +72,7 @@ Check that we can upgrade to sidedata
   sparserevlog:       yes    yes     yes
   sidedata:            no    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -90,6 +92,7 @@ Check that we can downgrade from sidedata
   sparserevlog:       yes    yes     yes
   sidedata:           yes     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -103,6 +106,7 @@ Check that we can downgrade from sidedata
   sparserevlog:       yes    yes     yes
   sidedata:           yes     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -133,6 +133,25 @@ update with worker processes
   100 files updated, 0 files merged, 0 files removed, 0 files unresolved
   $ hg status
 
+status compares the files in an unknown state from worker processes
+
+  $ hg debugrebuilddirstate
+  $ echo 0 > 1
+  $ echo 20 > 2
+  $ chmod +x 3
+  $ touch -t 200001010000 `"$PYTHON" $TESTDIR/seq.py 1 100`
+  $ hg debugstate | grep -c unset
+  100
+  $ hg status
+  M 1
+  M 2
+  M 3 (execbit !)
+  $ hg debugstate | grep unset
+  n   0         -1 unset               1
+  n   0         -1 unset               2
+  n   0         -1 unset               3 (execbit !)
+  $ hg revert -q 1 2 3
+
   $ cd ..
 
 #endif
@@ -0,0 +1,75 @@
+Test working directory updates written from a pool of threads
+
+  $ cat << EOF >> $HGRCPATH
+  > [experimental]
+  > worker.wdir-writer-threads = 4
+  > EOF
+
+  $ hg init repo
+  $ cd repo
+  $ for d in a b c; do
+  >   mkdir $d
+  >   for i in `$TESTDIR/seq.py 1 50`; do
+  >     echo $d$i > $d/f$i
+  >   done
+  > done
+  $ echo exec > exec
+  $ hg commit -qAm 0
+  $ chmod +x exec
+  $ hg rm -q a
+  $ for i in `$TESTDIR/seq.py 1 50`; do
+  >   echo changed >> b/f$i
+  > done
+  $ echo new > new
+  $ hg commit -qAm 1
+
+Removals and writes
+
+  $ hg update -q 0 --debug | grep -c ' -> r$'
+  1
+  $ hg update 0
+  0 files updated, 0 files merged, 0 files removed, 0 files unresolved
+  $ hg update 1
+  52 files updated, 0 files merged, 50 files removed, 0 files unresolved
+  $ ls
+  b
+  c
+  exec
+  new
+  $ hg status
+  $ hg update 0
+  101 files updated, 0 files merged, 1 files removed, 0 files unresolved
+  $ cat a/f1 b/f1
+  a1
+  b1
+  $ hg status
+
+#if execbit
+  $ hg update -q 1
+  $ f --mode exec
+  exec: mode=755
+#endif
+
+Files are written in order, with atomic writes too
+
+  $ rm -rf a b c
+  $ hg update -C 1 --config experimental.update.atomic-file=true
+  100 files updated, 0 files merged, 0 files removed, 0 files unresolved
+  $ hg status
+  $ hg debugdirstate | grep -c '^n'
+  102
+
+Unknown files conflicting with the update are backed up
+
+  $ hg update -q 0
+  $ echo unknown > new
+  $ hg update 1 --config merge.checkunknown=warn
+  new: replacing untracked file
+  52 files updated, 0 files merged, 50 files removed, 0 files unresolved
+  $ hg status
+  ? new.orig
+  $ cat new new.orig
+  new
+  unknown
+
+  $ cd ..
@@ -60,6 +60,7 @@ An upgrade of a repository created with recommended settings only suggests optim
   sparserevlog:       yes
   sidedata:            no
   persistent-nodemap:  no
+  dirstate-tree:       no
   copies-sdc:          no
   plain-cl-delta:     yes
   compression:        zlib
@@ -73,6 +74,7 @@ An upgrade of a repository created with recommended settings only suggests optim
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -86,6 +88,7 @@ An upgrade of a repository created with recommended settings only suggests optim
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -99,6 +102,7 @@ An upgrade of a repository created with recommended settings only suggests optim
   [formatvariant.name.uptodate|sparserevlog:      ][formatvariant.repo.uptodate| yes][formatvariant.config.default|    yes][formatvariant.default|     yes]
   [formatvariant.name.uptodate|sidedata:          ][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
   [formatvariant.name.uptodate|persistent-nodemap:][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
+  [formatvariant.name.uptodate|dirstate-tree:     ][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
   [formatvariant.name.uptodate|copies-sdc:        ][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
   [formatvariant.name.uptodate|plain-cl-delta:    ][formatvariant.repo.uptodate| yes][formatvariant.config.default|    yes][formatvariant.default|     yes]
   [formatvariant.name.uptodate|compression:       ][formatvariant.repo.uptodate| zlib][formatvariant.config.default|   zlib][formatvariant.default|    zlib]
@@ -147,6 +151,12 @@ An upgrade of a repository created with recommended settings only suggests optim
     "name": "persistent-nodemap",
     "repo": false
    },
+   {
+    "config": false,
+    "default": false,
+    "name": "dirstate-tree",
+    "repo": false
+   },
    {
     "config": false,
     "default": false,
@@ -305,6 +315,7 @@ Various sub-optimal detections work
   sparserevlog:        no
   sidedata:            no
   persistent-nodemap:  no
+  dirstate-tree:       no
   copies-sdc:          no
   plain-cl-delta:     yes
   compression:        zlib
@@ -318,6 +329,7 @@ Various sub-optimal detections work
   sparserevlog:        no    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -331,6 +343,7 @@ Various sub-optimal detections work
   sparserevlog:        no     no     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -344,6 +357,7 @@ Various sub-optimal detections work
   [formatvariant.name.mismatchdefault|sparserevlog:      ][formatvariant.repo.mismatchdefault|  no][formatvariant.config.special|     no][formatvariant.default|     yes]
   [formatvariant.name.uptodate|sidedata:          ][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
   [formatvariant.name.uptodate|persistent-nodemap:][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
+  [formatvariant.name.uptodate|dirstate-tree:     ][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
   [formatvariant.name.uptodate|copies-sdc:        ][formatvariant.repo.uptodate|  no][formatvariant.config.default|     no][formatvariant.default|      no]
   [formatvariant.name.uptodate|plain-cl-delta:    ][formatvariant.repo.uptodate| yes][formatvariant.config.default|    yes][formatvariant.default|     yes]
   [formatvariant.name.uptodate|compression:       ][formatvariant.repo.uptodate| zlib][formatvariant.config.default|   zlib][formatvariant.default|    zlib]
@@ -1287,6 +1301,7 @@ upgrade
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zstd   zlib    zlib
@@ -1323,6 +1338,7 @@ downgrade
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib
@@ -1362,6 +1378,7 @@ upgrade from hgrc
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zstd   zstd    zlib
@@ -1405,6 +1422,7 @@ upgrade
   sparserevlog:       yes    yes     yes
   sidedata:           yes     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib (no-zstd !)
@@ -1448,6 +1466,7 @@ downgrade
   sparserevlog:       yes    yes     yes
   sidedata:            no     no      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib (no-zstd !)
@@ -1491,6 +1510,7 @@ upgrade from hgrc
   sparserevlog:       yes    yes     yes
   sidedata:           yes    yes      no
   persistent-nodemap:  no     no      no
+  dirstate-tree:       no     no      no
   copies-sdc:          no     no      no
   plain-cl-delta:     yes    yes     yes
   compression:        zlib   zlib    zlib (no-zstd !)
@@ -363,3 +363,148 @@ test flag processor and skipflags
   checking files
   checked 1 changesets with 1 changes to 1 files
 
+
+  $ cd ..
+
+Checking files in parallel
+
+  $ hg init parallel
+  $ cd parallel
+  $ for i in `$TESTDIR/seq.py 1 30`; do
+  >   echo $i > file$i
+  > done
+  $ hg ci -qAm0
+  $ for i in `$TESTDIR/seq.py 1 30`; do
+  >   echo $i >> file$i
+  > done
+  $ hg cp -q file1 copy1
+  $ hg ci -qAm1
+  $ hg verify --jobs 4
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 2 changesets with 61 changes to 31 files
+
+Issues are reported in the same order as a sequential run
+
+  $ rm .hg/store/data/file2.i
+  $ mv .hg/store/data/file17.i .hg/store/data/xfile17.i
+  $ echo garbage >> .hg/store/data/file29.i
+  $ hg verify --jobs 4 --config worker.enabled=no > sequential.out 2>&1
+  [1]
+  $ hg verify --jobs 4
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+   warning: revlog 'data/file17.i' not in fncache!
+   0: empty or missing file17
+   file17@0: manifest refers to unknown revision 5295d36a233f
+   file17@1: manifest refers to unknown revision 05450c1f8fb3
+   warning: revlog 'data/file2.i' not in fncache!
+   0: empty or missing file2
+   file2@0: manifest refers to unknown revision 5d9299349fc0
+   file2@1: manifest refers to unknown revision a9c84d156735
+   file29@0: broken revlog! (index data/file29.i is corrupted)
+  warning: orphan data file 'data/file29.i'
+  checked 2 changesets with 55 changes to 31 files
+  3 warnings encountered!
+  hint: run "hg debugrebuildfncache" to recover from corrupt fncache
+  7 integrity errors encountered!
+  (first damaged changeset appears to be 0)
+  [1]
+  $ hg verify --jobs 4 > parallel.out 2>&1
+  [1]
+  $ cmp sequential.out parallel.out
+  $ hg verify > default.out 2>&1
+  [1]
+  $ cmp default.out parallel.out
+
+  $ cd ..
+
+Incremental verify
+==================
+
+  $ hg init incremental
+  $ cd incremental
+  $ echo a > a
+  $ echo b > b
+  $ hg ci -qAm0
+  $ hg verify --incremental
+  no previous verify recorded, checking everything
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 1 changesets with 2 changes to 2 files
+
+Only the data added since the last successful verify is checked
+
+  $ echo a >> a
+  $ hg ci -qm1
+  $ hg verify --incremental
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 1 changesets with 1 changes to 1 files
+  $ hg verify --incremental
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 0 changesets with 0 changes to 0 files
+
+Removals and copies of files checked previously are fine
+
+  $ hg cp b c
+  $ hg rm a
+  $ hg ci -qm2
+  $ hg verify --incremental
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 1 changesets with 1 changes to 3 files
+
+Corrupted new data is reported, and stays unverified
+
+  $ echo d > d
+  $ hg ci -qAm3
+  $ cp .hg/store/data/d.i d.i.orig
+  $ "$PYTHON" - <<NOEOF
+  > with open('.hg/store/data/d.i', 'r+b') as fp:
+  >     fp.seek(-2, 2)
+  >     fp.write(b'x')
+  > NOEOF
+  $ hg verify --incremental
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+   d@3: * (glob)
+  checked 1 changesets with 1 changes to 1 files
+  1 integrity errors encountered!
+  (first damaged changeset appears to be 3)
+  [1]
+  $ cp d.i.orig .hg/store/data/d.i
+  $ hg verify --incremental
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 1 changesets with 1 changes to 1 files
+
+Everything is checked again once the repository is rewritten
+
+  $ hg --config extensions.strip= strip --no-backup -q -r 3
+  $ hg verify --incremental
+  repository rewritten since the last verify, checking everything
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  checked 3 changesets with 4 changes to 3 files
+
+  $ cd ..
@@ -165,3 +165,79 @@ Do not crash on partially read result
   done
 
 #endif
+
+Streaming tasks to workers
+
+  $ cat > imap.py <<EOF
+  > from __future__ import absolute_import
+  > import time
+  > from mercurial import (
+  >     error,
+  >     registrar,
+  >     worker,
+  > )
+  > cmdtable = {}
+  > command = registrar.command(cmdtable)
+  > def tasks(ui, n):
+  >     for i in range(n):
+  >         ui.debug(b'producing task %d\n' % i)
+  >         yield i
+  > def square(delay, i):
+  >     if i == 13:
+  >         raise error.Abort(b'unlucky task')
+  >     # make the first tasks the slowest ones
+  >     time.sleep(delay / (i + 1))
+  >     return i * i
+  > @command(b'imap', [
+  >     (b'', b'threaded', False, b'use threads'),
+  >     (b'', b'unordered', False, b'yield results as they come'),
+  >     (b'', b'chunksize', 1, b'tasks sent at once'),
+  > ], b'hg imap N')
+  > def imap(ui, repo, n, **opts):
+  >     results = worker.imap(ui, square, tasks(ui, int(n)),
+  >                           staticargs=(0.1,),
+  >                           ordered=not opts['unordered'],
+  >                           threaded=opts['threaded'] or None,
+  >                           chunksize=opts['chunksize'])
+  >     results = [b'%d' % r for r in results]
+  >     if opts['unordered']:
+  >         results.sort(key=int)
+  >     ui.write(b'%s\n' % b' '.join(results))
+  > EOF
+  $ cat >> $HGRCPATH <<EOF
+  > [extensions]
+  > imap = $TESTTMP/imap.py
+  > [worker]
+  > numcpus = 4
+  > EOF
+
+  $ hg imap 10
+  0 1 4 9 16 25 36 49 64 81
+  $ hg imap 10 --unordered
+  0 1 4 9 16 25 36 49 64 81
+  $ hg imap 10 --chunksize 3
+  0 1 4 9 16 25 36 49 64 81
+  $ hg imap 10 --threaded
+  0 1 4 9 16 25 36 49 64 81
+  $ hg imap 10 --threaded --unordered
+  0 1 4 9 16 25 36 49 64 81
+  $ hg imap 1
+  0
+  $ hg imap 0
+  
+  $ hg imap 10 --config worker.enabled=no
+  0 1 4 9 16 25 36 49 64 81
+
+Errors are reported, and stop the production of tasks, which are produced
+lazily as the workers consume them
+
+  $ hg imap 20
+  abort: unlucky task
+  [255]
+  $ hg imap 100 --threaded --debug | grep 'producing task' | tail -1
+  abort: unlucky task
+  producing task 28
+  $ hg imap 100 --config worker.enabled=no --debug \
+  >   | grep 'producing task' | tail -1
+  abort: unlucky task
+  producing task 13